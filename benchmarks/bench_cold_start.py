@@ -0,0 +1,92 @@
+"""
+Démarrage à froid de chaque application: import du module, puis première requête.
+
+Chaque mesure tourne dans un interpréteur neuf, comme un conteneur qui démarre.
+La première requête vise une page servie sans appel amont (page d'accueil), via
+`httpx.ASGITransport`: elle inclut donc les chargements différés (templates...).
+
+Avec `--budget-ms` (ou COLD_START_BUDGET_MS), le script échoue si une application
+dépasse le budget (import + première requête, médiane des essais): utilisable en CI.
+
+Lancement depuis la racine du dépôt:
+    python -m benchmarks.bench_cold_start
+    python -m benchmarks.bench_cold_start --budget-ms 800
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.bench_gateway_memory import FAKE_ENV, ROOT
+
+RUNS = 5
+# Application -> page d'accueil servie sans appel amont
+APPS = {
+    "tiktok.main": "/",
+    "facebook.main": "/",
+    "insta.main": "/",
+    "zoom.main": "/",
+    "gateway.main": "/",
+}
+
+MEASURE = """
+import asyncio, importlib, json, sys, time
+t0 = time.perf_counter()
+app = importlib.import_module(sys.argv[1]).app
+t1 = time.perf_counter()
+import httpx
+
+async def first_request():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        t2 = time.perf_counter()
+        response = await client.get(sys.argv[2])
+        return response.status_code, time.perf_counter() - t2
+
+status, request_time = asyncio.run(first_request())
+print(json.dumps({"import": t1 - t0, "request": request_time, "status": status}))
+"""
+
+
+def measure(module: str, path: str) -> dict:
+    env = {**os.environ, **FAKE_ENV, "PYTHONPATH": ROOT}
+    runs = []
+    for _ in range(RUNS):
+        output = subprocess.run([sys.executable, "-c", MEASURE, module, path], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {
+        "import": statistics.median(run["import"] for run in runs),
+        "request": statistics.median(run["request"] for run in runs),
+        "total": statistics.median(run["import"] + run["request"] for run in runs),
+        "status": runs[-1]["status"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps de démarrage à froid des applications")
+    parser.add_argument("--budget-ms", type=float, default=os.getenv("COLD_START_BUDGET_MS"),
+                        help="échoue si import + première requête dépasse ce budget")
+    args = parser.parse_args()
+    budget = float(args.budget_ms) / 1000 if args.budget_ms else None
+
+    over_budget = []
+    print(f"{'application':<16}{'import':>10}{'1re requête':>14}{'total':>10}  statut")
+    for module, path in APPS.items():
+        result = measure(module, path)
+        flag = ""
+        if budget is not None and result["total"] > budget:
+            over_budget.append(module)
+            flag = "  [HORS BUDGET]"
+        print(f"{module:<16}{result['import'] * 1000:>8.1f}ms{result['request'] * 1000:>12.1f}ms"
+              f"{result['total'] * 1000:>8.1f}ms  {result['status']}{flag}")
+
+    if over_budget:
+        print(f"Budget de {budget * 1000:.0f} ms dépassé : {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
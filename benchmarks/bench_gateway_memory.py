@@ -0,0 +1,53 @@
+"""
+Mémoire résidente: une application par processus contre la passerelle.
+
+Chaque mesure tourne dans un interpréteur neuf qui importe les applications
+(comme un worker uvicorn au démarrage) puis relève son pic de mémoire résidente.
+La passerelle charge les quatre plateformes dans un seul processus.
+
+Lancement depuis la racine du dépôt:
+    python -m benchmarks.bench_gateway_memory
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_MODULES = ["tiktok.main", "facebook.main", "insta.main", "zoom.main"]
+
+# Valeurs factices: les applications refusent de démarrer sans configuration
+FAKE_ENV = {
+    "GATEWAY_SECRET_KEY": "bench", "APP_SECRET_KEY": "bench", "SECRET_KEY": "bench",
+    "TIKTOK_CLIENT_KEY": "bench", "TIKTOK_CLIENT_SECRET": "bench",
+    "FB_APP_ID": "bench", "FB_APP_SECRET": "bench",
+    "INSTAGRAM_APP_ID": "bench", "INSTAGRAM_APP_SECRET": "bench", "INSTAGRAM_REDIRECT_URI": "http://localhost/cb",
+}
+
+MEASURE = """
+import importlib, resource, sys
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def peak_rss_kb(*modules: str) -> int:
+    env = {**os.environ, **FAKE_ENV, "PYTHONPATH": ROOT}
+    output = subprocess.run([sys.executable, "-c", MEASURE, *modules], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return int(output.split()[-1])
+
+
+def main():
+    separate = {}
+    for module in APP_MODULES:
+        separate[module] = peak_rss_kb(module)
+        print(f"{module + ' seul':<28}: {separate[module] / 1024:6.1f} Mo")
+    total = sum(separate.values())
+    gateway = peak_rss_kb("gateway.main", *APP_MODULES)
+    print(f"{f'{len(APP_MODULES)} processus séparés':<28}: {total / 1024:6.1f} Mo")
+    print(f"{'passerelle (1 processus)':<28}: {gateway / 1024:6.1f} Mo  ({100 * (1 - gateway / total):.0f} % de moins)")
+
+
+if __name__ == "__main__":
+    main()
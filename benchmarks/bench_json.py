@@ -0,0 +1,156 @@
+"""
+Coût CPU et mémoire du passage JSON d'une requête: corps amont -> réponse encodée.
+
+Compare, pour des listes de vidéos TikTok et de médias Instagram de taille
+croissante, l'ancien chemin (`response.json()` en dictionnaires, puis
+`JSONResponse` de Starlette; `jsonable_encoder` en plus pour `/api/media`, qui
+renvoyait un dictionnaire) au nouveau (`common.serialization`: orjson et
+modèles typés à `__slots__`).
+
+- µs/requête: décodage + construction + encodage de la réponse;
+- pic: mémoire maximale allouée pendant la requête (tracemalloc). orjson lit
+  le corps dans un tampon temporaire (une dizaine de fois sa taille), libéré
+  aussitôt: le pic est plus haut qu'avec `json`, sans effet sur la mémoire gardée;
+- gardé: mémoire occupée par la page décodée, tant qu'elle est gardée
+  (rendu du tableau de bord, export NDJSON).
+
+Une page TikTok compte au plus 20 vidéos, une page Instagram au plus 100
+médias; 1000 éléments donnent l'ordre de grandeur pour des listes agrégées.
+
+Lancement depuis la racine du dépôt:
+    python -m benchmarks.bench_json
+"""
+import gc
+import json
+import time
+import tracemalloc
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse as StarletteJSONResponse
+
+from common.serialization import JSONResponse, read_json
+from insta.models import MediaPage
+from tiktok.models import VideoPage, unwrap
+
+LIST_SIZES = [20, 100, 1000]
+# Répétitions par mesure de temps (la meilleure série est gardée)
+TARGET_SECONDS = 0.3
+REPEATS = 5
+
+
+def tiktok_body(count: int) -> bytes:
+    videos = [{"id": str(7 * 10**18 + i), "title": f"Vidéo n°{i} — #tendance #fyp",
+               "cover_image_url": f"https://p16-sign.tiktokcdn.com/obj/cover-{i}.jpeg?x-expires=1700000000&sig=abc",
+               "share_url": f"https://www.tiktok.com/@bench/video/{7 * 10**18 + i}"} for i in range(count)]
+    return json.dumps({"data": {"videos": videos, "cursor": 1700000000000, "has_more": True},
+                       "error": {"code": "ok", "message": "", "log_id": "2024"}}).encode()
+
+
+def instagram_body(count: int) -> bytes:
+    media = [{"id": str(17 * 10**15 + i), "caption": f"Publication {i} ✨ #instagood",
+              "media_type": "VIDEO" if i % 3 == 0 else "IMAGE",
+              "media_url": f"https://scontent.cdninstagram.com/v/t51/{i}.jpg?_nc_cat=1&oh=abc",
+              "permalink": f"https://www.instagram.com/p/C{i:08d}/",
+              "thumbnail_url": f"https://scontent.cdninstagram.com/v/t51/{i}_thumb.jpg" if i % 3 == 0 else None}
+             for i in range(count)]
+    return json.dumps({"data": media, "paging": {"cursors": {"before": "QVFI", "after": "QVFIUm"},
+                                                 "next": "https://graph.instagram.com/v23.0/me/media?after=QVFIUm"}}
+                      ).encode()
+
+
+# --- Anciens chemins (avant common.serialization) ---
+
+def old_tiktok_decode(response: httpx.Response):
+    return response.json().get("data", {})
+
+
+def old_tiktok_encode(data) -> bytes:
+    return StarletteJSONResponse(content=data).body
+
+
+def old_instagram_decode(response: httpx.Response):
+    payload = response.json()
+    paging = payload.get("paging", {})
+    next_cursor = paging.get("cursors", {}).get("after") if paging.get("next") else None
+    return {"data": payload.get("data", []), "next_cursor": next_cursor}
+
+
+def old_instagram_encode(data) -> bytes:
+    # La route renvoyait un dictionnaire: FastAPI le passait par jsonable_encoder
+    return StarletteJSONResponse(content=jsonable_encoder(data)).body
+
+
+# --- Nouveaux chemins ---
+
+def new_tiktok_decode(response: httpx.Response):
+    return VideoPage.from_data(unwrap(response))
+
+
+def new_instagram_decode(response: httpx.Response):
+    return MediaPage.from_payload(read_json(response))
+
+
+def new_encode(data) -> bytes:
+    return JSONResponse(content=data).body
+
+
+VARIANTS = {
+    "tiktok": (tiktok_body, {"avant": (old_tiktok_decode, old_tiktok_encode),
+                             "après": (new_tiktok_decode, new_encode)}),
+    "instagram": (instagram_body, {"avant": (old_instagram_decode, old_instagram_encode),
+                                   "après": (new_instagram_decode, new_encode)}),
+}
+
+
+def handle(body: bytes, decode, encode) -> bytes:
+    return encode(decode(httpx.Response(200, content=body)))
+
+
+def time_per_request(body: bytes, decode, encode) -> float:
+    handle(body, decode, encode)
+    start = time.perf_counter()
+    handle(body, decode, encode)
+    iterations = max(1, int(TARGET_SECONDS / max(time.perf_counter() - start, 1e-6)))
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            handle(body, decode, encode)
+        best = min(best, (time.perf_counter() - start) / iterations)
+    return best * 1e6
+
+
+def memory(body: bytes, decode, encode) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        response = httpx.Response(200, content=body)
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        page = decode(response)
+        kept = tracemalloc.get_traced_memory()[0] - baseline
+        encode(page)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return peak, kept
+
+
+def main():
+    print(f"{'plateforme':<10} {'éléments':>8}  {'chemin':<6} {'µs/requête':>11} {'pic':>10} {'gardé':>10}")
+    for platform, (make_body, paths) in VARIANTS.items():
+        for count in LIST_SIZES:
+            body = make_body(count)
+            outputs = {}
+            for name, (decode, encode) in paths.items():
+                outputs[name] = json.loads(handle(body, decode, encode))
+                elapsed = time_per_request(body, decode, encode)
+                peak, kept = memory(body, decode, encode)
+                print(f"{platform:<10} {count:>8}  {name:<6} {elapsed:>11.1f} {peak / 1024:>8.1f}Ko {kept / 1024:>8.1f}Ko")
+            # Même réponse des deux côtés (les champs hors modèle ne sont pas renvoyés)
+            assert outputs["avant"] == outputs["après"], f"{platform}: réponses différentes"
+
+
+if __name__ == "__main__":
+    main()
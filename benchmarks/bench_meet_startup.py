@@ -0,0 +1,92 @@
+"""
+Temps de démarrage de `meet/create_meet.py`, avant et après le cache du service.
+
+Chaque mesure tourne dans un interpréteur neuf (démarrage à froid), avec un
+`token.json` local encore valide: aucun appel réseau n'est fait.
+- avant: imports Google au chargement, lecture de token.json et `build()`;
+- après: imports différés et service construit depuis le document de découverte local;
+- import seul: ce que paient `--help` et la lecture du fichier d'entrée;
+- appel suivant: service demandé une seconde fois dans le même processus.
+
+Lancement depuis la racine du dépôt:
+    python -m benchmarks.bench_meet_startup
+"""
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RUNS = 7
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BEFORE = """
+import time
+t0 = time.perf_counter()
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+creds = Credentials.from_authorized_user_file('token.json', ['https://www.googleapis.com/auth/calendar'])
+service = build('calendar', 'v3', credentials=creds)
+print(time.perf_counter() - t0, 0.0)
+"""
+
+AFTER = """
+import time
+t0 = time.perf_counter()
+from meet.create_meet import get_calendar_service
+service = get_calendar_service()
+cold = time.perf_counter() - t0
+t1 = time.perf_counter()
+assert get_calendar_service() is service
+print(cold, time.perf_counter() - t1)
+"""
+
+IMPORT_ONLY = """
+import time
+t0 = time.perf_counter()
+import meet.create_meet
+print(time.perf_counter() - t0, 0.0)
+"""
+
+
+def write_token(directory: str):
+    expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    with open(os.path.join(directory, 'token.json'), 'w') as f:
+        json.dump({
+            'token': 'bench', 'refresh_token': 'bench', 'client_id': 'bench', 'client_secret': 'bench',
+            'token_uri': 'https://oauth2.googleapis.com/token',
+            'expiry': expiry.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+        }, f)
+
+
+def measure(code: str, directory: str):
+    env = {**os.environ, 'PYTHONPATH': ROOT}
+    cold, warm = [], []
+    for _ in range(RUNS):
+        output = subprocess.run([sys.executable, '-c', code], cwd=directory, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        first, second = map(float, output.split())
+        cold.append(first)
+        warm.append(second)
+    return statistics.median(cold), statistics.median(warm)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        write_token(directory)
+        before, _ = measure(BEFORE, directory)
+        after, warm = measure(AFTER, directory)
+        import_only, _ = measure(IMPORT_ONLY, directory)
+
+    print(f"avant  (imports + token.json + build)      : {before * 1000:7.1f} ms")
+    print(f"après  (premier appel du processus)        : {after * 1000:7.1f} ms")
+    print(f"après  (import seul: --help, lecture CSV)  : {import_only * 1000:7.1f} ms")
+    print(f"après  (appels suivants, service en cache) : {warm * 1000:7.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
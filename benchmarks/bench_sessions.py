@@ -0,0 +1,89 @@
+"""
+Coût d'une requête selon le stockage de session, quand le nombre de pages grandit.
+
+Compare le `SessionMiddleware` de Starlette (session complète dans le cookie)
+aux sessions côté serveur (mémoire et SQLite). Chaque requête lit la liste des
+pages en session, comme `publish_to_page`.
+
+Lancement depuis la racine du dépôt:
+    python -m benchmarks.bench_sessions
+"""
+import asyncio
+import os
+import secrets
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from starlette.middleware.sessions import SessionMiddleware
+
+from common.sessions import MemorySessionBackend, SQLiteSessionBackend, ServerSideSessionMiddleware
+
+SECRET_KEY = "bench"
+PAGE_COUNTS = [1, 10, 50, 200]
+REQUESTS = 500
+# Les navigateurs ignorent les cookies de plus de ~4 Ko
+BROWSER_COOKIE_LIMIT = 4096
+
+
+def make_pages(count: int):
+    return [
+        {"id": str(10**14 + i), "name": f"Page {i}", "access_token": "EAA" + secrets.token_urlsafe(150)}
+        for i in range(count)
+    ]
+
+
+def make_app(middleware, **options) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(middleware, secret_key=SECRET_KEY, **options)
+
+    @app.get("/login")
+    async def login(request: Request):
+        request.session["pages"] = request.app.state.pages
+        return {"ok": True}
+
+    @app.get("/")
+    async def index(request: Request):
+        return {"pages": len(request.session.get("pages", []))}
+
+    return app
+
+
+async def measure(app: FastAPI, pages) -> tuple:
+    app.state.pages = pages
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.get("/login")
+        cookie = response.headers["set-cookie"].split(";", 1)[0]
+        headers = {"cookie": cookie}
+
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            response = await client.get("/", headers=headers)
+            assert response.json()["pages"] == len(pages)
+        elapsed = time.perf_counter() - start
+    return len(cookie), elapsed / REQUESTS * 1e6
+
+
+async def main():
+    db_dir = tempfile.mkdtemp()
+    variants = {
+        "cookie (Starlette)": lambda: make_app(SessionMiddleware),
+        "serveur (mémoire)": lambda: make_app(ServerSideSessionMiddleware, backend=MemorySessionBackend()),
+        "serveur (SQLite)": lambda: make_app(
+            ServerSideSessionMiddleware, backend=SQLiteSessionBackend(os.path.join(db_dir, "sessions.db"))
+        ),
+    }
+
+    print(f"{'pages':>5}  {'stockage':<20} {'cookie':>10} {'µs/requête':>11}")
+    for count in PAGE_COUNTS:
+        pages = make_pages(count)
+        for name, factory in variants.items():
+            cookie_size, per_request = await measure(factory(), pages)
+            warning = "  > limite navigateur" if cookie_size > BROWSER_COOKIE_LIMIT else ""
+            print(f"{count:>5}  {name:<20} {cookie_size:>8} o {per_request:>11.0f}{warning}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
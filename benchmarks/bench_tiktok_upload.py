@@ -0,0 +1,106 @@
+"""
+Vérifie que l'upload TikTok par morceaux garde une mémoire plate.
+
+Un faux endpoint d'upload local reçoit les PUT `Content-Range`; on mesure le pic
+d'allocation Python (tracemalloc) pour des vidéos de tailles croissantes.
+
+Lancement depuis la racine du dépôt:
+    python -m benchmarks.bench_tiktok_upload
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("TIKTOK_CLIENT_KEY", "bench")
+os.environ.setdefault("TIKTOK_CLIENT_SECRET", "bench")
+os.environ.setdefault("APP_SECRET_KEY", "bench")
+
+from starlette.datastructures import Headers, UploadFile  # noqa: E402
+
+from common import http_client  # noqa: E402
+from tiktok.main import MIN_UPLOAD_CHUNK_SIZE, compute_upload_chunks, upload_video_chunks  # noqa: E402
+
+MB = 1024 * 1024
+CHUNK_SIZE = MIN_UPLOAD_CHUNK_SIZE
+VIDEO_SIZES = [20 * MB, 80 * MB, 200 * MB]
+# Tolérance: le dernier morceau peut contenir jusqu'à (2 * chunk_size - 1) octets
+MAX_PEAK = 2 * CHUNK_SIZE + 2 * MB
+
+
+class FakeUploadHandler(BaseHTTPRequestHandler):
+    """Faux endpoint d'upload: lit le corps par blocs et vérifie Content-Range."""
+
+    received = []
+
+    def do_PUT(self):
+        length = int(self.headers["Content-Length"])
+        remaining = length
+        while remaining:
+            block = self.rfile.read(min(remaining, 64 * 1024))
+            if not block:
+                break
+            remaining -= len(block)
+        self.received.append((self.headers["Content-Range"], length - remaining))
+        self.send_response(201 if remaining == 0 else 400)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def make_upload(size: int) -> UploadFile:
+    """Crée un UploadFile sur disque, comme celui que produit le parseur multipart."""
+    spooled = tempfile.SpooledTemporaryFile(max_size=1 * MB)
+    block = os.urandom(MB)
+    for _ in range(size // MB):
+        spooled.write(block)
+    spooled.seek(0)
+    return UploadFile(spooled, size=size, filename="bench.mp4",
+                      headers=Headers({"content-type": "video/mp4"}))
+
+
+async def measure(upload_url: str, size: int) -> int:
+    video = make_upload(size)
+    chunk_size, total_chunk_count = compute_upload_chunks(size, CHUNK_SIZE)
+    FakeUploadHandler.received.clear()
+
+    tracemalloc.start()
+    await upload_video_chunks(upload_url, video, size, chunk_size, total_chunk_count)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await video.close()
+    await http_client.aclose()
+
+    assert len(FakeUploadHandler.received) == total_chunk_count
+    assert sum(length for _, length in FakeUploadHandler.received) == size
+    assert FakeUploadHandler.received[-1][0].endswith(f"-{size - 1}/{size}")
+    return peak
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeUploadHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    upload_url = f"http://127.0.0.1:{server.server_port}/upload"
+
+    ok = True
+    try:
+        for size in VIDEO_SIZES:
+            peak = asyncio.run(measure(upload_url, size))
+            status = "OK" if peak <= MAX_PEAK else "ÉCHEC"
+            ok = ok and peak <= MAX_PEAK
+            print(f"vidéo {size // MB:4d} Mo -> pic mémoire {peak / MB:6.1f} Mo  [{status}]")
+    finally:
+        server.shutdown()
+
+    if not ok:
+        print(f"Le pic mémoire dépasse {MAX_PEAK / MB:.1f} Mo.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Vérifie le cache du jeton Zoom Server-to-Server.
+
+Un faux endpoint `/oauth/token` local compte les demandes de jeton et répond
+avec une latence fixe. On vérifie que 100 appelants simultanés (threads puis
+coroutines) ne déclenchent qu'une demande, que le jeton est réutilisé, puis
+renouvelé une fois entré dans la marge d'expiration.
+
+Lancement depuis la racine du dépôt:
+    python -m benchmarks.bench_zoom_token
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import http_client
+from zoom.app import AccountToken
+
+CALLERS = 100
+TOKEN_LATENCY = 0.2
+EXPIRES_IN = 3600
+
+
+class FakeTokenHandler(BaseHTTPRequestHandler):
+    """Faux endpoint de jeton Zoom: chaque demande renvoie un jeton numéroté."""
+
+    issued = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            FakeTokenHandler.issued += 1
+            number = FakeTokenHandler.issued
+        time.sleep(TOKEN_LATENCY)
+        body = json.dumps({"access_token": f"token-{number}", "token_type": "bearer",
+                           "expires_in": EXPIRES_IN}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def check(label: str, ok: bool, detail: str) -> bool:
+    print(f"{label:<45} {detail:<30} [{'OK' if ok else 'ÉCHEC'}]")
+    return ok
+
+
+def run_threads(token: AccountToken) -> set:
+    with ThreadPoolExecutor(max_workers=CALLERS) as pool:
+        return set(pool.map(lambda _: token.get(), range(CALLERS)))
+
+
+async def run_coroutines(token: AccountToken) -> set:
+    try:
+        return set(await asyncio.gather(*(token.aget() for _ in range(CALLERS))))
+    finally:
+        await http_client.aclose()
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTokenHandler)
+    server.request_queue_size = CALLERS
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    token = AccountToken("account", "client", "secret",
+                         token_url=f"http://127.0.0.1:{server.server_port}/oauth/token")
+
+    ok = True
+    try:
+        started = time.perf_counter()
+        tokens = run_threads(token)
+        elapsed = time.perf_counter() - started
+        ok &= check(f"{CALLERS} threads simultanés", FakeTokenHandler.issued == 1 and tokens == {"token-1"},
+                    f"{FakeTokenHandler.issued} demande(s), {elapsed:.2f} s")
+
+        for _ in range(CALLERS):
+            token.get()
+        ok &= check("appels suivants (jeton en cache)", FakeTokenHandler.issued == 1,
+                    f"{FakeTokenHandler.issued} demande(s)")
+
+        # Le jeton entre dans la marge d'expiration: un seul renouvellement
+        token._expires_at = time.time() + token.margin - 1
+        tokens = asyncio.run(run_coroutines(token))
+        ok &= check(f"{CALLERS} coroutines, jeton à renouveler", FakeTokenHandler.issued == 2 and tokens == {"token-2"},
+                    f"{FakeTokenHandler.issued} demande(s)")
+
+        # 401 côté API: tous les appelants signalent le même jeton refusé en même temps
+        with ThreadPoolExecutor(max_workers=CALLERS) as pool:
+            tokens = set(pool.map(lambda _: token.get(rejected="token-2"), range(CALLERS)))
+        ok &= check(f"{CALLERS} appelants, jeton refusé (401)", FakeTokenHandler.issued == 3 and tokens == {"token-3"},
+                    f"{FakeTokenHandler.issued} demande(s)")
+    finally:
+        server.shutdown()
+        asyncio.run(http_client.aclose())
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
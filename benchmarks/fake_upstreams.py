@@ -0,0 +1,214 @@
+"""
+Faux serveurs amont pour les bancs de charge: TikTok, Graph (Facebook), Instagram et Zoom.
+
+Une seule application sert les endpoints appelés par nos modules; les hôtes
+réels y sont redirigés avec UPSTREAM_OVERRIDES (voir `common.http_client`).
+Chaque réponse attend `latency_ms`, et une fraction `error_rate` des appels
+de données répond `error_status` (500 par défaut; 503 est retenté par
+`common.resilience`). Les endpoints OAuth ne sont jamais en erreur, pour que
+la connexion des scénarios reste fiable.
+
+Lancement autonome depuis la racine du dépôt:
+    python -m benchmarks.fake_upstreams --port 9000 --latency-ms 50 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# Hôtes réels redirigés vers le faux serveur
+UPSTREAM_HOSTS = [
+    "https://open.tiktokapis.com",
+    "https://graph.facebook.com",
+    "https://graph-video.facebook.com",
+    "https://api.instagram.com",
+    "https://graph.instagram.com",
+    "https://zoom.us",
+    "https://api.zoom.us",
+]
+# Endpoints OAuth: latence simulée mais jamais d'erreur
+AUTH_PATHS = {"/v2/oauth/token/", "/oauth/access_token", "/access_token", "/oauth/token", "/v23.0/oauth/access_token"}
+
+TIKTOK_OK = {"code": "ok", "message": ""}
+
+
+def upstream_overrides(origin: str) -> str:
+    """Valeur de UPSTREAM_OVERRIDES qui envoie tous les hôtes vers `origin`."""
+    return ",".join(f"{host}={origin}" for host in UPSTREAM_HOSTS)
+
+
+class FaultInjection:
+    """Middleware ASGI: latence fixe et erreurs aléatoires."""
+
+    def __init__(self, app, latency_ms: float, error_rate: float, error_status: int = 500):
+        self.app = app
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if scope["path"] not in AUTH_PATHS and random.random() < self.error_rate:
+            response = JSONResponse(status_code=self.error_status, content={"error": {"code": "internal_error",
+                                                                        "message": "Erreur simulée"}})
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+def create_app(latency_ms: float = 50, error_rate: float = 0.0, error_status: int = 500) -> FastAPI:
+    app = FastAPI()
+    ids = itertools.count(1)
+
+    # --- TikTok ---
+
+    @app.post("/v2/oauth/token/")
+    async def tiktok_token():
+        return {"access_token": "tiktok-token", "expires_in": 86400, "open_id": "open-id",
+                "refresh_token": "tiktok-refresh", "refresh_expires_in": 31536000,
+                "scope": "user.info.basic,video.list,video.publish", "token_type": "Bearer"}
+
+    @app.get("/v2/user/info/")
+    async def tiktok_user():
+        return {"data": {"user": {"open_id": "open-id", "display_name": "Bench", "username": "bench",
+                                  "avatar_url": "https://example.com/a.jpg"}}, "error": TIKTOK_OK}
+
+    @app.post("/v2/video/list/")
+    async def tiktok_videos(request: Request):
+        body = await request.json()
+        cursor = int(body.get("cursor") or 0)
+        count = int(body.get("max_count") or 10)
+        videos = [{"id": str(cursor + i), "title": f"Vidéo {cursor + i}",
+                   "cover_image_url": "https://example.com/c.jpg", "share_url": "https://example.com/v"}
+                  for i in range(count)]
+        return {"data": {"videos": videos, "cursor": cursor + count, "has_more": False}, "error": TIKTOK_OK}
+
+    @app.post("/v2/post/publish/video/init/")
+    async def tiktok_publish_init(request: Request):
+        publish_id = next(ids)
+        # L'en-tête Host est celui de l'hôte réel: l'URL d'upload vise l'adresse locale du faux serveur
+        host, port = request.scope["server"]
+        return {"data": {"publish_id": f"p_{publish_id}", "upload_url": f"http://{host}:{port}/upload/{publish_id}"},
+                "error": TIKTOK_OK}
+
+    @app.post("/v2/post/publish/status/fetch/")
+    async def tiktok_publish_status():
+        return {"data": {"status": "PUBLISH_COMPLETE"}, "error": TIKTOK_OK}
+
+    @app.put("/upload/{upload_id}")
+    async def tiktok_upload(request: Request):
+        async for _ in request.stream():
+            pass
+        return Response(status_code=201)
+
+    # --- Zoom ---
+
+    @app.post("/oauth/token")
+    async def zoom_token():
+        return {"access_token": "zoom-token", "refresh_token": "zoom-refresh", "expires_in": 3600,
+                "token_type": "bearer"}
+
+    @app.get("/v2/users/me")
+    async def zoom_me():
+        return {"id": "zoom-user", "first_name": "Bench", "last_name": "Mark", "email": "bench@example.com",
+                "type": 1, "pmi": 1234567890, "timezone": "Europe/Paris"}
+
+    # --- Instagram ---
+
+    @app.post("/oauth/access_token")
+    async def instagram_short_token():
+        return {"access_token": "ig-short", "user_id": 1}
+
+    @app.get("/access_token")
+    async def instagram_long_token():
+        return {"access_token": "ig-long", "token_type": "bearer", "expires_in": 5184000}
+
+    @app.get("/me")
+    async def instagram_me():
+        return {"id": "ig-user", "user_id": "17841400000000000", "username": "bench"}
+
+    @app.get("/me/media")
+    async def instagram_media(limit: int = 24):
+        media = [{"id": str(i), "caption": f"Publication {i}", "media_type": "IMAGE",
+                  "media_url": "https://example.com/m.jpg", "permalink": "https://example.com/p"}
+                 for i in range(limit)]
+        return {"data": media, "paging": {"cursors": {"before": "b", "after": "a"},
+                                          "next": "https://graph.instagram.com/me/media?after=a"}}
+
+    # --- Graph (Facebook) ---
+
+    def graph_object(path: str, method: str = "GET") -> dict:
+        path, _, query = path.partition("?")
+        path = path.strip("/")
+        if path == "debug_token":
+            # Jetons de page factices "page-token-N" (voir me/accounts); "invalid..." est refusé
+            token = parse_qs(query).get("input_token", [""])[0]
+            if token.startswith("invalid"):
+                return {"data": {"is_valid": False, "error": {"code": 190, "message": "Invalid OAuth access token."}}}
+            return {"data": {"is_valid": True, "type": "PAGE", "app_id": "app-id", "expires_at": 0,
+                             "data_access_expires_at": 1900000000, "profile_id": token.replace("-token", ""),
+                             "scopes": ["pages_show_list", "pages_manage_posts"]}}
+        if path == "me":
+            return {"id": "fb-user", "name": "Bench", "picture": {"data": {"url": "https://example.com/p.jpg"}}}
+        if path == "me/accounts":
+            return {"data": [{"id": f"page-{i}", "name": f"Page {i}", "access_token": f"page-token-{i}"}
+                             for i in range(3)]}
+        if method == "POST" and path.endswith("/subscribed_apps"):
+            # Abonnement aux webhooks (pages Facebook et comptes Instagram)
+            return {"success": True}
+        if method == "POST" and path.endswith(("/feed", "/photos", "/videos")):
+            return {"id": f"{path.split('/')[0]}_{next(ids)}"}
+        return {"id": path}
+
+    @app.get("/v23.0/oauth/access_token")
+    async def graph_token():
+        return {"access_token": "fb-long", "token_type": "bearer", "expires_in": 5184000}
+
+    # Toutes versions: facebook/last.py utilise une version plus ancienne que common.graph
+    @app.post("/{version}/")
+    async def graph_batch(request: Request):
+        form = await request.form()
+        return [{"code": 200, "body": json.dumps(graph_object(item["relative_url"], item.get("method", "GET")))}
+                for item in json.loads(form["batch"])]
+
+    @app.post("/v23.0/{path:path}")
+    async def graph_post(path: str, request: Request):
+        form = await request.form()
+        return graph_object(path, form.get("method", "POST"))
+
+    # Application de diagnostic (facebook/last.py): jeton d'application et lecture d'une page
+    @app.get("/oauth/access_token")
+    async def graph_app_token():
+        return {"access_token": "app-id|app-token", "token_type": "bearer"}
+
+    @app.get("/{version}/{object_id}")
+    async def graph_read(version: str, object_id: str):
+        return {"id": object_id, "name": f"Page {object_id}", "category": "Bench"}
+
+    return FaultInjection(app, latency_ms, error_rate, error_status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Faux serveurs amont pour les bancs de charge")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(args.latency_ms, args.error_rate, args.error_status), host="127.0.0.1", port=args.port,
+                log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Banc de charge des routes de chaque application, contre de faux serveurs amont.
+
+Lance les faux serveurs (`benchmarks.fake_upstreams`) et chaque application sous
+uvicorn dans des processus séparés, avec UPSTREAM_OVERRIDES pour que tous les
+appels sortants aillent vers les faux serveurs. Chaque application est connectée
+par son vrai parcours OAuth (une session par utilisateur virtuel), puis chaque
+route est appelée `--requests` fois par `--concurrency` utilisateurs simultanés.
+Le rapport donne req/s, p50/p95/p99 et le taux d'erreur par route.
+
+`--json` enregistre les résultats; `--baseline` compare à un enregistrement
+précédent (écart de req/s et de p95).
+
+Lancement depuis la racine du dépôt:
+    python -m benchmarks.load_test --latency-ms 50 --concurrency 50 --json base.json
+    python -m benchmarks.load_test --baseline base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+from benchmarks.bench_gateway_memory import FAKE_ENV, ROOT
+from benchmarks.fake_upstreams import upstream_overrides
+
+APPS = {
+    "tiktok": "tiktok.main:app",
+    "facebook": "facebook.main:app",
+    "instagram": "insta.main:app",
+    "zoom": "zoom.main:app",
+}
+VIDEO_BYTES = os.urandom(256 * 1024)
+
+
+@dataclass
+class Scenario:
+    app: str
+    method: str
+    path: str
+    # Arguments de la requête (données de formulaire, fichiers...), recréés à chaque appel
+    request_kwargs: Callable[[], dict] = dict
+    # Statuts comptés comme succès (une redirection vers l'accueil est souvent une déconnexion)
+    ok_statuses: FrozenSet[int] = frozenset({200})
+
+    @property
+    def name(self) -> str:
+        return f"{self.app} {self.method} {self.path}"
+
+
+SCENARIOS = [
+    Scenario("tiktok", "GET", "/api/user"),
+    Scenario("tiktok", "GET", "/api/videos"),
+    Scenario("tiktok", "POST", "/api/publish",
+             lambda: {"files": {"video": ("bench.mp4", VIDEO_BYTES, "video/mp4")}}, frozenset({202})),
+    Scenario("facebook", "GET", "/"),
+    Scenario("facebook", "POST", "/publish",
+             lambda: {"data": {"page_id": "page-0", "post_type": "text", "message_content": "Bench"}},
+             frozenset({303})),
+    Scenario("instagram", "GET", "/dashboard"),
+    Scenario("instagram", "GET", "/api/media"),
+    Scenario("zoom", "GET", "/profile"),
+]
+
+
+@dataclass
+class Result:
+    requests: int
+    errors: int
+    elapsed: float
+    latencies: List[float] = field(repr=False)
+
+    def summary(self) -> dict:
+        quantiles = statistics.quantiles(self.latencies, n=100) if len(self.latencies) > 1 else [0.0] * 99
+        return {
+            "rps": self.requests / self.elapsed,
+            "p50": quantiles[49] * 1000,
+            "p95": quantiles[94] * 1000,
+            "p99": quantiles[98] * 1000,
+            "error_rate": self.errors / self.requests,
+        }
+
+
+# --- Processus ---
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_process(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=ROOT, env={**os.environ, **env, "PYTHONPATH": ROOT})
+
+
+def wait_until_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(base_url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{base_url} ne répond pas")
+
+
+# --- Connexion (parcours OAuth réel, code factice) ---
+
+async def login(app: str, client: httpx.AsyncClient):
+    if app == "tiktok":
+        location = (await client.get("/login")).headers["location"]
+        state = parse_qs(urlsplit(location).query)["state"][0]
+        response = await client.get("/tiktok/callback", params={"code": "bench", "state": state})
+    elif app == "facebook":
+        response = await client.get("/auth/facebook/callback", params={"code": "bench"})
+        # La page d'accueil met les pages (et leurs jetons) en session
+        await client.get("/")
+    elif app == "instagram":
+        response = await client.get("/auth/instagram/callback", params={"code": "bench"})
+    else:
+        response = await client.get("/oauth/callback", params={"code": "bench"})
+    if response.status_code >= 400:
+        raise RuntimeError(f"Connexion {app} impossible : {response.status_code} {response.text[:200]}")
+
+
+async def run_scenario(base_url: str, scenario: Scenario, total: int, concurrency: int) -> Result:
+    """
+    `concurrency` utilisateurs virtuels, chacun avec sa session, se partagent `total`
+    requêtes. Après un échec, l'utilisateur se reconnecte: certaines routes
+    vident la session quand l'amont est en erreur.
+    """
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+    start = asyncio.Event()
+    logged_in = 0
+
+    async def virtual_user():
+        nonlocal errors, remaining, logged_in
+        async with httpx.AsyncClient(base_url=base_url, timeout=60.0) as client:
+            await login(scenario.app, client)
+            logged_in += 1
+            if logged_in == concurrency:
+                start.set()
+            await start.wait()
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    response = await client.request(scenario.method, scenario.path, **scenario.request_kwargs())
+                    await response.aread()
+                    ok = response.status_code in scenario.ok_statuses
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    errors += 1
+                    await login(scenario.app, client)
+
+    users = [asyncio.ensure_future(virtual_user()) for _ in range(concurrency)]
+    await start.wait()
+    started = time.perf_counter()
+    await asyncio.gather(*users)
+    return Result(total, errors, time.perf_counter() - started, latencies)
+
+
+async def drive(base_urls: Dict[str, str], scenarios: List[Scenario], total: int, concurrency: int) -> Dict[str, dict]:
+    results = {}
+    for scenario in scenarios:
+        # Échauffement: pools de connexions et chargements différés
+        await run_scenario(base_urls[scenario.app], scenario, concurrency, concurrency)
+        results[scenario.name] = (await run_scenario(base_urls[scenario.app], scenario, total, concurrency)).summary()
+    return results
+
+
+def report(results: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None):
+    header = f"{'route':<32}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'erreurs':>9}"
+    if baseline:
+        header += f"{'Δ req/s':>10}{'Δ p95':>9}"
+    print(header)
+    for name, summary in results.items():
+        line = (f"{name:<32}{summary['rps']:>9.1f}{summary['p50']:>7.1f}ms{summary['p95']:>7.1f}ms"
+                f"{summary['p99']:>7.1f}ms{summary['error_rate'] * 100:>8.1f}%")
+        reference = (baseline or {}).get(name)
+        if reference:
+            line += (f"{100 * (summary['rps'] / reference['rps'] - 1):>+9.0f}%"
+                     f"{100 * (summary['p95'] / reference['p95'] - 1):>+8.0f}%")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de charge contre de faux serveurs amont")
+    parser.add_argument("--latency-ms", type=float, default=50, help="latence des faux serveurs")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="part d'appels amont en erreur")
+    parser.add_argument("--error-status", type=int, default=500,
+                        help="statut des erreurs amont (503: temporaire, retenté pour les lectures)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500, help="requêtes par route")
+    parser.add_argument("--only", help="applications à tester, ex: tiktok,zoom")
+    parser.add_argument("--json", help="enregistre les résultats dans ce fichier")
+    parser.add_argument("--baseline", help="compare à un fichier produit par --json")
+    args = parser.parse_args()
+
+    apps = args.only.split(",") if args.only else list(APPS)
+    scenarios = [scenario for scenario in SCENARIOS if scenario.app in apps]
+
+    upstream_port = free_port()
+    upstream_origin = f"http://127.0.0.1:{upstream_port}"
+    processes = [start_process(["-m", "benchmarks.fake_upstreams", "--port", str(upstream_port),
+                                "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate),
+                                "--error-status", str(args.error_status)], {})]
+    base_urls = {}
+    try:
+        # File de publication TikTok assez grande pour mesurer la mise en file, pas le refus (503)
+        env = {**FAKE_ENV, "UPSTREAM_OVERRIDES": upstream_overrides(upstream_origin),
+               "TIKTOK_PUBLISH_QUEUE_SIZE": "100000"}
+        for app in apps:
+            port = free_port()
+            base_urls[app] = f"http://127.0.0.1:{port}"
+            processes.append(start_process(["-m", "uvicorn", APPS[app], "--port", str(port),
+                                            "--log-level", "warning"], env))
+        wait_until_ready(upstream_origin)
+        for base_url in base_urls.values():
+            wait_until_ready(base_url)
+
+        print(f"Amont simulé: {args.latency_ms:.0f} ms, {args.error_rate * 100:.1f} % d'erreurs {args.error_status}; "
+              f"{args.requests} requêtes par route, {args.concurrency} simultanées\n")
+        results = asyncio.run(drive(base_urls, scenarios, args.requests, args.concurrency))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Briques partagées par les applications de chaque plateforme."""
@@ -0,0 +1,115 @@
+"""
+Petit client pour l'API Graph de Facebook.
+
+Le jeton est envoyé dans le corps des requêtes POST (jamais dans l'URL) et
+plusieurs sous-requêtes peuvent être regroupées dans un seul appel
+`POST /?batch=`: une page qui a besoin de `/me` et `/me/accounts` ne paie
+alors qu'un aller-retour.
+"""
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+
+from common import http_client
+from common.serialization import loads, read_json
+
+GRAPH_URL = "https://graph.facebook.com"
+API_VERSION = "v23.0"
+# Limite imposée par Graph sur le nombre de sous-requêtes par appel batch
+MAX_BATCH_SIZE = 50
+
+
+class GraphError(Exception):
+    """Erreur renvoyée par l'API Graph (appel simple ou élément d'un batch)."""
+
+    def __init__(self, message: str, code: Optional[int] = None, status: Optional[int] = None,
+                 payload: Any = None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.payload = payload
+
+    @classmethod
+    def from_payload(cls, payload: Any, status: Optional[int] = None) -> "GraphError":
+        error = payload.get("error", {}) if isinstance(payload, dict) else {}
+        message = error.get("message") or f"Réponse Graph invalide (HTTP {status})"
+        return cls(message, code=error.get("code"), status=status, payload=payload)
+
+
+def graph_request(method: str, relative_url: str, body: Optional[Dict[str, Any]] = None,
+                  name: Optional[str] = None) -> Dict[str, Any]:
+    """Construit une sous-requête de batch, ex: graph_request("GET", "me?fields=name")."""
+    item = {"method": method.upper(), "relative_url": relative_url.lstrip("/")}
+    if body:
+        item["body"] = urlencode(body)
+    if name:
+        item["name"] = name
+    return item
+
+
+def parse_batch_response(items: List[Optional[Dict[str, Any]]]) -> List[Any]:
+    """
+    Découpe la réponse d'un batch: un corps JSON décodé par sous-requête,
+    ou une GraphError pour celles qui ont échoué (ou expiré côté Graph).
+    """
+    results = []
+    for item in items:
+        if item is None:
+            results.append(GraphError("Sous-requête non exécutée (délai dépassé côté Graph)."))
+            continue
+        try:
+            body = loads(item.get("body") or "null")
+        except ValueError:
+            body = item.get("body")
+        status = item.get("code")
+        if status == 200:
+            results.append(body)
+        else:
+            results.append(GraphError.from_payload(body, status=status))
+    return results
+
+
+class GraphClient:
+    """Client Graph lié à un jeton d'accès, basé sur les pools de `http_client`."""
+
+    def __init__(self, access_token: str, api_version: str = API_VERSION, base_url: str = GRAPH_URL):
+        self.access_token = access_token
+        self.url = f"{base_url}/{api_version}"
+
+    async def _send(self, method: str, path: str, data: Dict[str, Any], idempotent: bool = False) -> Any:
+        # Le jeton voyage dans le corps: l'extension le signale au limiteur de quotas.
+        # `idempotent` autorise les nouveaux essais d'un POST qui n'est qu'une lecture.
+        response = await http_client.request(method, f"{self.url}/{path.lstrip('/')}", data=data,
+                                             extensions={"graph_token": self.access_token, "idempotent": idempotent})
+        try:
+            payload = read_json(response)
+        except ValueError:
+            payload = response.text
+        if response.status_code != 200 or isinstance(payload, dict) and "error" in payload:
+            raise GraphError.from_payload(payload, status=response.status_code)
+        return payload
+
+    async def get(self, path: str, **params) -> Any:
+        """GET via la surcharge `method=GET`, pour garder le jeton hors de l'URL."""
+        return await self._send("POST", path, {**params, "method": "GET", "access_token": self.access_token},
+                                idempotent=True)
+
+    async def post(self, path: str, data: Optional[Dict[str, Any]] = None) -> Any:
+        return await self._send("POST", path, {**(data or {}), "access_token": self.access_token})
+
+    async def batch(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Exécute les sous-requêtes en un minimum d'allers-retours (50 par appel,
+        les appels étant lancés en parallèle) et renvoie les résultats dans l'ordre.
+        """
+        groups = [requests[i:i + MAX_BATCH_SIZE] for i in range(0, len(requests), MAX_BATCH_SIZE)]
+        responses = await asyncio.gather(*(
+            self._send("POST", "", {
+                "access_token": self.access_token,
+                "batch": json.dumps(group),
+                "include_headers": "false",
+            }, idempotent=all(item["method"] == "GET" for item in group))
+            for group in groups
+        ))
+        return [result for items in responses for result in parse_batch_response(items)]
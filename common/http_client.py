@@ -0,0 +1,386 @@
+"""
+Couche HTTP sortante partagée par les applications FastAPI.
+
+Un client `httpx.AsyncClient` est créé par hôte amont (TikTok, Instagram, Zoom...)
+et réutilisé pendant toute la vie de l'application: les connexions restent
+ouvertes (keep-alive) et HTTP/2 est négocié quand l'hôte le propose.
+Les appels ne bloquent jamais la boucle d'événements.
+
+Le code synchrone (application Flask, uploads longs exécutés dans un thread)
+dispose de pools équivalents via `get_sync_client()`.
+
+Chaque appel passe par un transport mesuré: durée, statut et octets par hôte et
+endpoint sont enregistrés dans `common.metrics`. Les appels Graph et Instagram
+passent aussi par le limiteur de `common.throttle`, qui les espace avant que les
+quotas ne soient atteints. Enfin, `common.resilience` retente les échecs
+temporaires et coupe les appels vers un hôte indisponible (disjoncteur).
+"""
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+from urllib.parse import urlsplit
+
+import httpx
+
+from common import metrics, resilience
+from common.serialization import read_json
+from common.throttle import THROTTLED_HOSTS, graph_throttler, request_token
+
+# HTTP/2 est optionnel: il nécessite le paquet `h2` (httpx[http2]).
+# On vérifie sa présence sans l'importer: httpx le charge au premier client HTTP/2.
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Délais par opération (connexion, lecture, écriture); `pool` borne l'attente d'une
+# connexion libre: un hôte lent ne retient pas indéfiniment les requêtes entrantes
+DEFAULT_TIMEOUT = httpx.Timeout(
+    float(os.getenv("UPSTREAM_TIMEOUT", 20.0)),
+    connect=float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 5.0)),
+    pool=float(os.getenv("UPSTREAM_POOL_TIMEOUT", 5.0)),
+)
+DEFAULT_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+
+# Un pool de connexions par origine (schéma, hôte, port)
+_clients: Dict[str, httpx.AsyncClient] = {}
+_sync_clients: Dict[str, httpx.Client] = {}
+_sync_lock = threading.Lock()
+
+# Redirection d'hôtes amont vers d'autres origines, ex: faux serveurs locaux des bancs de charge
+# UPSTREAM_OVERRIDES="https://graph.facebook.com=http://127.0.0.1:9000,https://api.zoom.us=http://127.0.0.1:9000"
+UPSTREAM_OVERRIDES: Dict[str, str] = dict(
+    item.strip().split("=", 1) for item in os.getenv("UPSTREAM_OVERRIDES", "").split(",") if "=" in item
+)
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(str(url))
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _redirect(request: httpx.Request, target: str):
+    parts = urlsplit(target)
+    request.url = request.url.copy_with(scheme=parts.scheme, host=parts.hostname, port=parts.port)
+
+
+class _OverrideTransport(httpx.AsyncHTTPTransport):
+    """Transport qui envoie les requêtes d'un hôte vers l'origine de remplacement."""
+
+    def __init__(self, target: str, **kwargs):
+        super().__init__(**kwargs)
+        self.target = target
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        _redirect(request, self.target)
+        return await super().handle_async_request(request)
+
+
+class _SyncOverrideTransport(httpx.HTTPTransport):
+    def __init__(self, target: str, **kwargs):
+        super().__init__(**kwargs)
+        self.target = target
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        _redirect(request, self.target)
+        return super().handle_request(request)
+
+
+# --- Mesure des appels sortants ---
+
+class _Measurement:
+    """Un appel sortant, enregistré une fois sa réponse entièrement lue (ou en échec)."""
+
+    def __init__(self, request: httpx.Request):
+        # Hôte d'origine: la mesure précède une éventuelle redirection (UPSTREAM_OVERRIDES)
+        self.host = request.url.host
+        self.method = request.method
+        self.path = request.url.path
+        self.sent = int(request.headers.get("content-length") or 0)
+        self.received = 0
+        self.started = time.perf_counter()
+        self.recorded = False
+
+    def record(self, status: str):
+        if not self.recorded:
+            self.recorded = True
+            metrics.record_outbound(self.host, self.method, self.path, status,
+                                    time.perf_counter() - self.started, self.sent, self.received)
+
+
+class _MeasuredStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, measurement: _Measurement, status: int):
+        self.stream = stream
+        self.measurement = measurement
+        self.status = str(status)
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.measurement.received += len(chunk)
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.measurement.record(self.status)
+
+
+class _SyncMeasuredStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, measurement: _Measurement, status: int):
+        self.stream = stream
+        self.measurement = measurement
+        self.status = str(status)
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.measurement.received += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.measurement.record(self.status)
+
+
+class _MeasuredTransport(httpx.AsyncBaseTransport):
+    """Enveloppe un transport et mesure chaque appel jusqu'au dernier octet de la réponse."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        measurement = _Measurement(request)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            measurement.record("error")
+            raise
+        response.stream = _MeasuredStream(response.stream, measurement, response.status_code)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class _SyncMeasuredTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        measurement = _Measurement(request)
+        try:
+            response = self.transport.handle_request(request)
+        except Exception:
+            measurement.record("error")
+            raise
+        response.stream = _SyncMeasuredStream(response.stream, measurement, response.status_code)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+# --- Limitation des appels Graph ---
+
+class _ThrottledTransport(httpx.AsyncBaseTransport):
+    """Attend le créneau accordé par le limiteur, puis lui transmet les en-têtes d'usage de la réponse."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, app: str):
+        self.transport = transport
+        self.app = app
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        token = request_token(request)
+        delay = graph_throttler.acquire_delay(self.app, token)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        response = await self.transport.handle_async_request(request)
+        graph_throttler.update(self.app, token, response.headers)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class _SyncThrottledTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport, app: str):
+        self.transport = transport
+        self.app = app
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        token = request_token(request)
+        delay = graph_throttler.acquire_delay(self.app, token)
+        if delay > 0:
+            time.sleep(delay)
+        response = self.transport.handle_request(request)
+        graph_throttler.update(self.app, token, response.headers)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+# --- Nouveaux essais et disjoncteur ---
+
+class _ResilientTransport(httpx.AsyncBaseTransport):
+    """Applique la politique de `common.resilience` à chaque appel (tous essais compris)."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        breaker = resilience.get_breaker(request.url.host)
+        deadline = time.monotonic() + resilience.RETRY_DEADLINE
+        attempt = 0
+        while True:
+            breaker.before_request(request)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                delay = resilience.error_retry_delay(request, e, attempt, deadline)
+                if delay is None:
+                    raise
+                reason = type(e).__name__
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                breaker.record_response(response)
+                delay = resilience.response_retry_delay(request, response, attempt, deadline)
+                if delay is None:
+                    return response
+                reason = str(response.status_code)
+                await response.aclose()
+            resilience.RETRIES.inc(host=request.url.host, reason=reason)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class _SyncResilientTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        breaker = resilience.get_breaker(request.url.host)
+        deadline = time.monotonic() + resilience.RETRY_DEADLINE
+        attempt = 0
+        while True:
+            breaker.before_request(request)
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                delay = resilience.error_retry_delay(request, e, attempt, deadline)
+                if delay is None:
+                    raise
+                reason = type(e).__name__
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                breaker.record_response(response)
+                delay = resilience.response_retry_delay(request, response, attempt, deadline)
+                if delay is None:
+                    return response
+                reason = str(response.status_code)
+                response.close()
+            resilience.RETRIES.inc(host=request.url.host, reason=reason)
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+def _transport(origin: str, sync: bool):
+    target = UPSTREAM_OVERRIDES.get(origin)
+    options = {
+        "http2": HTTP2_AVAILABLE and (target or origin).startswith("https://"),
+        "limits": DEFAULT_LIMITS,
+    }
+    if target:
+        transport = (_SyncOverrideTransport if sync else _OverrideTransport)(target, **options)
+    else:
+        transport = (httpx.HTTPTransport if sync else httpx.AsyncHTTPTransport)(**options)
+    transport = _SyncMeasuredTransport(transport) if sync else _MeasuredTransport(transport)
+    # L'attente du limiteur n'est pas comptée dans la latence amont mesurée
+    app = THROTTLED_HOSTS.get(urlsplit(origin).hostname)
+    if app:
+        transport = (_SyncThrottledTransport if sync else _ThrottledTransport)(transport, app)
+    # Le disjoncteur coupe avant toute attente de quota; chaque essai est mesuré séparément
+    return _SyncResilientTransport(transport) if sync else _ResilientTransport(transport)
+
+
+def get_client(url: str) -> httpx.AsyncClient:
+    """Retourne le client (et donc le pool de connexions) associé à l'hôte de `url`."""
+    origin = _origin(url)
+    client = _clients.get(origin)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(transport=_transport(origin, sync=False), timeout=DEFAULT_TIMEOUT)
+        _clients[origin] = client
+    return client
+
+
+def get_sync_client(url: str) -> httpx.Client:
+    """Équivalent synchrone de `get_client`, utilisable depuis plusieurs threads."""
+    origin = _origin(url)
+    with _sync_lock:
+        client = _sync_clients.get(origin)
+        if client is None or client.is_closed:
+            client = httpx.Client(transport=_transport(origin, sync=True), timeout=DEFAULT_TIMEOUT)
+            _sync_clients[origin] = client
+    return client
+
+
+async def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Envoie une requête via le pool de l'hôte concerné."""
+    return await get_client(url).request(method, url, **kwargs)
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+async def post(url: str, **kwargs) -> httpx.Response:
+    return await request("POST", url, **kwargs)
+
+
+async def put(url: str, **kwargs) -> httpx.Response:
+    return await request("PUT", url, **kwargs)
+
+
+async def aclose():
+    """Ferme tous les pools de connexions."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+    with _sync_lock:
+        sync_clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for sync_client in sync_clients:
+        sync_client.close()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Lifespan FastAPI: les pools vivent aussi longtemps que l'application."""
+    yield
+    await aclose()
+
+
+def error_details(error: httpx.HTTPError):
+    """Détails exploitables d'une erreur httpx (corps JSON de la réponse si disponible)."""
+    if isinstance(error, httpx.HTTPStatusError):
+        try:
+            return read_json(error.response)
+        except ValueError:
+            return error.response.text
+    return str(error)
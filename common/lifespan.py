@@ -0,0 +1,17 @@
+"""Composition des lifespans FastAPI des briques partagées (pools HTTP, tâches de fond...)."""
+from contextlib import AsyncExitStack, asynccontextmanager
+
+
+def combine_lifespans(*lifespans):
+    """
+    Enchaîne plusieurs lifespans: ils démarrent dans l'ordre donné et s'arrêtent
+    dans l'ordre inverse (les tâches de fond s'arrêtent avant la fermeture des pools).
+    """
+    @asynccontextmanager
+    async def lifespan(app):
+        async with AsyncExitStack() as stack:
+            for item in lifespans:
+                await stack.enter_async_context(item(app))
+            yield
+
+    return lifespan
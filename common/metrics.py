@@ -0,0 +1,245 @@
+"""
+Métriques au format texte Prometheus, exposées sur `/metrics` par chaque application.
+
+- entrant: durée des requêtes par application, route (modèle de chemin) et statut;
+- sortant: durée, statut et octets échangés par hôte amont et endpoint. Ces
+  mesures sont prises par le transport des pools de `common.http_client`: tout
+  appel sortant est mesuré, sans code dans les routes.
+
+Le registre est propre au processus: dans la passerelle, `/metrics` de
+n'importe quelle application (ou de la passerelle) expose tout le processus.
+
+Aucune dépendance: le format d'exposition est assez simple pour être écrit ici.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Secondes; couvre les pages locales (quelques ms) comme les uploads (dizaines de secondes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Les pools synchrones sont utilisés depuis plusieurs threads
+_lock = threading.Lock()
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with _lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = value
+
+    samples = Counter.samples
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                # Compte par intervalle (le dernier pour +Inf), puis somme
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def samples(self) -> Iterator[str]:
+        with _lock:
+            values = [(key, list(state)) for key, state in self._values.items()]
+        names = self.labelnames + ("le",)
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels(names, key + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+
+def render() -> str:
+    """Toutes les métriques du processus, au format d'exposition texte."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# --- Métriques HTTP ---
+
+INBOUND_DURATION = Histogram(
+    "http_server_request_duration_seconds", "Durée des requêtes reçues, jusqu'au dernier octet de la réponse.",
+    ("app", "method", "route", "status"),
+)
+OUTBOUND_DURATION = Histogram(
+    "http_client_request_duration_seconds", "Durée des appels sortants, jusqu'au dernier octet de la réponse.",
+    ("host", "method", "endpoint", "status"),
+)
+OUTBOUND_SENT_BYTES = Counter(
+    "http_client_request_bytes_total", "Octets envoyés (corps) aux hôtes amont.",
+    ("host", "method", "endpoint"),
+)
+OUTBOUND_RECEIVED_BYTES = Counter(
+    "http_client_response_bytes_total", "Octets reçus (corps, tels que transmis) des hôtes amont.",
+    ("host", "method", "endpoint"),
+)
+
+# Segments variables (identifiants de pages, de vidéos...) regroupés sous un même endpoint;
+# les versions d'API (v2, v23.0) restent visibles
+_VERSION_SEGMENT = re.compile(r"v\d+(\.\d+)?")
+
+
+def endpoint_label(path: str) -> str:
+    """`/v23.0/1234567/feed` -> `/v23.0/{id}/feed`."""
+    segments = [
+        "{id}" if any(c.isdigit() for c in segment) and not _VERSION_SEGMENT.fullmatch(segment) else segment
+        for segment in path.split("/")
+    ]
+    return "/".join(segments) or "/"
+
+
+def record_outbound(host: str, method: str, path: str, status: str, duration: float,
+                    sent: int, received: int):
+    endpoint = endpoint_label(path)
+    OUTBOUND_DURATION.observe(duration, host=host, method=method, endpoint=endpoint, status=status)
+    OUTBOUND_SENT_BYTES.inc(sent, host=host, method=method, endpoint=endpoint)
+    OUTBOUND_RECEIVED_BYTES.inc(received, host=host, method=method, endpoint=endpoint)
+
+
+# --- Requêtes entrantes (ASGI) ---
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: mesure chaque requête HTTP, étiquetée par le modèle de la
+    route (`/api/videos`, `/items/{id}`) et non par le chemin réel. Les chemins
+    hors routes (fichiers statiques, 404) sont regroupés sous `other`.
+    """
+
+    def __init__(self, app, app_name: str):
+        self.app = app
+        self.app_name = app_name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Le routeur enregistre la route choisie dans le scope
+            route = getattr(scope.get("route"), "path", None)
+            INBOUND_DURATION.observe(
+                time.perf_counter() - started, app=self.app_name, method=scope["method"],
+                route=scope.get("root_path", "") + route if route else "other", status=str(status),
+            )
+
+
+async def metrics_endpoint():
+    # Import local: l'application Flask (facebook/last.py) utilise aussi ce module
+    from starlette.responses import Response
+    return Response(render(), media_type=CONTENT_TYPE)
+
+
+def instrument(app, app_name: str):
+    """Ajoute `/metrics` et la mesure des requêtes entrantes à une application FastAPI."""
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+    app.add_middleware(MetricsMiddleware, app_name=app_name)
+
+
+def instrument_flask(app, app_name: str):
+    """Équivalent de `instrument` pour une application Flask (facebook/last.py)."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _keep_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _record_request(error=None):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        # Une exception non gérée donne une 500 (after_request n'est alors pas appelé)
+        status = g.pop("metrics_status", 500)
+        INBOUND_DURATION.observe(
+            time.perf_counter() - started, app=app_name, method=request.method,
+            route=request.url_rule.rule if request.url_rule else "other", status=str(status),
+        )
+
+    @app.route("/metrics")
+    def metrics_view():
+        return Response(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,173 @@
+"""
+Politique d'appel des hôtes amont: nouveaux essais et disjoncteur par hôte.
+
+- Nouveaux essais: bornés (UPSTREAM_MAX_RETRIES), avec un délai exponentiel
+  tiré au hasard ("full jitter") pour ne pas synchroniser les clients, et une
+  échéance globale (UPSTREAM_RETRY_DEADLINE) qui borne la latence de queue.
+  Une erreur de connexion est toujours retentée (la requête n'est pas partie);
+  un délai de lecture ou une réponse 429/502/503/504 seulement pour un appel
+  idempotent (GET, PUT, DELETE... ou extension `idempotent`) au corps rejouable.
+- Disjoncteur: après UPSTREAM_BREAKER_FAILURES échecs consécutifs (erreur
+  réseau ou 5xx), les appels vers l'hôte échouent immédiatement (CircuitOpen)
+  pendant UPSTREAM_BREAKER_RESET secondes. Un seul appel sonde alors l'hôte
+  (demi-ouvert): un succès referme le circuit, un échec le rouvre.
+
+Appliquée par le transport des pools de `common.http_client`: une plateforme
+dégradée n'immobilise plus les workers, et les autres continuent de répondre.
+"""
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from common import metrics
+
+MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", 2))
+BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", 0.2))
+BACKOFF_CAP = float(os.getenv("UPSTREAM_BACKOFF_CAP", 2.0))
+RETRY_DEADLINE = float(os.getenv("UPSTREAM_RETRY_DEADLINE", 10.0))
+BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.getenv("UPSTREAM_BREAKER_RESET", 30.0))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {429, 502, 503, 504}
+# Erreurs survenues avant l'envoi de la requête: un nouvel essai est sans risque
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+RETRIES = metrics.Counter(
+    "http_client_retries_total", "Nouveaux essais d'appels sortants, par cause.", ("host", "reason"),
+)
+REJECTED = metrics.Counter(
+    "http_client_circuit_rejections_total", "Appels refusés sans être envoyés (circuit ouvert).", ("host",),
+)
+CIRCUIT_STATE = metrics.Gauge(
+    "http_client_circuit_state", "État du disjoncteur par hôte (0 fermé, 1 demi-ouvert, 2 ouvert).", ("host",),
+)
+
+
+class CircuitOpen(httpx.RequestError):
+    """Hôte jugé indisponible: l'appel n'a pas été envoyé."""
+
+
+class CircuitBreaker:
+    """Disjoncteur d'un hôte, partagé par les pools asynchrones et synchrones."""
+
+    def __init__(self, host: str, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            print(f"Disjoncteur {self.host} : {self.state} -> {state}")
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state], host=self.host)
+
+    def before_request(self, request: httpx.Request):
+        """Lève CircuitOpen si l'appel ne doit pas partir; sinon le laisse passer (éventuellement en sonde)."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            # Une sonde abandonnée (tâche annulée...) n'empêche pas la suivante indéfiniment
+            if self.state == HALF_OPEN and (self.probe_started is None
+                                            or now - self.probe_started >= self.reset_timeout):
+                self.probe_started = now
+                return
+            if self.state == CLOSED:
+                return
+        REJECTED.inc(host=self.host)
+        raise CircuitOpen(f"{self.host} indisponible, appels suspendus", request=request)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.probe_started = None
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probe_started = None
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release(self):
+        """Appel interrompu sans verdict sur l'hôte (annulation, quota...): libère la sonde."""
+        with self._lock:
+            self.probe_started = None
+
+    def record_response(self, response: httpx.Response):
+        if response.status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+        return breaker
+
+
+def is_replayable(request: httpx.Request) -> bool:
+    """Corps en mémoire (JSON, formulaire, octets): il peut être renvoyé tel quel."""
+    return isinstance(request.stream, httpx.ByteStream)
+
+
+def is_idempotent(request: httpx.Request) -> bool:
+    return bool(request.extensions.get("idempotent", request.method in IDEMPOTENT_METHODS))
+
+
+def _retry_after(value: Optional[str]) -> float:
+    if not value:
+        return 0.0
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def retry_delay(attempt: int, deadline: float, retry_after: Optional[str] = None) -> Optional[float]:
+    """Attente avant le nouvel essai `attempt` (0 pour le premier), ou None s'il ne faut plus essayer."""
+    if attempt >= MAX_RETRIES:
+        return None
+    delay = max(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)), _retry_after(retry_after))
+    if time.monotonic() + delay > deadline:
+        return None
+    return delay
+
+
+def error_retry_delay(request: httpx.Request, error: httpx.TransportError, attempt: int,
+                      deadline: float) -> Optional[float]:
+    if isinstance(error, CONNECT_ERRORS) or is_idempotent(request) and is_replayable(request):
+        return retry_delay(attempt, deadline)
+    return None
+
+
+def response_retry_delay(request: httpx.Request, response: httpx.Response, attempt: int,
+                         deadline: float) -> Optional[float]:
+    if response.status_code in RETRY_STATUSES and is_idempotent(request) and is_replayable(request):
+        return retry_delay(attempt, deadline, response.headers.get("retry-after"))
+    return None
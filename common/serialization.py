@@ -0,0 +1,60 @@
+"""
+Couche JSON partagée: orjson pour décoder les réponses amont et encoder les nôtres.
+
+- `loads`/`read_json`: décodage orjson (plusieurs fois plus rapide que `json`,
+  utilisé par `httpx.Response.json()`);
+- `from_dict`: construit un modèle typé (dataclass à `__slots__`) avec les seuls
+  champs qu'il déclare; le reste du corps amont n'est pas conservé;
+- `JSONResponse`: réponse encodée par orjson, qui sérialise directement ces
+  modèles (dataclasses) sans passer par des dictionnaires intermédiaires.
+  Renvoyer une réponse évite aussi `jsonable_encoder`, que FastAPI applique
+  aux dictionnaires renvoyés par les routes.
+
+Les modèles de chaque plateforme sont définis avec elle (`tiktok/models.py`,
+`insta/models.py`).
+"""
+import dataclasses
+from functools import lru_cache
+from typing import Any, Optional, Tuple, Type, TypeVar
+
+import httpx
+import orjson
+from starlette.responses import JSONResponse as _StarletteJSONResponse
+
+T = TypeVar("T")
+
+# Clés non textuelles (identifiants numériques) acceptées comme avec `json`
+DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value, option=DUMPS_OPTIONS)
+
+
+def loads(data) -> Any:
+    """Lève ValueError (orjson.JSONDecodeError) si le corps n'est pas du JSON."""
+    return orjson.loads(data)
+
+
+def read_json(response: httpx.Response) -> Any:
+    """Équivalent de `response.json()`, décodé par orjson."""
+    return loads(response.content)
+
+
+@lru_cache(maxsize=None)
+def _field_names(model: type) -> Tuple[str, ...]:
+    return tuple(field.name for field in dataclasses.fields(model))
+
+
+def from_dict(model: Type[T], data: Optional[dict]) -> T:
+    """Modèle construit depuis un objet JSON: champs déclarés seulement, None si absents."""
+    if not isinstance(data, dict):
+        return model()
+    return model(*map(data.get, _field_names(model)))
+
+
+class JSONResponse(_StarletteJSONResponse):
+    """`JSONResponse` encodée par orjson (dictionnaires, listes et modèles dataclass)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
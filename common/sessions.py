@@ -0,0 +1,278 @@
+"""
+Sessions stockées côté serveur.
+
+Remplace le `SessionMiddleware` de Starlette, qui sérialise toute la session
+(jetons de pages compris) dans un cookie signé. Ici le cookie ne contient qu'un
+identifiant opaque signé; les données vivent dans un backend:
+
+- `MemorySessionBackend`: LRU en mémoire avec expiration (un seul processus);
+- `SQLiteSessionBackend`: fichier SQLite partagé par plusieurs workers.
+
+Les backends stockent la session sérialisée en JSON: chaque requête obtient
+ainsi sa propre copie, et une session non modifiée n'est jamais réécrite.
+L'expiration est glissante: elle est repoussée (ainsi que le Max-Age du cookie)
+au plus une fois par SESSION_RENEW_INTERVAL, tant que l'utilisateur est actif.
+L'identifiant change à chaque connexion ou déconnexion (`token_key` modifié).
+Le backend est choisi par `create_backend()` via SESSION_BACKEND
+("memory" par défaut, ou "sqlite") et SESSION_DB_PATH.
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from itsdangerous import BadSignature, Signer
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+DEFAULT_MAX_AGE = 14 * 24 * 60 * 60  # 14 jours, comme Starlette
+# Intervalle (secondes) entre deux purges des sessions SQLite expirées, faites lors d'une écriture
+SESSION_PURGE_INTERVAL = int(os.getenv("SESSION_PURGE_INTERVAL", 3600))
+# Intervalle (secondes) entre deux prolongations d'une session active (écriture et cookie renvoyé)
+SESSION_RENEW_INTERVAL = int(os.getenv("SESSION_RENEW_INTERVAL", 300))
+# Clés dont le changement (connexion, déconnexion) donne un nouvel identifiant de session
+LOGIN_KEYS = ("token_key",)
+
+
+class MemorySessionBackend:
+    """Sessions en mémoire: LRU borné à `max_entries`, chaque entrée expire après `ttl`."""
+
+    def __init__(self, max_entries: int = 10_000, ttl: int = DEFAULT_MAX_AGE,
+                 renew_interval: int = SESSION_RENEW_INTERVAL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def load(self, session_id: str) -> Optional[str]:
+        return (await self.load_and_renew(session_id))[0]
+
+    async def load_and_renew(self, session_id: str) -> Tuple[Optional[str], bool]:
+        """Session et vrai si son expiration vient d'être repoussée."""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None, False
+        expires_at, data = entry
+        now = time.monotonic()
+        if expires_at < now:
+            del self._entries[session_id]
+            return None, False
+        self._entries.move_to_end(session_id)
+        renewed = expires_at < now + self.ttl - self.renew_interval
+        if renewed:
+            self._entries[session_id] = (now + self.ttl, data)
+        return data, renewed
+
+    async def save(self, session_id: str, data: str):
+        self._entries[session_id] = (time.monotonic() + self.ttl, data)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, session_id: str):
+        self._entries.pop(session_id, None)
+
+
+class SQLiteSessionBackend:
+    """
+    Sessions dans un fichier SQLite (mode WAL), partageable entre workers.
+    Les accès disque se font hors de la boucle d'événements. Les sessions
+    expirées sont effacées au plus une fois par `purge_interval` secondes, par
+    l'écriture suivante.
+    """
+
+    def __init__(self, path: str = "sessions.db", ttl: int = DEFAULT_MAX_AGE,
+                 purge_interval: int = SESSION_PURGE_INTERVAL, renew_interval: int = SESSION_RENEW_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.renew_interval = renew_interval
+        # Première purge à la première écriture (lignes laissées par un arrêt précédent)
+        self._next_purge = 0.0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Une connexion par thread: sqlite3 interdit le partage entre threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, session_id: str) -> Tuple[Optional[str], bool]:
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at >= ?", (session_id, now)
+        ).fetchone()
+        if row is None:
+            return None, False
+        renewed = row[1] < now + self.ttl - self.renew_interval
+        if renewed:
+            with conn:
+                conn.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (now + self.ttl, session_id))
+        return row[0], renewed
+
+    def _save(self, session_id: str, data: str):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                (session_id, data, now + self.ttl),
+            )
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            self.purge_expired()
+
+    def _delete(self, session_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def purge_expired(self) -> int:
+        """Supprime les sessions expirées; renvoie le nombre de lignes effacées."""
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),)).rowcount
+
+    async def load(self, session_id: str) -> Optional[str]:
+        return (await self.load_and_renew(session_id))[0]
+
+    async def load_and_renew(self, session_id: str) -> Tuple[Optional[str], bool]:
+        """Session et vrai si son expiration vient d'être repoussée."""
+        return await run_in_threadpool(self._load, session_id)
+
+    async def save(self, session_id: str, data: str):
+        await run_in_threadpool(self._save, session_id, data)
+
+    async def delete(self, session_id: str):
+        await run_in_threadpool(self._delete, session_id)
+
+
+def create_backend(max_age: int = DEFAULT_MAX_AGE):
+    """Backend configuré par les variables d'environnement SESSION_BACKEND et SESSION_DB_PATH."""
+    kind = os.getenv("SESSION_BACKEND", "memory")
+    if kind == "sqlite":
+        return SQLiteSessionBackend(os.getenv("SESSION_DB_PATH", "sessions.db"), ttl=max_age)
+    if kind == "memory":
+        return MemorySessionBackend(ttl=max_age)
+    raise ValueError(f"SESSION_BACKEND inconnu: {kind!r} (attendu: 'memory' ou 'sqlite')")
+
+
+def _login_state(session: dict) -> frozenset:
+    """Valeurs de LOGIN_KEYS, à la racine et dans les espaces des applications montées."""
+    spaces = [(None, session)] + [(name, value) for name, value in session.items() if isinstance(value, dict)]
+    return frozenset((name, key, space[key]) for name, space in spaces for key in LOGIN_KEYS if space.get(key))
+
+
+class ServerSideSessionMiddleware:
+    """
+    Équivalent de `SessionMiddleware` (même `request.session`, mêmes options de
+    cookie) dont le cookie ne transporte qu'un identifiant de session signé.
+    La session n'est réécrite dans le backend que si elle a changé; une session
+    active est prolongée (backend et cookie) au plus une fois par intervalle.
+
+    Si une session est déjà ouverte par une couche extérieure (passerelle qui
+    monte plusieurs applications), l'application reçoit l'espace de cette
+    session réservé à son préfixe de montage au lieu d'ouvrir la sienne:
+    un seul cookie, et `session.clear()` ne déconnecte que cette application.
+    """
+
+    def __init__(self, app, secret_key: str, backend=None, session_cookie: str = "session",
+                 max_age: Optional[int] = DEFAULT_MAX_AGE, path: str = "/", same_site: str = "lax",
+                 https_only: bool = False, domain: Optional[str] = None):
+        self.app = app
+        self.signer = Signer(str(secret_key), salt="session-id")
+        self.backend = backend if backend is not None else create_backend(max_age or DEFAULT_MAX_AGE)
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.security_flags = f"httponly; samesite={same_site}"
+        if https_only:
+            self.security_flags += "; secure"
+        if domain is not None:
+            self.security_flags += f"; domain={domain}"
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        if "session" in scope:
+            await self._call_nested(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        session_id = None
+        stored = None
+        renewed = False
+        if self.session_cookie in connection.cookies:
+            try:
+                session_id = self.signer.unsign(connection.cookies[self.session_cookie]).decode("utf-8")
+            except BadSignature:
+                session_id = None
+            if session_id is not None:
+                stored, renewed = await self.backend.load_and_renew(session_id)
+
+        session = scope["session"] = json.loads(stored) if stored else {}
+        login_state = _login_state(session)
+
+        async def send_wrapper(message):
+            nonlocal session_id, stored, renewed
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if session:
+                    if session_id is not None and _login_state(session) != login_state:
+                        # Connexion ou déconnexion: nouvel identifiant (fixation de session)
+                        await self.backend.delete(session_id)
+                        session_id = stored = None
+                    if session_id is None:
+                        session_id = secrets.token_urlsafe(32)
+                        renewed = True
+                    data = json.dumps(session)
+                    if data != stored:
+                        await self.backend.save(session_id, data)
+                    if renewed:
+                        # Nouveau cookie, ou Max-Age repoussé comme l'expiration côté serveur
+                        headers.append("Set-Cookie", self._cookie(self.signer.sign(session_id).decode("utf-8")))
+                elif session_id is not None:
+                    await self.backend.delete(session_id)
+                    headers.append("Set-Cookie", self._cookie("null", expire=True))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _call_nested(self, scope, receive, send):
+        outer = scope["session"]
+        namespace = scope.get("root_path") or "/"
+        scope["session"] = outer.setdefault(namespace, {})
+
+        async def send_wrapper(message):
+            # Un espace vide ne doit pas suffire à créer une session (et son cookie)
+            if message["type"] == "http.response.start" and not outer.get(namespace):
+                outer.pop(namespace, None)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            scope["session"] = outer
+
+    def _cookie(self, value: str, expire: bool = False) -> str:
+        cookie = f"{self.session_cookie}={value}; path={self.path}; "
+        if expire:
+            cookie += "expires=Thu, 01 Jan 1970 00:00:00 GMT; "
+        elif self.max_age:
+            cookie += f"Max-Age={self.max_age}; "
+        return cookie + self.security_flags
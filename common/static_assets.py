@@ -0,0 +1,187 @@
+"""
+Fichiers statiques compressés une fois pour toutes, servis avec des en-têtes de cache.
+
+Au démarrage (lifespan de l'application, ou à la première requête), chaque
+fichier du répertoire est lu en mémoire et, s'il s'agit de texte, compressé en
+gzip et en brotli (si le paquet `brotli` est installé) au niveau maximal: les
+requêtes ne paient plus ni lecture disque ni compression.
+
+- ETag fort (empreinte du contenu, propre à chaque encodage) et réponse 304
+  sur `If-None-Match`;
+- `Cache-Control: public, max-age=31536000, immutable` pour les fichiers
+  empreintés (`app.3f9a1c2e.js`): leur nom change avec leur contenu;
+- `Cache-Control: no-cache` pour les autres (pages HTML): le navigateur garde
+  sa copie et la revalide, un 304 sans corps suffit tant qu'elle est à jour.
+
+Les fichiers sont ceux présents au démarrage: une modification demande un redémarrage.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse, Response
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle: gzip seul
+    brotli = None
+
+# Types compressés (les images et vidéos le sont déjà)
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml", "image/svg+xml")
+# En dessous, la compression ne gagne presque rien
+MIN_COMPRESS_SIZE = 256
+# Nom empreinté: un segment hexadécimal d'au moins 8 caractères avant l'extension
+FINGERPRINTED = re.compile(r"\.[0-9a-f]{8,}\.[^./]+$")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+# Ordre de préférence des encodages (le plus compact d'abord)
+ENCODINGS = ("br", "gzip")
+
+
+@dataclass
+class Variant:
+    body: bytes
+    etag: str
+
+
+@dataclass
+class Asset:
+    media_type: str
+    cache_control: str
+    # Encodage ("identity", "gzip", "br") -> contenu et ETag
+    variants: Dict[str, Variant] = field(default_factory=dict)
+
+
+def _compress(encoding: str, data: bytes) -> Optional[bytes]:
+    if encoding == "gzip":
+        # mtime fixe: même contenu compressé (et même ETag) à chaque démarrage
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+
+def load_asset(path: str, name: str) -> Asset:
+    with open(path, "rb") as f:
+        data = f.read()
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if media_type.startswith("text/"):
+        media_type += "; charset=utf-8"
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    asset = Asset(media_type, IMMUTABLE_CACHE if FINGERPRINTED.search(name) else REVALIDATE_CACHE)
+    asset.variants["identity"] = Variant(data, f'"{digest}"')
+    if len(data) >= MIN_COMPRESS_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+        for encoding in ENCODINGS:
+            compressed = _compress(encoding, data)
+            # Un encodage qui ne réduit pas la taille n'est pas proposé
+            if compressed is not None and len(compressed) < len(data):
+                asset.variants[encoding] = Variant(compressed, f'"{digest}-{encoding}"')
+    return asset
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """`gzip, br;q=0.8, *;q=0` -> {"gzip": 1.0, "br": 0.8, "*": 0.0}."""
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def _etags(header: str):
+    # If-None-Match se compare sans tenir compte du préfixe "faible"
+    return {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+def _route_path(scope) -> str:
+    """Chemin sous le point de montage (Starlette laisse le chemin complet dans `path`)."""
+    path, root_path = scope["path"], scope.get("root_path", "")
+    return path[len(root_path):] if root_path and path.startswith(root_path) else path
+
+
+class PrecompressedStaticFiles:
+    """
+    Application ASGI à monter à la place de `StaticFiles` (même option `html`:
+    `/` et les répertoires servent leur `index.html`). `response()` sert aussi un
+    fichier depuis une route (ex: `/terms` -> `terms.html`, sans redirection).
+    """
+
+    def __init__(self, directory, html: bool = False):
+        self.directory = os.fspath(directory)
+        self.html = html
+        self._assets: Optional[Dict[str, Asset]] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Asset]:
+        if self._assets is None:
+            with self._lock:
+                if self._assets is None:
+                    assets = {}
+                    for root, _, files in os.walk(self.directory):
+                        for filename in files:
+                            path = os.path.join(root, filename)
+                            name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                            assets[name] = load_asset(path, name)
+                    self._assets = assets
+        return self._assets
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        self.load()
+        yield
+
+    def lookup(self, path: str) -> Optional[Asset]:
+        assets = self.load()
+        name = path.strip("/")
+        if self.html and (not name or name + "/index.html" in assets):
+            name = f"{name}/index.html".lstrip("/")
+        return assets.get(name)
+
+    def response(self, request_headers: Headers, name: str, method: str = "GET") -> Response:
+        asset = self.lookup(name)
+        if asset is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next((encoding for encoding in ENCODINGS
+                         if encoding in asset.variants and accepted.get(encoding, 0) > 0), "identity")
+        variant = asset.variants[encoding]
+        headers = {"etag": variant.etag, "cache-control": asset.cache_control}
+        if len(asset.variants) > 1:
+            headers["vary"] = "Accept-Encoding"
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*"
+                              or _etags(if_none_match) & {v.etag for v in asset.variants.values()}):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+        if method == "HEAD":
+            headers["content-length"] = str(len(variant.body))
+            return Response(status_code=200, headers=headers, media_type=asset.media_type)
+        return Response(variant.body, headers=headers, media_type=asset.media_type)
+
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"allow": "GET, HEAD"})
+        else:
+            response = self.response(Headers(scope=scope), _route_path(scope), scope["method"])
+        await response(scope, receive, send)
@@ -0,0 +1,63 @@
+"""
+Templates Jinja construits au premier rendu.
+
+Importer `fastapi.templating` (donc jinja2) et construire l'environnement coûte
+plusieurs dizaines de millisecondes au démarrage, alors que les applications
+n'en ont besoin qu'à la première page rendue.
+
+Chaque template est compilé une seule fois puis gardé en mémoire; les fichiers
+ne sont plus relus à chaque rendu (TEMPLATES_AUTO_RELOAD=1 en développement pour
+voir les modifications sans redémarrer). `preload` et `lifespan` compilent les
+pages d'une application dès son démarrage.
+"""
+import os
+import threading
+from contextlib import asynccontextmanager
+
+AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD") == "1"
+
+
+class LazyTemplates:
+    """Même usage que `Jinja2Templates` (`TemplateResponse`, `env`), construit à la première utilisation."""
+
+    def __init__(self, directory, preload=(), **options):
+        self.directory = directory
+        self.preload = tuple(preload)
+        self._options = options
+        self._templates = None
+        self._async_env = None
+        self._lock = threading.Lock()
+
+    @property
+    def templates(self):
+        if self._templates is None:
+            with self._lock:
+                if self._templates is None:
+                    from fastapi.templating import Jinja2Templates
+                    templates = Jinja2Templates(directory=self.directory, **self._options)
+                    templates.env.auto_reload = AUTO_RELOAD
+                    self._templates = templates
+        return self._templates
+
+    @property
+    def env(self):
+        return self.templates.env
+
+    @property
+    def async_env(self):
+        """Environnement asynchrone sur les mêmes templates, pour les pages rendues en streaming."""
+        if self._async_env is None:
+            import jinja2
+            self._async_env = jinja2.Environment(loader=self.env.loader, autoescape=True, enable_async=True,
+                                                 auto_reload=AUTO_RELOAD)
+        return self._async_env
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        """Compile les templates de `preload` au démarrage plutôt qu'à leur premier rendu."""
+        for name in self.preload:
+            self.env.get_template(name)
+        yield
+
+    def TemplateResponse(self, *args, **kwargs):
+        return self.templates.TemplateResponse(*args, **kwargs)
@@ -0,0 +1,198 @@
+"""
+Limitation des appels Graph (Facebook) et Instagram d'après les en-têtes d'usage.
+
+Graph renvoie l'usage des quotas avec chaque réponse, en pourcentage:
+- X-App-Usage: quota de l'application ({"call_count": 12, "total_time": 3, "total_cputime": 4});
+- X-Page-Usage: quota d'une page (appels avec un jeton de page), même format;
+- X-Business-Use-Case-Usage: quotas par entreprise et type d'usage, avec
+  `estimated_time_to_regain_access` (minutes) quand l'accès est coupé.
+
+Le limiteur tient un budget par application (plateforme) et un par jeton
+(utilisateur ou page). Au-delà de GRAPH_THROTTLE_START % d'usage, les appels d'un
+budget sont mis en file et espacés, d'autant plus que l'usage approche de la
+limite; à GRAPH_THROTTLE_STOP %, ils attendent la fin d'une pause (celle annoncée
+par Graph, au moins GRAPH_THROTTLE_COOLDOWN secondes). On ralentit avant la
+limite plutôt que de subir un blocage de plusieurs minutes (erreurs 4, 17, 32, 613).
+
+Il est appliqué par le transport des pools de `common.http_client` pour les hôtes
+de THROTTLED_HOSTS. Le jeton est lu dans l'extension de requête `graph_token`
+(jetons envoyés dans le corps, voir `common.graph.GraphClient`), sinon dans le
+paramètre `access_token` de l'URL ou l'en-tête Authorization.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import httpx
+
+from common import metrics
+
+# Hôte -> budget d'application
+THROTTLED_HOSTS = {
+    "graph.facebook.com": "facebook",
+    "graph-video.facebook.com": "facebook",
+    "graph.instagram.com": "instagram",
+}
+THROTTLE_START = float(os.getenv("GRAPH_THROTTLE_START", 75))
+THROTTLE_STOP = float(os.getenv("GRAPH_THROTTLE_STOP", 95))
+# Espacement entre deux appels d'un budget juste sous GRAPH_THROTTLE_STOP (secondes)
+MAX_SPACING = float(os.getenv("GRAPH_THROTTLE_MAX_SPACING", 2.0))
+COOLDOWN = float(os.getenv("GRAPH_THROTTLE_COOLDOWN", 60))
+# Au-delà de cette attente, l'appel échoue tout de suite plutôt que de bloquer la requête entrante
+MAX_WAIT = float(os.getenv("GRAPH_THROTTLE_MAX_WAIT", 30))
+# Budgets par jeton gardés en mémoire; les plus anciens inactifs sont oubliés au-delà
+MAX_BUDGETS = 10000
+USAGE_FIELDS = ("call_count", "total_time", "total_cputime")
+
+THROTTLE_DELAY = metrics.Counter(
+    "graph_throttle_delay_seconds_total", "Attente imposée par le limiteur avant les appels Graph.", ("app",),
+)
+APP_USAGE = metrics.Gauge(
+    "graph_app_usage_percent", "Dernier usage du quota d'application annoncé par Graph (X-App-Usage).", ("app",),
+)
+
+
+class GraphThrottled(httpx.RequestError):
+    """Quota épuisé: l'appel n'a pas été envoyé, l'attente dépasserait GRAPH_THROTTLE_MAX_WAIT."""
+
+
+def _usage(header: Optional[str]) -> Optional[float]:
+    """Usage (en %) d'un en-tête X-App-Usage ou X-Page-Usage: le plus élevé des trois compteurs."""
+    if not header:
+        return None
+    try:
+        data = json.loads(header)
+    except ValueError:
+        return None
+    return max((float(data.get(name) or 0) for name in USAGE_FIELDS), default=0.0)
+
+
+def _business_usage(header: Optional[str]) -> Tuple[Optional[float], float]:
+    """Usage (en %) et attente annoncée (secondes) d'un en-tête X-Business-Use-Case-Usage."""
+    if not header:
+        return None, 0.0
+    try:
+        data = json.loads(header)
+    except ValueError:
+        return None, 0.0
+    entries = [entry for values in data.values() if isinstance(values, list) for entry in values]
+    if not entries:
+        return None, 0.0
+    usage = max(float(entry.get(name) or 0) for entry in entries for name in USAGE_FIELDS)
+    regain = max(float(entry.get("estimated_time_to_regain_access") or 0) for entry in entries) * 60
+    return usage, regain
+
+
+def request_token(request: httpx.Request) -> Optional[str]:
+    token = request.extensions.get("graph_token") or request.url.params.get("access_token")
+    if token:
+        return token
+    authorization = request.headers.get("authorization", "")
+    return authorization[7:] if authorization.lower().startswith("bearer ") else None
+
+
+class Budget:
+    """Usage connu d'un quota, pause en cours et prochain créneau libre."""
+
+    def __init__(self):
+        self.usage = 0.0
+        self.blocked_until = 0.0
+        self.next_slot = 0.0
+        self.updated_at = 0.0
+
+    def spacing(self) -> float:
+        if self.usage < THROTTLE_START:
+            return 0.0
+        return MAX_SPACING * min(1.0, (self.usage - THROTTLE_START) / (THROTTLE_STOP - THROTTLE_START))
+
+    def next_start(self, now: float) -> float:
+        start = max(now, self.blocked_until)
+        return max(start, self.next_slot) if self.spacing() else start
+
+    def reserve(self, start: float):
+        spacing = self.spacing()
+        if spacing:
+            self.next_slot = start + spacing
+
+    def update(self, usage: float, now: float, regain: float = 0.0) -> bool:
+        """Enregistre l'usage annoncé; renvoie True si le quota vient d'être mis en pause."""
+        self.usage = usage
+        self.updated_at = now
+        if (usage >= THROTTLE_STOP or regain) and self.blocked_until <= now:
+            self.blocked_until = now + max(regain, COOLDOWN)
+            return True
+        return False
+
+
+class GraphThrottler:
+    """Budgets par application et par jeton, partagés par les pools asynchrones et synchrones."""
+
+    def __init__(self):
+        self._budgets: Dict[Tuple[str, str], Budget] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(app: str, token: Optional[str]) -> Iterable[Tuple[str, str]]:
+        yield "app", app
+        if token:
+            # Seule une empreinte du jeton est gardée
+            yield "token", hashlib.sha256(token.encode()).hexdigest()[:16]
+
+    def _budget(self, key: Tuple[str, str]) -> Budget:
+        budget = self._budgets.get(key)
+        if budget is None:
+            if len(self._budgets) >= MAX_BUDGETS:
+                self._prune()
+            budget = self._budgets[key] = Budget()
+        return budget
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, budget in list(self._budgets.items()):
+            if key[0] == "token" and budget.blocked_until < now and budget.updated_at < now - 3600:
+                del self._budgets[key]
+
+    def acquire_delay(self, app: str, token: Optional[str]) -> float:
+        """
+        Réserve le créneau de l'appel dans chacun de ses budgets et renvoie l'attente
+        (secondes) avant de l'envoyer. Lève GraphThrottled si elle dépasse MAX_WAIT.
+        """
+        now = time.monotonic()
+        with self._lock:
+            budgets = [self._budget(key) for key in self._keys(app, token)]
+            start = max(budget.next_start(now) for budget in budgets)
+            if start - now > MAX_WAIT:
+                raise GraphThrottled(f"Quota {app} épuisé, nouvel essai possible dans {start - now:.0f} s")
+            for budget in budgets:
+                budget.reserve(start)
+        if start > now:
+            THROTTLE_DELAY.inc(start - now, app=app)
+        return start - now
+
+    def update(self, app: str, token: Optional[str], headers: httpx.Headers):
+        """Met à jour les budgets d'après les en-têtes d'usage d'une réponse."""
+        app_usage = _usage(headers.get("x-app-usage"))
+        page_usage = _usage(headers.get("x-page-usage"))
+        business_usage, regain = _business_usage(headers.get("x-business-use-case-usage"))
+        token_usages = [usage for usage in (page_usage, business_usage) if usage is not None]
+        if app_usage is None and not token_usages:
+            return
+        now = time.monotonic()
+        paused = []
+        with self._lock:
+            if app_usage is not None:
+                APP_USAGE.set(app_usage, app=app)
+                if self._budget(("app", app)).update(app_usage, now):
+                    paused.append(f"application {app} ({app_usage:.0f} %)")
+            if token and token_usages:
+                key = list(self._keys(app, token))[-1]
+                if self._budget(key).update(max(token_usages), now, regain):
+                    paused.append(f"jeton {key[1]} ({max(token_usages):.0f} %)")
+        for name in paused:
+            print(f"Quota Graph proche de la limite, appels suspendus : {name}")
+
+
+graph_throttler = GraphThrottler()
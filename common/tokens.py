@@ -0,0 +1,412 @@
+"""
+Cycle de vie des jetons OAuth, commun à toutes les plateformes.
+
+Chaque jeton est enregistré avec sa date d'expiration sous une clé opaque
+(seule la clé est gardée en session). Les handlers demandent « un jeton valide »
+via `token_manager.get_valid_token(key)`: si le jeton approche de l'expiration,
+il est rafraîchi avec le refresher de sa plateforme, sans refaire l'OAuth.
+Une tâche de fond rafraîchit aussi les jetons avant qu'ils n'expirent.
+
+Les rafraîchissements sont uniques par clé: dans le processus via un verrou,
+et entre workers (stockage SQLite) via un bail posé dans la table.
+Le stockage suit SESSION_BACKEND / SESSION_DB_PATH, comme les sessions.
+
+Un jeton inutilisé depuis plus longtemps qu'une session (TOKEN_IDLE_TTL) est
+effacé par la tâche de fond, comme un jeton expiré qui ne peut plus être
+rafraîchi (plateforme qui refuse le rafraîchissement, pas de refresh_token).
+"""
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from common.sessions import DEFAULT_MAX_AGE
+
+DEFAULT_REFRESH_MARGIN = 5 * 60
+REFRESH_CHECK_INTERVAL = 60
+REFRESH_LEASE_SECONDS = 30
+# Après un échec en arrière-plan, nouvel essai après un délai doublé à chaque échec (plafonné)
+MAX_REFRESH_BACKOFF = 3600
+# Dernière utilisation enregistrée au plus une fois par intervalle (écriture SQLite)
+TOUCH_INTERVAL = 3600
+# Un jeton inutilisé plus longtemps qu'une session ne peut plus être demandé: il est effacé
+TOKEN_IDLE_TTL = int(os.getenv("TOKEN_IDLE_TTL", DEFAULT_MAX_AGE + TOUCH_INTERVAL))
+
+
+class TokenRefreshError(Exception):
+    """Jeton inconnu, expiré ou impossible à rafraîchir: l'utilisateur doit se reconnecter."""
+
+
+@dataclass
+class TokenRecord:
+    provider: str
+    access_token: str
+    refresh_token: Optional[str] = None
+    # Dates d'expiration en secondes depuis l'epoch (None: pas d'expiration connue)
+    expires_at: Optional[float] = None
+    refresh_expires_at: Optional[float] = None
+    extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_response(cls, provider: str, payload: dict, previous: Optional["TokenRecord"] = None,
+                      **extra) -> "TokenRecord":
+        """Construit un enregistrement depuis une réponse OAuth (`expires_in` en secondes)."""
+        now = time.time()
+        expires_in = payload.get('expires_in')
+        refresh_expires_in = payload.get('refresh_expires_in')
+        return cls(
+            provider=provider,
+            access_token=payload['access_token'],
+            # Certaines plateformes ne renvoient pas de nouveau refresh_token: on garde l'ancien
+            refresh_token=payload.get('refresh_token') or (previous.refresh_token if previous else None),
+            expires_at=now + float(expires_in) if expires_in else None,
+            refresh_expires_at=(now + float(refresh_expires_in) if refresh_expires_in
+                                else previous.refresh_expires_at if previous else None),
+            extra={**(previous.extra if previous else {}), **extra},
+        )
+
+    def expires_within(self, seconds: float) -> bool:
+        return self.expires_at is not None and self.expires_at - time.time() <= seconds
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_within(0)
+
+    @property
+    def refreshable(self) -> bool:
+        """
+        Faux si le jeton est expiré sans refresh_token encore valide: Facebook et
+        Instagram prolongent le jeton d'accès lui-même, qui doit être valide.
+        """
+        if not self.expired:
+            return True
+        return bool(self.refresh_token) and (self.refresh_expires_at is None
+                                             or self.refresh_expires_at > time.time())
+
+
+Refresher = Callable[[TokenRecord], Awaitable[TokenRecord]]
+
+
+class MemoryTokenStore:
+    """Jetons en mémoire (un seul processus)."""
+
+    def __init__(self):
+        self._records: Dict[str, TokenRecord] = {}
+        self._last_used: Dict[str, float] = {}
+
+    async def get(self, key: str, touch: bool = False) -> Optional[TokenRecord]:
+        """`touch`: enregistre une utilisation (demande d'un handler, pas la tâche de fond)."""
+        record = self._records.get(key)
+        if record is not None and touch:
+            self._last_used[key] = time.time()
+        return record
+
+    async def put(self, key: str, record: TokenRecord):
+        self._records[key] = record
+        self._last_used.setdefault(key, time.time())
+
+    async def delete(self, key: str):
+        self._records.pop(key, None)
+        self._last_used.pop(key, None)
+
+    async def purge_idle(self, max_idle: float) -> List[str]:
+        """Efface les jetons inutilisés depuis `max_idle` secondes; renvoie leurs clés."""
+        limit = time.time() - max_idle
+        keys = [key for key, last_used in self._last_used.items() if last_used < limit]
+        for key in keys:
+            await self.delete(key)
+        return keys
+
+    async def due(self, margins: Dict[str, float]) -> List[str]:
+        return [key for key, record in self._records.items()
+                if record.provider in margins and record.expires_within(margins[record.provider])]
+
+    async def acquire_refresh(self, key: str) -> bool:
+        return True
+
+    async def release_refresh(self, key: str):
+        pass
+
+
+class SQLiteTokenStore:
+    """Jetons dans un fichier SQLite partagé par plusieurs workers."""
+
+    def __init__(self, path: str = "sessions.db"):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                " key TEXT PRIMARY KEY, provider TEXT NOT NULL, data TEXT NOT NULL,"
+                " expires_at REAL, refreshing_until REAL, last_used_at REAL)"
+            )
+            # Tables créées avant l'ajout de last_used_at
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(tokens)")}
+            if "last_used_at" not in columns:
+                conn.execute("ALTER TABLE tokens ADD COLUMN last_used_at REAL")
+            conn.execute("UPDATE tokens SET last_used_at = ? WHERE last_used_at IS NULL", (time.time(),))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key: str, touch: bool = False) -> Optional[TokenRecord]:
+        conn = self._connect()
+        row = conn.execute("SELECT data, last_used_at FROM tokens WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if touch and (row[1] or 0) < now - TOUCH_INTERVAL:
+            with conn:
+                conn.execute("UPDATE tokens SET last_used_at = ? WHERE key = ?", (now, key))
+        return TokenRecord(**json.loads(row[0]))
+
+    def _put(self, key: str, record: TokenRecord):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO tokens (key, provider, data, expires_at, refreshing_until, last_used_at)"
+                " VALUES (?, ?, ?, ?, NULL, ?) ON CONFLICT (key) DO UPDATE SET provider = excluded.provider,"
+                " data = excluded.data, expires_at = excluded.expires_at, refreshing_until = NULL",
+                (key, record.provider, json.dumps(asdict(record)), record.expires_at, time.time()),
+            )
+
+    def _delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM tokens WHERE key = ?", (key,))
+
+    def _purge_idle(self, max_idle: float) -> List[str]:
+        limit = time.time() - max_idle
+        with self._connect() as conn:
+            keys = [row[0] for row in conn.execute("SELECT key FROM tokens WHERE last_used_at < ?", (limit,))]
+            conn.execute("DELETE FROM tokens WHERE last_used_at < ?", (limit,))
+        return keys
+
+    def _due(self, margins: Dict[str, float]) -> List[str]:
+        now = time.time()
+        keys = []
+        for provider, margin in margins.items():
+            rows = self._connect().execute(
+                "SELECT key FROM tokens WHERE provider = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (provider, now + margin),
+            ).fetchall()
+            keys.extend(row[0] for row in rows)
+        return keys
+
+    def _acquire_refresh(self, key: str) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE tokens SET refreshing_until = ?"
+                " WHERE key = ? AND (refreshing_until IS NULL OR refreshing_until < ?)",
+                (now + REFRESH_LEASE_SECONDS, key, now),
+            ).rowcount == 1
+
+    def _release_refresh(self, key: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE tokens SET refreshing_until = NULL WHERE key = ?", (key,))
+
+    async def get(self, key: str, touch: bool = False) -> Optional[TokenRecord]:
+        """`touch`: enregistre une utilisation (au plus une écriture par TOUCH_INTERVAL)."""
+        return await run_in_threadpool(self._get, key, touch)
+
+    async def put(self, key: str, record: TokenRecord):
+        await run_in_threadpool(self._put, key, record)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self._delete, key)
+
+    async def due(self, margins: Dict[str, float]) -> List[str]:
+        return await run_in_threadpool(self._due, margins)
+
+    async def purge_idle(self, max_idle: float) -> List[str]:
+        """Efface les jetons inutilisés depuis `max_idle` secondes; renvoie leurs clés."""
+        return await run_in_threadpool(self._purge_idle, max_idle)
+
+    async def acquire_refresh(self, key: str) -> bool:
+        return await run_in_threadpool(self._acquire_refresh, key)
+
+    async def release_refresh(self, key: str):
+        await run_in_threadpool(self._release_refresh, key)
+
+
+def create_token_store():
+    """Stockage aligné sur celui des sessions (SESSION_BACKEND / SESSION_DB_PATH)."""
+    if os.getenv("SESSION_BACKEND", "memory") == "sqlite":
+        return SQLiteTokenStore(os.getenv("SESSION_DB_PATH", "sessions.db"))
+    return MemoryTokenStore()
+
+
+class TokenManager:
+    """Registre des jetons et de leurs refreshers, par plateforme."""
+
+    def __init__(self, store=None):
+        self._store = store
+        self._refreshers: Dict[str, Refresher] = {}
+        self._margins: Dict[str, float] = {}
+        # Verrou de rafraîchissement par clé et nombre d'appelants qui l'utilisent
+        self._locks: Dict[str, list] = {}
+        # Échecs consécutifs en arrière-plan et prochain essai, par clé
+        self._failures: Dict[str, tuple] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def store(self):
+        # Créé au premier usage: les variables d'environnement sont alors chargées
+        if self._store is None:
+            self._store = create_token_store()
+        return self._store
+
+    def register_refresher(self, provider: str, refresher: Refresher,
+                           margin: float = DEFAULT_REFRESH_MARGIN):
+        """`refresher` reçoit l'enregistrement courant et renvoie le nouveau; `margin` en secondes."""
+        self._refreshers[provider] = refresher
+        self._margins[provider] = margin
+
+    async def save(self, record: TokenRecord, key: Optional[str] = None) -> str:
+        """Enregistre un jeton et renvoie la clé à garder en session."""
+        key = key or f"{record.provider}:{secrets.token_urlsafe(24)}"
+        await self.store.put(key, record)
+        return key
+
+    async def get_record(self, key: Optional[str], touch: bool = False) -> TokenRecord:
+        record = await self.store.get(key, touch=touch) if key else None
+        if record is None:
+            raise TokenRefreshError("Aucun jeton enregistré pour cette session.")
+        return record
+
+    async def get_valid_token(self, key: Optional[str], force_refresh: bool = False) -> str:
+        """
+        Renvoie un jeton d'accès utilisable. Il est rafraîchi s'il expire dans moins
+        que la marge de sa plateforme (ou si `force_refresh`, ex: après un 401).
+        """
+        record = await self.get_record(key, touch=True)
+        margin = self._margins.get(record.provider, DEFAULT_REFRESH_MARGIN)
+        if force_refresh or record.expires_within(margin):
+            try:
+                record = await self.refresh(key, force=force_refresh)
+            except TokenRefreshError:
+                # Encore valide: l'échec du rafraîchissement anticipé n'est pas bloquant
+                if force_refresh or record.expired:
+                    raise
+        return record.access_token
+
+    async def refresh(self, key: str, force: bool = False) -> TokenRecord:
+        """Rafraîchit un jeton; un seul rafraîchissement à la fois par clé."""
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._refresh(key, force)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._locks.get(key) is entry:
+                del self._locks[key]
+
+    async def _refresh(self, key: str, force: bool) -> TokenRecord:
+        record = await self.get_record(key)
+        margin = self._margins.get(record.provider, DEFAULT_REFRESH_MARGIN)
+        # Un autre appelant a pu rafraîchir pendant l'attente du verrou
+        if not force and not record.expires_within(margin):
+            return record
+
+        refresher = self._refreshers.get(record.provider)
+        if refresher is None:
+            raise TokenRefreshError(f"Aucun refresher pour {record.provider}.")
+        if not await self.store.acquire_refresh(key):
+            # Un autre worker rafraîchit ce jeton: on relit après son passage
+            await asyncio.sleep(1)
+            return await self.get_record(key)
+
+        try:
+            new_record = await refresher(record)
+        except Exception as e:
+            await self.store.release_refresh(key)
+            raise TokenRefreshError(f"Rafraîchissement {record.provider} impossible : {e}") from e
+        await self.store.put(key, new_record)
+        return new_record
+
+    async def forget(self, key: Optional[str]):
+        if key:
+            await self.store.delete(key)
+            self._failures.pop(key, None)
+
+    async def refresh_due_tokens(self, interval: float = REFRESH_CHECK_INTERVAL):
+        """
+        Rafraîchit tous les jetons qui entrent dans leur marge d'expiration, après
+        avoir effacé les jetons inutilisés. Un jeton expiré qui ne peut plus être
+        rafraîchi est effacé; un autre échec est retenté plus tard (délai croissant).
+        """
+        for key in await self.store.purge_idle(TOKEN_IDLE_TTL):
+            self._failures.pop(key, None)
+        now = time.time()
+        for key in await self.store.due(self._margins):
+            failures, retry_at = self._failures.get(key, (0, 0.0))
+            if retry_at > now:
+                continue
+            record = await self.store.get(key)
+            if record is None:
+                continue
+            try:
+                if not record.refreshable:
+                    raise TokenRefreshError("Jeton expiré sans moyen de le renouveler.")
+                await self.refresh(key)
+            except TokenRefreshError as e:
+                if record.expired and (not record.refreshable or _rejected(e)):
+                    # Plus aucun appel possible avec ce jeton: l'utilisateur devra se reconnecter
+                    print(f"Jeton {key.split(':')[0]} expiré et non renouvelable : effacé ({e})")
+                    await self.forget(key)
+                    continue
+                print(f"Rafraîchissement en arrière-plan échoué ({key.split(':')[0]}) : {e}")
+                self._failures[key] = (failures + 1, now + min(interval * 2 ** failures, MAX_REFRESH_BACKOFF))
+            else:
+                self._failures.pop(key, None)
+
+    async def _refresh_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_due_tokens(interval)
+            except Exception as e:
+                print("Erreur dans la tâche de rafraîchissement des jetons :", e)
+
+    @asynccontextmanager
+    async def lifespan(self, app, interval: float = REFRESH_CHECK_INTERVAL):
+        """
+        Lifespan FastAPI: lance la tâche de rafraîchissement en arrière-plan.
+        Une seule tâche par processus, même si plusieurs applications l'utilisent.
+        """
+        if self._refresh_task is not None and not self._refresh_task.done():
+            yield
+            return
+        self._refresh_task = asyncio.create_task(self._refresh_loop(interval))
+        try:
+            yield
+        finally:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+
+def _rejected(error: TokenRefreshError) -> bool:
+    """La plateforme a refusé le rafraîchissement (4xx hors 429): inutile de réessayer."""
+    cause = error.__cause__
+    if isinstance(cause, httpx.HTTPStatusError):
+        return 400 <= cause.response.status_code < 500 and cause.response.status_code != 429
+    # Pas de refresher pour la plateforme, ou jeton effacé entre-temps
+    return cause is None
+
+
+# Instance partagée par toutes les applications du processus
+token_manager = TokenManager()
@@ -0,0 +1,250 @@
+"""
+Réception des webhooks Meta (pages Facebook, comptes Instagram).
+
+Meta envoie les changements (commentaires, publications, messages...) au lieu
+d'obliger l'application à interroger Graph à chaque affichage:
+
+- `GET /webhooks`: poignée de main d'abonnement (`hub.mode=subscribe`,
+  `hub.verify_token`), qui renvoie `hub.challenge`;
+- `POST /webhooks`: signature `X-Hub-Signature-256` (HMAC-SHA256 du corps brut
+  avec la clé secrète de l'application) vérifiée, puis le lot est mis en file
+  et acquitté aussitôt (200). Une file pleine répond 503: Meta renverra le lot.
+
+Les workers (WEBHOOK_WORKERS) découpent chaque lot en événements, les gardent
+par compte (les WEBHOOK_RECENT_EVENTS derniers, affichés par les pages) et
+appellent les fonctions abonnées, par exemple pour invalider un cache.
+
+Comme les tâches de publication TikTok, la file et les événements récents sont
+gardés en mémoire par le processus qui les a reçus.
+"""
+import asyncio
+import hashlib
+import hmac
+import inspect
+import os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Iterable, List, Optional, Set
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+
+from common import metrics
+from common.serialization import loads
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 2))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+RECENT_EVENTS = int(os.getenv("WEBHOOK_RECENT_EVENTS", 50))
+# Comptes dont les événements récents sont gardés; les moins actifs sont oubliés au-delà
+MAX_ACCOUNTS = 10000
+SIGNATURE_HEADER = "x-hub-signature-256"
+
+RECEIVED = metrics.Counter(
+    "webhook_deliveries_total", "Lots de webhooks reçus, par résultat.", ("app", "outcome"),
+)
+EVENTS = metrics.Counter(
+    "webhook_events_total", "Événements de webhooks traités.", ("app", "object", "field"),
+)
+HANDLER_ERRORS = metrics.Counter(
+    "webhook_handler_errors_total", "Erreurs des fonctions abonnées aux webhooks.", ("app", "field"),
+)
+QUEUE_DEPTH = metrics.Gauge(
+    "webhook_queue_depth", "Lots de webhooks en attente de traitement.", ("app",),
+)
+
+
+class WebhookQueueFull(Exception):
+    """File des webhooks pleine: le lot n'est pas accepté (Meta le renverra)."""
+
+
+def same_secret(expected: str, received: str) -> bool:
+    """
+    Comparaison en temps constant d'une valeur reçue. En octets: `compare_digest`
+    refuse les chaînes non ASCII (TypeError), qu'un client peut envoyer.
+    """
+    return hmac.compare_digest(expected.encode(), received.encode("utf-8", "surrogateescape"))
+
+
+def signature_valid(app_secret: Optional[str], body: bytes, header: Optional[str]) -> bool:
+    """`X-Hub-Signature-256: sha256=<hex>`, comparée en temps constant."""
+    if not app_secret or not header or not header.startswith("sha256="):
+        return False
+    expected = hmac.new(app_secret.encode(), body, hashlib.sha256).hexdigest()
+    return same_secret(expected, header[7:].strip().lower())
+
+
+@dataclass(slots=True)
+class WebhookEvent:
+    object: str  # "page" ou "instagram"
+    account_id: str  # page ou compte Instagram concerné (`entry.id`)
+    time: int  # secondes Unix
+    field: str  # "feed", "comments", "mentions", "messages"...
+    value: Any
+    # Résumé affichable: type d'élément, action et texte
+    item: Optional[str] = None
+    verb: Optional[str] = None
+    text: Optional[str] = None
+
+    @property
+    def when(self) -> str:
+        return datetime.fromtimestamp(self.time, timezone.utc).strftime("%d/%m/%Y %H:%M UTC")
+
+
+def _seconds(value) -> int:
+    value = int(value or 0)
+    # Les événements `messaging` sont datés en millisecondes
+    return value // 1000 if value > 10**11 else value
+
+
+def split_entries(payload: dict) -> List[WebhookEvent]:
+    """Événements d'un lot: `entry[].changes[]` et `entry[].messaging[]`."""
+    events = []
+    object_type = str(payload.get("object") or "")
+    for entry in payload.get("entry") or []:
+        account_id = str(entry.get("id") or "")
+        for change in entry.get("changes") or []:
+            value = change.get("value")
+            details = value if isinstance(value, dict) else {}
+            message = details.get("message")
+            events.append(WebhookEvent(
+                object_type, account_id, _seconds(entry.get("time")), str(change.get("field") or ""), value,
+                item=details.get("item"), verb=details.get("verb"),
+                text=message if isinstance(message, str) else details.get("text"),
+            ))
+        for message in entry.get("messaging") or []:
+            events.append(WebhookEvent(
+                object_type, account_id, _seconds(message.get("timestamp") or entry.get("time")), "messages",
+                message, item="message", text=(message.get("message") or {}).get("text"),
+            ))
+    return events
+
+
+class WebhookProcessor:
+    """File, workers et événements récents des webhooks d'une application (lifespan)."""
+
+    def __init__(self, app_name: str, workers: int = WEBHOOK_WORKERS, queue_size: int = WEBHOOK_QUEUE_SIZE,
+                 recent: int = RECENT_EVENTS):
+        self.app_name = app_name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.recent = recent
+        self._events: "OrderedDict[str, Deque[WebhookEvent]]" = OrderedDict()
+        self._handlers: List[Callable[[WebhookEvent], Any]] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def subscribe(self, handler: Callable[[WebhookEvent], Any]):
+        """Appelée pour chaque événement par les workers (fonction ou coroutine)."""
+        self._handlers.append(handler)
+        return handler
+
+    def submit(self, payload: dict):
+        """Met un lot en file; lève WebhookQueueFull si la file est pleine (ou les workers arrêtés)."""
+        if self._queue is None:
+            raise WebhookQueueFull("Les workers des webhooks ne sont pas démarrés.")
+        try:
+            self._queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            raise WebhookQueueFull("Trop de webhooks en attente.") from None
+        QUEUE_DEPTH.set(self._queue.qsize(), app=self.app_name)
+
+    def spawn(self, coroutine):
+        """Lance une tâche de fond (abonnement des pages...) annulée à l'arrêt de l'application."""
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def recent_events(self, account_ids: Iterable[str], limit: int = 20) -> List[WebhookEvent]:
+        """Derniers événements des comptes donnés, du plus récent au plus ancien."""
+        events = [event for account_id in account_ids for event in self._events.get(str(account_id), ())]
+        events.sort(key=lambda event: event.time, reverse=True)
+        return events[:limit]
+
+    def _remember(self, event: WebhookEvent):
+        events = self._events.get(event.account_id)
+        if events is None:
+            if len(self._events) >= MAX_ACCOUNTS:
+                self._events.popitem(last=False)
+            events = self._events[event.account_id] = deque(maxlen=self.recent)
+        else:
+            self._events.move_to_end(event.account_id)
+        events.appendleft(event)
+
+    async def process(self, payload: dict):
+        for event in split_entries(payload):
+            self._remember(event)
+            EVENTS.inc(app=self.app_name, object=event.object, field=event.field)
+            for handler in self._handlers:
+                # Lot déjà acquitté (Meta ne le renverra pas): une erreur n'arrête ni
+                # les autres fonctions abonnées, ni les événements suivants
+                try:
+                    result = handler(event)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    HANDLER_ERRORS.inc(app=self.app_name, field=event.field)
+                    print(f"Webhook {self.app_name} ({event.field}, compte {event.account_id}) :"
+                          f" {getattr(handler, '__name__', handler)} a échoué : {e}")
+
+    async def _worker(self):
+        queue = self._queue
+        while True:
+            payload = await queue.get()
+            try:
+                await self.process(payload)
+            except Exception as e:
+                print(f"Webhook {self.app_name} non traité : {e}")
+            finally:
+                queue.task_done()
+                QUEUE_DEPTH.set(queue.qsize(), app=self.app_name)
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        for _ in range(self.workers):
+            self.spawn(self._worker())
+        try:
+            yield
+        finally:
+            self._queue = None
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def add_webhook_routes(app, processor: WebhookProcessor, app_secret: Optional[str], verify_token: Optional[str],
+                       path: str = "/webhooks"):
+    """Ajoute la poignée de main (GET) et la réception signée (POST) à une application FastAPI."""
+
+    async def verify_subscription(request: Request):
+        params = request.query_params
+        if verify_token and params.get("hub.mode") == "subscribe" and same_secret(
+                verify_token, params.get("hub.verify_token", "")):
+            return PlainTextResponse(params.get("hub.challenge", ""))
+        return PlainTextResponse("Jeton de vérification invalide.", status_code=403)
+
+    async def receive_webhook(request: Request):
+        body = await request.body()
+        if not signature_valid(app_secret, body, request.headers.get(SIGNATURE_HEADER)):
+            RECEIVED.inc(app=processor.app_name, outcome="bad_signature")
+            return PlainTextResponse("Signature invalide.", status_code=403)
+        try:
+            payload = loads(body)
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            RECEIVED.inc(app=processor.app_name, outcome="invalid")
+            return PlainTextResponse("Corps invalide.", status_code=400)
+        try:
+            processor.submit(payload)
+        except WebhookQueueFull as e:
+            RECEIVED.inc(app=processor.app_name, outcome="queue_full")
+            return PlainTextResponse(str(e), status_code=503)
+        RECEIVED.inc(app=processor.app_name, outcome="accepted")
+        # Traitement hors de la requête: l'acquittement part tout de suite
+        return Response("EVENT_RECEIVED", media_type="text/plain")
+
+    app.add_api_route(path, verify_subscription, methods=["GET"], include_in_schema=False)
+    app.add_api_route(path, receive_webhook, methods=["POST"], include_in_schema=False)
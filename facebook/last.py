@@ -1,22 +1,60 @@
 # Importe les modules nécessaires de Flask pour créer l'application web
-from flask import Flask, request, render_template, redirect, url_for, flash, session
-# Importe la bibliothèque requests pour effectuer des requêtes HTTP vers l'API Facebook
-import requests
+from flask import Flask, request, render_template, redirect, url_for, flash, session, Response, stream_with_context
+# Importe httpx pour les erreurs des requêtes HTTP vers l'API Facebook
+import httpx
 # Importe le module os pour accéder aux variables d'environnement (utile pour la sécurité en production)
 import os
 # Importe json pour gérer les données JSON
 import json
+# Pool de threads partagé pour lancer les vérifications en parallèle
+from concurrent.futures import ThreadPoolExecutor, as_completed
+# Lecture des fichiers de jetons à auditer, empreinte des clés secrètes en cache
+import csv
+import hashlib
+import io
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+# Pools de connexions sortants partagés (appels mesurés, exposés sur /metrics)
+from common import http_client, metrics
+# Sous-requêtes batch de l'API Graph (audit des jetons par debug_token)
+from common.graph import MAX_BATCH_SIZE, GraphError, graph_request, parse_batch_response
+# Upload reprenable des vidéos locales (protocole upload_phase=start/transfer/finish)
+from facebook.resumable_upload import ResumableVideoUpload
 
 # Initialise l'application Flask
 app = Flask(__name__)
 # Configure une clé secrète pour les sessions Flask. C'est essentiel pour utiliser flash messages.
-# En production, utilisez une chaîne complexe générée aléatoirement et stockée en toute sécurité.
-app.secret_key = os.urandom(24)
+# En production, utilisez une chaîne complexe générée aléatoirement et stockée en toute sécurité
+# (FLASK_SECRET_KEY): elle est indispensable avec plusieurs processus.
+app.secret_key = os.getenv('FLASK_SECRET_KEY') or os.urandom(24)
+# Durée des requêtes par route et endpoint /metrics
+metrics.instrument_flask(app, "facebook_last")
 
 # Définition de la version de l'API Graph de Facebook à utiliser
 # Il est recommandé de spécifier la version pour assurer la compatibilité future.
 API_VERSION = "v19.0"
 
+# Vérifications lancées en parallèle par /test_facebook_api. Pool partagé par toutes les
+# requêtes: le nombre d'appels simultanés vers Graph reste borné.
+CHECK_WORKERS = int(os.getenv('FLASK_CHECK_WORKERS', 8))
+check_executor = ThreadPoolExecutor(max_workers=CHECK_WORKERS, thread_name_prefix='facebook-check')
+
+# Jetons d'application (client_credentials) gardés en cache: ils ne changent pas tant que
+# la clé secrète est la même, inutile d'en redemander un à chaque test ou audit
+APP_TOKEN_TTL = int(os.getenv('FB_APP_TOKEN_TTL', 3600))
+_app_tokens = {}
+_app_tokens_lock = threading.Lock()
+# Un jeton qui expire dans moins de AUDIT_EXPIRY_WARNING jours est signalé par l'audit
+AUDIT_EXPIRY_WARNING = int(os.getenv('FB_AUDIT_EXPIRY_WARNING_DAYS', 7))
+
+# Mode production (gunicorn, workers à threads): adresse, processus et threads par processus
+PRODUCTION_BIND = os.getenv('FLASK_BIND', '127.0.0.1:5000')
+PRODUCTION_WORKERS = int(os.getenv('WEB_CONCURRENCY', 1))
+PRODUCTION_THREADS = int(os.getenv('FLASK_THREADS', 8))
+
 @app.route('/', methods=['GET'])
 def index_v1():
     """
@@ -40,82 +78,117 @@ def index_v1():
                            last_page_id=last_page_id,
                            last_page_access_token=last_page_access_token)
 
-@app.route('/test_facebook_api', methods=['POST'])
-def test_facebook_api():
+class AppTokenError(Exception):
+    """Impossible d'obtenir un jeton d'accès d'application (identifiants refusés ou Graph injoignable)."""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+def get_app_access_token(app_id, app_secret, refresh=False):
     """
-    Route qui gère la soumission du formulaire et effectue les tests de l'API Facebook.
+    Jeton d'accès d'application (client_credentials), mis en cache par App ID et
+    empreinte de la clé secrète pendant APP_TOKEN_TTL secondes. `refresh` force
+    un nouveau jeton (jeton en cache refusé par Graph). Lève AppTokenError.
     """
-    # Récupère les données soumises via le formulaire
-    app_id = request.form.get('app_id')
-    app_secret = request.form.get('app_secret')
-    page_id = request.form.get('page_id')
-    page_access_token = request.form.get('page_access_token')
+    if not app_id or not app_secret:
+        raise AppTokenError("App ID et App Secret requis.")
+    key = (app_id, hashlib.sha256(app_secret.encode()).hexdigest())
+    with _app_tokens_lock:
+        cached = _app_tokens.get(key)
+        if cached and not refresh and cached[1] > time.monotonic():
+            return cached[0]
 
-    results = {}
-
-    # --- Test 1: Obtenir un jeton d'accès d'application (valide l'App ID et App Secret) ---
-    app_access_token_url = f"https://graph.facebook.com/oauth/access_token?client_id={app_id}&client_secret={app_secret}&grant_type=client_credentials"
+    app_access_token_url = "https://graph.facebook.com/oauth/access_token?" + urlencode({
+        'client_id': app_id, 'client_secret': app_secret, 'grant_type': 'client_credentials'})
     try:
         # Effectue la requête GET pour obtenir le jeton d'accès d'application
-        app_token_response = requests.get(app_access_token_url)
+        app_token_response = http_client.get_sync_client(app_access_token_url).get(app_access_token_url)
         app_token_response.raise_for_status() # Lève une exception pour les codes d'erreur HTTP (4xx ou 5xx)
         app_token_data = app_token_response.json()
+    except httpx.HTTPError as e:
+        raise AppTokenError(f"Erreur lors de la requête du jeton d'accès d'application : {e}", str(e)) from e
+    if 'access_token' not in app_token_data:
+        raise AppTokenError('Impossible d\'obtenir le jeton d\'accès d\'application.', app_token_data)
+
+    with _app_tokens_lock:
+        _app_tokens[key] = (app_token_data['access_token'], time.monotonic() + APP_TOKEN_TTL)
+    return app_token_data['access_token']
+
+def check_app_credentials(app_id, app_secret):
+    """
+    Test 1: Obtenir un jeton d'accès d'application (valide l'App ID et App Secret).
+    Exécuté dans le pool de vérifications: pas d'accès à la requête ni à la session.
+    """
+    try:
+        app_access_token = get_app_access_token(app_id, app_secret)
+    except AppTokenError as e:
+        return {
+            'status': 'FAILED' if isinstance(e.details, dict) else 'ERROR',
+            'message': str(e),
+            'details': e.details
+        }
+    return {
+        'status': 'SUCCESS',
+        'message': 'App ID et App Secret sont valides. Jeton d\'accès d\'application obtenu.',
+        'app_access_token': app_access_token
+    }
+
+def check_page_token(page_id, page_access_token):
+    """Test 2: Tester l'ID de Page et le Jeton d'Accès de Page (exécuté dans le pool de vérifications)."""
+    page_details_url = f"https://graph.facebook.com/{API_VERSION}/{page_id}?fields=id,name,category&access_token={page_access_token}"
+    try:
+        page_response = http_client.get_sync_client(page_details_url).get(page_details_url)
+        page_response.raise_for_status() # Lève une exception pour les codes d'erreur HTTP
+        page_data = page_response.json()
 
-        if 'access_token' in app_token_data:
-            app_access_token = app_token_data['access_token']
-            results['app_credentials_test'] = {
+        if 'id' in page_data and page_data['id'] == page_id:
+            return {
                 'status': 'SUCCESS',
-                'message': 'App ID et App Secret sont valides. Jeton d\'accès d\'application obtenu.',
-                'app_access_token': app_access_token
+                'message': f"Jeton d'accès de page et ID de page sont valides pour la page : {page_data.get('name', 'Nom inconnu')}",
+                'page_name': page_data.get('name'),
+                'page_category': page_data.get('category')
             }
-        else:
-            results['app_credentials_test'] = {
-                'status': 'FAILED',
-                'message': 'Impossible d\'obtenir le jeton d\'accès d\'application.',
-                'details': app_token_data
-            }
-    except requests.exceptions.RequestException as e:
-        results['app_credentials_test'] = {
+        return {
+            'status': 'FAILED',
+            'message': 'Jeton d\'accès de page ou ID de page invalide pour la page spécifiée.',
+            'details': page_data
+        }
+    except httpx.HTTPError as e:
+        return {
             'status': 'ERROR',
-            'message': f"Erreur lors de la requête du jeton d'accès d'application : {e}",
+            'message': f"Erreur lors de la requête des détails de la page : {e}",
             'details': str(e)
         }
 
-    # --- Test 2: Tester l'ID de Page et le Jeton d'Accès de Page (si fournis) ---
+@app.route('/test_facebook_api', methods=['POST'])
+def test_facebook_api():
+    """
+    Route qui gère la soumission du formulaire et effectue les tests de l'API Facebook.
+    Les tests sont indépendants et lancés en parallèle: la réponse attend le plus lent,
+    pas la somme des deux.
+    """
+    # Récupère les données soumises via le formulaire
+    app_id = request.form.get('app_id')
+    app_secret = request.form.get('app_secret')
+    page_id = request.form.get('page_id')
+    page_access_token = request.form.get('page_access_token')
+
+    checks = {'app_credentials_test': check_executor.submit(check_app_credentials, app_id, app_secret)}
     if page_id and page_access_token:
-        page_details_url = f"https://graph.facebook.com/{API_VERSION}/{page_id}?fields=id,name,category&access_token={page_access_token}"
-        try:
-            page_response = requests.get(page_details_url)
-            page_response.raise_for_status() # Lève une exception pour les codes d'erreur HTTP
-            page_data = page_response.json()
+        checks['page_token_test'] = check_executor.submit(check_page_token, page_id, page_access_token)
 
-            if 'id' in page_data and page_data['id'] == page_id:
-                results['page_token_test'] = {
-                    'status': 'SUCCESS',
-                    'message': f"Jeton d'accès de page et ID de page sont valides pour la page : {page_data.get('name', 'Nom inconnu')}",
-                    'page_name': page_data.get('name'),
-                    'page_category': page_data.get('category')
-                }
-                # Stocke l'ID de page et le jeton d'accès de page dans la session si le test est réussi
-                session['last_page_id'] = page_id
-                session['last_page_access_token'] = page_access_token
-            else:
-                results['page_token_test'] = {
-                    'status': 'FAILED',
-                    'message': 'Jeton d\'accès de page ou ID de page invalide pour la page spécifiée.',
-                    'details': page_data
-                }
-        except requests.exceptions.RequestException as e:
-            results['page_token_test'] = {
-                'status': 'ERROR',
-                'message': f"Erreur lors de la requête des détails de la page : {e}",
-                'details': str(e)
-            }
-    else:
+    results = {name: future.result() for name, future in checks.items()}
+    if 'page_token_test' not in results:
         results['page_token_test'] = {
             'status': 'SKIPPED',
             'message': 'Test du jeton d\'accès de page ignoré (ID de page ou jeton non fourni).'
         }
+    elif results['page_token_test']['status'] == 'SUCCESS':
+        # Stocke l'ID de page et le jeton d'accès de page dans la session si le test est réussi
+        session['last_page_id'] = page_id
+        session['last_page_access_token'] = page_access_token
 
     # Stocke les résultats dans la session pour les afficher sur la page d'accueil
     session['test_results'] = results
@@ -132,6 +205,7 @@ def publish_post():
     post_type = request.form.get('post_type')
     message_content = request.form.get('message_content')
     media_url = request.form.get('media_url') # Pour les images/vidéos
+    video_file = request.files.get('video_file') # Vidéo locale, envoyée par morceaux
 
     publish_results = {}
 
@@ -171,6 +245,24 @@ def publish_post():
                 params['url'] = media_url
                 if message_content: # La légende est facultative pour les images
                     params['caption'] = message_content
+        elif post_type == 'video' and video_file and video_file.filename:
+            # Vidéo locale: upload reprenable, lu sur disque morceau par morceau
+            try:
+                upload = ResumableVideoUpload(page_id, page_access_token, video_file.stream,
+                                              description=message_content, api_version=API_VERSION)
+                response_data = upload.run()
+                publish_results = {
+                    'status': 'SUCCESS',
+                    'message': 'Vidéo envoyée avec succès !',
+                    'post_id': response_data.get('video_id'),
+                    'details': response_data
+                }
+            except Exception as e:
+                publish_results = {
+                    'status': 'ERROR',
+                    'message': f"Erreur lors de l'envoi de la vidéo : {e}",
+                    'details': getattr(e, 'payload', None) or str(e)
+                }
         elif post_type == 'video':
             if not media_url:
                 publish_results = {
@@ -191,7 +283,8 @@ def publish_post():
                 # Effectue la requête POST vers l'API Graph de Facebook
                 # Utilise data=params pour les publications de texte, files={'source': (None, open(path, 'rb'))} pour les fichiers
                 # ou data=params pour les URLs de médias
-                response = requests.post(api_url, data=params)
+                response = http_client.get_sync_client(api_url).post(api_url, data=params,
+                                                                  extensions={'graph_token': page_access_token})
                 response.raise_for_status() # Lève une exception pour les codes d'erreur HTTP
 
                 response_data = response.json()
@@ -208,13 +301,13 @@ def publish_post():
                         'message': 'Publication échouée ou réponse inattendue.',
                         'details': response_data
                     }
-            except requests.exceptions.RequestException as e:
+            except httpx.HTTPError as e:
                 publish_results = {
                     'status': 'ERROR',
                     'message': f"Erreur lors de l'envoi de la publication : {e}",
                     'details': str(e)
                 }
-        else:
+        elif not publish_results:
             publish_results = {
                 'status': 'FAILED',
                 'message': 'Type de publication non valide ou paramètres manquants.',
@@ -227,8 +320,216 @@ def publish_post():
     return redirect(url_for('index_v1'))
 
 
+# --- Audit des jetons de page ---
+
+def read_token_rows(text):
+    """
+    Lit le fichier de jetons à auditer: CSV avec en-tête (colonnes `page_id` et
+    `access_token` ou `page_access_token`) ou JSON Lines (un objet par ligne).
+    """
+    stripped = text.lstrip('\ufeff').strip()
+    if stripped.startswith('{'):
+        records = [json.loads(line) for line in stripped.splitlines() if line.strip()]
+    else:
+        records = list(csv.DictReader(io.StringIO(stripped)))
+    return [{
+        'page_id': str(record.get('page_id') or '').strip(),
+        'access_token': str(record.get('access_token') or record.get('page_access_token') or '').strip(),
+    } for record in records]
+
+def mask_token(token):
+    """Jeton affiché dans les résultats: début et fin seulement."""
+    return f"{token[:6]}…{token[-4:]}" if len(token) > 12 else '…'
+
+def _timestamp(value):
+    """Date d'expiration Graph (secondes Unix, 0 pour un jeton sans expiration)."""
+    if not value:
+        return 'never'
+    return datetime.fromtimestamp(value, tz=timezone.utc).isoformat()
+
+def describe_token(index, row, data=None, error=None):
+    """Ligne de résultat de l'audit pour un jeton (réponse de debug_token ou erreur)."""
+    result = {
+        'row': index,
+        'page_id': row['page_id'],
+        'token': mask_token(row['access_token']),
+    }
+    if error is not None:
+        result.update({'is_valid': False, 'error': error})
+        return result
+    expires_at = data.get('expires_at') or 0
+    result.update({
+        'is_valid': bool(data.get('is_valid')),
+        'type': data.get('type'),
+        'profile_id': data.get('profile_id'),
+        'matches_page': not row['page_id'] or data.get('profile_id') == row['page_id'],
+        'expires_at': _timestamp(expires_at),
+        'expires_soon': bool(expires_at) and expires_at - time.time() < AUDIT_EXPIRY_WARNING * 86400,
+        'data_access_expires_at': _timestamp(data.get('data_access_expires_at')),
+        'scopes': data.get('scopes', []),
+        'error': (data.get('error') or {}).get('message'),
+    })
+    return result
+
+def debug_token_batch(app_access_token, rows):
+    """
+    Inspecte jusqu'à MAX_BATCH_SIZE jetons en un seul appel batch à `debug_token`,
+    authentifié par le jeton d'application. Renvoie un corps décodé ou une
+    GraphError par jeton, dans l'ordre; lève GraphError si le batch est refusé.
+    """
+    batch_url = f"https://graph.facebook.com/{API_VERSION}/"
+    batch = [graph_request('GET', 'debug_token?' + urlencode({'input_token': row['access_token']}))
+             for row in rows]
+    # Simple lecture: le batch peut être renvoyé sans risque en cas d'erreur temporaire
+    response = http_client.get_sync_client(batch_url).post(batch_url, data={
+        'access_token': app_access_token,
+        'batch': json.dumps(batch),
+        'include_headers': 'false',
+    }, extensions={'graph_token': app_access_token, 'idempotent': True})
+    try:
+        payload = response.json()
+    except ValueError:
+        payload = response.text
+    if response.status_code != 200 or not isinstance(payload, list):
+        raise GraphError.from_payload(payload, status=response.status_code)
+    return parse_batch_response(payload)
+
+def audit_token_group(app_id, app_secret, group):
+    """Audite un groupe de (rang, ligne); un jeton d'application refusé (code 190) est renouvelé une fois."""
+    rows = [row for _, row in group]
+    try:
+        try:
+            results = debug_token_batch(get_app_access_token(app_id, app_secret), rows)
+        except GraphError as e:
+            if e.code != 190:
+                raise
+            results = debug_token_batch(get_app_access_token(app_id, app_secret, refresh=True), rows)
+    except (GraphError, AppTokenError, httpx.HTTPError) as e:
+        return [describe_token(index, row, error=str(e)) for index, row in group]
+    return [
+        describe_token(index, row, error=str(result)) if isinstance(result, GraphError)
+        else describe_token(index, row, data=(result or {}).get('data', {}))
+        for (index, row), result in zip(group, results)
+    ]
+
+def audit_tokens(app_id, app_secret, rows):
+    """
+    Audite tous les jetons en batchs de MAX_BATCH_SIZE, lancés en parallèle dans le
+    pool de vérifications, et produit chaque résultat dès que son batch répond,
+    puis une ligne de synthèse. Le jeton d'application est obtenu (ou lu en cache)
+    une seule fois avant: des identifiants refusés lèvent AppTokenError.
+    """
+    get_app_access_token(app_id, app_secret)
+    summary = {'total': len(rows), 'valid': 0, 'invalid': 0, 'expires_soon': 0}
+    pending = []
+    checkable = []
+    for index, row in enumerate(rows, start=1):
+        if row['access_token']:
+            checkable.append((index, row))
+        else:
+            pending.append(describe_token(index, row, error='Jeton manquant.'))
+    futures = [check_executor.submit(audit_token_group, app_id, app_secret, checkable[i:i + MAX_BATCH_SIZE])
+               for i in range(0, len(checkable), MAX_BATCH_SIZE)]
+
+    def completed_groups():
+        yield pending
+        # Chaque batch est produit dès sa réponse, sans attendre les plus lents
+        for future in as_completed(futures):
+            yield future.result()
+
+    for results in completed_groups():
+        for result in results:
+            valid = result['is_valid'] and result.get('matches_page', True)
+            summary['valid' if valid else 'invalid'] += 1
+            summary['expires_soon'] += bool(result.get('expires_soon'))
+            yield result
+    yield {'summary': summary}
+
+@app.route('/audit_tokens', methods=['POST'])
+def audit_tokens_route():
+    """
+    Audit en masse des jetons de page d'un fichier (voir `read_token_rows`).
+    Les résultats sont envoyés au fil de l'eau, un objet JSON par ligne (NDJSON).
+    """
+    app_id = request.form.get('app_id')
+    app_secret = request.form.get('app_secret')
+    tokens_file = request.files.get('tokens_file')
+    if not app_id or not app_secret or not tokens_file:
+        return {'error': 'App ID, App Secret et fichier de jetons requis.'}, 400
+    try:
+        rows = read_token_rows(tokens_file.read().decode('utf-8'))
+        results = audit_tokens(app_id, app_secret, rows)
+        # Premier résultat calculé ici: des identifiants refusés donnent une erreur 400, pas un flux vide
+        first = next(results)
+    except (ValueError, csv.Error) as e:
+        return {'error': f"Fichier de jetons illisible : {e}"}, 400
+    except AppTokenError as e:
+        return {'error': str(e), 'details': e.details}, 400
+
+    def stream():
+        yield json.dumps(first) + '\n'
+        for result in results:
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+
+def run_production(bind=PRODUCTION_BIND, workers=PRODUCTION_WORKERS, threads=PRODUCTION_THREADS):
+    """
+    Sert l'application avec gunicorn (workers `gthread`): chaque processus traite
+    `threads` requêtes à la fois et partage les pools de connexions sortants.
+    """
+    # gunicorn n'est importé qu'en production (non disponible sous Windows)
+    from gunicorn.app.base import BaseApplication
+
+    if workers > 1 and not os.getenv('FLASK_SECRET_KEY'):
+        raise ValueError("Définissez FLASK_SECRET_KEY pour servir l'application avec plusieurs processus.")
+
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            for key, value in {'bind': bind, 'workers': workers, 'threads': threads,
+                               'worker_class': 'gthread'}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    ProductionServer().run()
+
+
 # Point d'entrée de l'application Flask
 if __name__ == '__main__':
-    # Lance l'application en mode débogage (ne pas utiliser en production)
-    # Pour une utilisation publique, vous devriez configurer un serveur WSGI comme Gunicorn ou Waitress.
-    app.run(debug=True)
+    # Mode production: python -m facebook.last --production (ou ENVIRONMENT=production)
+    import argparse
+    parser = argparse.ArgumentParser(description="Application de diagnostic de l'API Facebook")
+    parser.add_argument('--production', action='store_true', help="sert l'application avec gunicorn (threads)")
+    parser.add_argument('--bind', default=PRODUCTION_BIND)
+    parser.add_argument('--workers', type=int, default=PRODUCTION_WORKERS)
+    parser.add_argument('--threads', type=int, default=PRODUCTION_THREADS)
+    # Audit en masse sans serveur (tâche planifiée): python -m facebook.last --audit jetons.csv
+    parser.add_argument('--audit', metavar='FICHIER', help="audite les jetons de page du fichier (CSV ou JSON Lines)")
+    parser.add_argument('--app-id', default=os.getenv('FB_APP_ID'))
+    parser.add_argument('--app-secret', default=os.getenv('FB_APP_SECRET'))
+    parser.add_argument('--output', help="fichier de résultats NDJSON (sortie standard par défaut)")
+    args = parser.parse_args()
+    if args.audit:
+        import sys
+        if not args.app_id or not args.app_secret:
+            parser.error("--app-id et --app-secret (ou FB_APP_ID et FB_APP_SECRET) sont requis pour l'audit")
+        with open(args.audit, encoding='utf-8') as f:
+            rows = read_token_rows(f.read())
+        output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            for result in audit_tokens(args.app_id, args.app_secret, rows):
+                output.write(json.dumps(result, ensure_ascii=False) + '\n')
+                output.flush()
+        except AppTokenError as e:
+            sys.exit(str(e))
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    elif args.production or os.getenv('ENVIRONMENT') == 'production':
+        run_production(args.bind, args.workers, args.threads)
+    else:
+        # Lance l'application en mode débogage (ne pas utiliser en production)
+        app.run(debug=True)
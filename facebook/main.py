@@ -1,13 +1,26 @@
 # main.py
+import asyncio
 import os
-import requests
 import json
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
 from dotenv import load_dotenv
 
-from fastapi import FastAPI, Request, Depends, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from starlette.middleware.sessions import SessionMiddleware
+from fastapi import FastAPI, Request, Depends, Form, HTTPException, UploadFile, File
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from common import http_client, metrics
+from common.graph import GraphClient, GraphError, graph_request
+from common.lifespan import combine_lifespans
+from common.sessions import ServerSideSessionMiddleware
+from common.templating import LazyTemplates
+from common.tokens import TokenRecord, TokenRefreshError, token_manager
+from common.webhooks import WebhookProcessor, add_webhook_routes
+from facebook.resumable_upload import ResumableVideoUpload
 
 # --- Configuration Initiale ---
 load_dotenv()  # Charge les variables depuis le fichier .env
@@ -22,12 +35,37 @@ API_VERSION = "v23.0"
 # Section "Connexion Facebook" -> "Paramètres" -> "URI de redirection OAuth valides"
 # Exemple : http://127.0.0.1:8000/auth/facebook/callback
 # REDIRECT_URI = "https://seneinnov.com/test.html"
-REDIRECT_URI = "https://dev.mon-app.com/auth/facebook/callback"
+REDIRECT_URI = os.getenv("FB_REDIRECT_URI", "https://dev.mon-app.com/auth/facebook/callback")
+TOKEN_URL = f"https://graph.facebook.com/{API_VERSION}/oauth/access_token"
+
+# Nombre maximal de publications simultanées pour /publish/bulk
+BULK_PUBLISH_CONCURRENCY = int(os.getenv("BULK_PUBLISH_CONCURRENCY", 10))
+
+# Webhooks des pages: jeton choisi lors de l'abonnement dans le tableau de bord Meta
+FB_WEBHOOK_VERIFY_TOKEN = os.getenv("FB_WEBHOOK_VERIFY_TOKEN")
+# Champs des pages envoyés par webhook (abonnement fait à la première lecture des pages)
+PAGE_SUBSCRIBED_FIELDS = os.getenv("FB_PAGE_SUBSCRIBED_FIELDS", "feed,messages")
+# Durée (secondes) pendant laquelle le profil et les pages gardés en session sont réaffichés
+# sans appel Graph; les nouveautés des pages arrivent par webhook. `/?refresh=1` force la relecture.
+PROFILE_CACHE_TTL = int(os.getenv("FB_PROFILE_CACHE_TTL", 3600))
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# Lots de webhooks traités hors des requêtes
+webhooks = WebhookProcessor("facebook")
+# Pages déjà abonnées aux webhooks par ce processus
+_subscribed_pages = set()
 
 # Initialisation de FastAPI
-app = FastAPI()
-app.add_middleware(SessionMiddleware, secret_key=APP_SECRET_KEY)
-templates = Jinja2Templates(directory="templates")
+app = FastAPI(lifespan=combine_lifespans(http_client.lifespan, token_manager.lifespan, webhooks.lifespan))
+# Sessions côté serveur: la liste des pages et leurs jetons ne transitent plus dans le cookie
+app.add_middleware(ServerSideSessionMiddleware, secret_key=APP_SECRET_KEY)
+# Endpoint /metrics et durée des requêtes par route (ajouté en dernier: mesure aussi les sessions)
+metrics.instrument(app, "facebook")
+# Environnement Jinja construit au premier rendu (démarrage plus rapide)
+templates = LazyTemplates(directory=BASE_DIR / "templates")
+# GET /webhooks (vérification) et POST /webhooks (signé avec FB_APP_SECRET)
+add_webhook_routes(app, webhooks, FB_APP_SECRET, FB_WEBHOOK_VERIFY_TOKEN)
 
 
 # --- Routes d'Authentification OAuth2 ---
@@ -43,49 +81,129 @@ def login_facebook():
     return RedirectResponse(url=auth_url)
 
 
+async def exchange_long_lived_token(access_token: str) -> dict:
+    """Échange un jeton utilisateur contre un jeton longue durée (~60 jours)."""
+    response = await http_client.get(TOKEN_URL, params={
+        "grant_type": "fb_exchange_token",
+        "client_id": FB_APP_ID,
+        "client_secret": FB_APP_SECRET,
+        "fb_exchange_token": access_token,
+    })
+    response.raise_for_status()
+    return response.json()
+
+
+async def refresh_facebook_token(record: TokenRecord) -> TokenRecord:
+    """Renouvelle le jeton longue durée tant qu'il est encore valide."""
+    return TokenRecord.from_response("facebook", await exchange_long_lived_token(record.access_token),
+                                     previous=record)
+
+token_manager.register_refresher("facebook", refresh_facebook_token, margin=7 * 24 * 3600)
+
+
 @app.get("/auth/facebook/callback")
-def auth_facebook_callback(request: Request, code: str):
+async def auth_facebook_callback(request: Request, code: str):
     """
     Callback de Facebook après authentifica tion.
     Échange le code d'autorisation contre un jeton d'accès utilisateur.
     """
-    # Échange du code contre un jeton d'accès
-    token_url = (f"https://graph.facebook.com/{API_VERSION}/oauth/access_token?"
-                 f"client_id={FB_APP_ID}&"
-                 f"redirect_uri={REDIRECT_URI}&"
-                 f"client_secret={FB_APP_SECRET}&"
-                 f"code={code}")
-    
-    response = requests.get(token_url)
-    response_data = response.json()
-
-    if 'access_token' in response_data:
-        # Stocke le jeton d'accès utilisateur dans la session
-        request.session['user_access_token'] = response_data['access_token']
-    else:
+    try:
+        # Échange du code contre un jeton d'accès
+        response = await http_client.get(TOKEN_URL, params={
+            "client_id": FB_APP_ID,
+            "redirect_uri": REDIRECT_URI,
+            "client_secret": FB_APP_SECRET,
+            "code": code,
+        })
+        response.raise_for_status()
+        # Le jeton court (1-2 h) est aussitôt échangé contre un jeton longue durée
+        response_data = await exchange_long_lived_token(response.json()['access_token'])
+        # Le jeton reste côté serveur; la session ne garde que sa clé
+        request.session['token_key'] = await token_manager.save(
+            TokenRecord.from_response("facebook", response_data)
+        )
+        # Nouveau jeton: profil et pages relus au prochain affichage
+        request.session.pop('profile_loaded_at', None)
+    except (httpx.HTTPError, KeyError) as e:
         # Gérer l'erreur (par exemple, afficher un message d'erreur)
-        print("Erreur d'authentification:", response_data)
+        print("Erreur d'authentification:", http_client.error_details(e))
 
     return RedirectResponse(url="/")
 
 
 @app.get("/logout")
-def logout(request: Request):
+async def logout(request: Request):
     """Déconnecte l'utilisateur en vidant la session."""
+    await token_manager.forget(request.session.get('token_key'))
     request.session.clear()
     return RedirectResponse(url="/")
 
 
 # --- Routes Principales de l'Application ---
 
+async def subscribe_page(page_id: str, page_access_token: str):
+    """Abonne l'application aux webhooks d'une page (une fois par processus)."""
+    graph = GraphClient(page_access_token, api_version=API_VERSION)
+    try:
+        await graph.post(f"{page_id}/subscribed_apps", {"subscribed_fields": PAGE_SUBSCRIBED_FIELDS})
+    except (GraphError, httpx.HTTPError) as e:
+        # Nouvel essai au prochain chargement des pages
+        _subscribed_pages.discard(page_id)
+        print(f"Abonnement aux webhooks de la page {page_id} impossible :", e)
+
+
+def subscribe_pages(pages: list):
+    for page in pages:
+        if page.get('id') and page.get('access_token') and page['id'] not in _subscribed_pages:
+            _subscribed_pages.add(page['id'])
+            webhooks.spawn(subscribe_page(page['id'], page['access_token']))
+
+
+async def load_profile(request: Request, user_access_token: str, refresh: bool = False):
+    """
+    Infos de l'utilisateur et pages gérées, gardées en session PROFILE_CACHE_TTL secondes.
+    Renvoie (None, []) si Graph ne répond pas.
+    """
+    session = request.session
+    if not refresh and session.get('user_info') and time.time() - session.get('profile_loaded_at', 0) < PROFILE_CACHE_TTL:
+        return session['user_info'], session.get('pages', [])
+
+    # Infos de l'utilisateur (nom, photo) et pages gérées en un seul aller-retour
+    graph = GraphClient(user_access_token, api_version=API_VERSION)
+    try:
+        user_result, pages_result = await graph.batch([
+            graph_request("GET", "me?fields=name,picture"),
+            graph_request("GET", "me/accounts?fields=name,access_token"),
+        ])
+    except (GraphError, httpx.HTTPError) as e:
+        print("Erreur Graph:", e)
+        user_result = pages_result = None
+
+    user_info = user_result if isinstance(user_result, dict) else None
+    pages = []
+    if isinstance(pages_result, dict):
+        pages = pages_result.get("data", [])
+        # Stocke les pages en session pour ne pas avoir à les redemander
+        session['pages'] = pages
+        subscribe_pages(pages)
+    if user_info and isinstance(pages_result, dict):
+        session['user_info'] = user_info
+        session['profile_loaded_at'] = time.time()
+    return user_info, pages
+
+
 @app.get("/", response_class=HTMLResponse)
-def read_root(request: Request):
+async def read_root(request: Request, refresh: bool = False):
     """
     Affiche la page principale.
-    - Si l'utilisateur est connecté, récupère ses infos et ses pages.
+    - Si l'utilisateur est connecté, affiche ses infos, ses pages et leurs derniers
+      événements reçus par webhook.
     - Sinon, affiche le bouton de connexion.
     """
-    user_access_token = request.session.get('user_access_token')
+    try:
+        user_access_token = await token_manager.get_valid_token(request.session.get('token_key'))
+    except TokenRefreshError:
+        user_access_token = None
     user_info = None
     pages = []
     
@@ -93,24 +211,15 @@ def read_root(request: Request):
     publish_result = request.session.pop('publish_result', None)
 
     if user_access_token:
-        # Récupère les informations de l'utilisateur (nom, photo)
-        user_url = f"https://graph.facebook.com/me?fields=name,picture&access_token={user_access_token}"
-        user_response = requests.get(user_url)
-        if user_response.status_code == 200:
-            user_info = user_response.json()
-        
-        # Récupère les pages gérées par l'utilisateur
-        pages_url = f"https://graph.facebook.com/me/accounts?fields=name,access_token&access_token={user_access_token}"
-        pages_response = requests.get(pages_url)
-        if pages_response.status_code == 200:
-            pages = pages_response.json().get("data", [])
-            # Stocke les pages en session pour ne pas avoir à les redemander
-            request.session['pages'] = pages
+        user_info, pages = await load_profile(request, user_access_token, refresh=refresh)
 
+    page_names = {page['id']: page.get('name') for page in pages}
     return templates.TemplateResponse("index.html", {
         "request": request, 
         "user": user_info, 
         "pages": pages,
+        "page_names": page_names,
+        "page_events": webhooks.recent_events(page_names),
         "publish_result": publish_result
     })
 
@@ -125,23 +234,47 @@ def show_policy(request: Request):
     """Affiche la page de politique de confidentialité."""
     return templates.TemplateResponse("policy.html", {"request": request})
 
+def build_publication(post_type: str, message_content: Optional[str], media_url: Optional[str]):
+    """Retourne l'arête Graph (feed, photos, videos) et les paramètres d'une publication."""
+    if post_type == 'text':
+        return "feed", {'message': message_content}
+    if post_type == 'image':
+        params = {'url': media_url}
+        if message_content: params['caption'] = message_content
+        return "photos", params
+    if post_type == 'video':
+        params = {'file_url': media_url}
+        if message_content: params['description'] = message_content
+        return "videos", params
+    raise ValueError(f"Type de publication inconnu : {post_type}")
+
+
+async def publish_to_graph(page_id: str, page_access_token: str, edge: str, params: dict) -> dict:
+    """Publie sur une page et renvoie la réponse Graph (lève GraphError / httpx.HTTPError)."""
+    graph = GraphClient(page_access_token, api_version=API_VERSION)
+    return await graph.post(f"{page_id}/{edge}", params)
+
+
+def get_page_tokens(request: Request) -> dict:
+    """Jetons d'accès des pages de l'utilisateur, indexés par ID de page."""
+    return {page['id']: page['access_token'] for page in request.session.get('pages', [])}
+
+
 @app.post("/publish")
-def publish_to_page(
+async def publish_to_page(
     request: Request,
     page_id: str = Form(...),
     post_type: str = Form(...),
     message_content: str = Form(None),
-    media_url: str = Form(None)
+    media_url: str = Form(None),
+    video_file: UploadFile = File(None)
 ):
-    """Gère la publication sur la page Facebook sélectionnée."""
-    pages = request.session.get('pages', [])
-    page_access_token = None
-
+    """
+    Gère la publication sur la page Facebook sélectionnée.
+    Une vidéo envoyée depuis le poste de l'utilisateur passe par l'upload reprenable.
+    """
     # Trouve le jeton d'accès spécifique à la page sélectionnée (sécurité)
-    for page in pages:
-        if page['id'] == page_id:
-            page_access_token = page['access_token']
-            break
+    page_access_token = get_page_tokens(request).get(page_id)
 
     if not page_access_token:
         request.session['publish_result'] = {
@@ -150,35 +283,25 @@ def publish_to_page(
         }
         return RedirectResponse(url="/", status_code=303)
 
-    # Construction de la requête de publication
-    api_url = f"https://graph.facebook.com/{API_VERSION}/{page_id}/"
-    params = {'access_token': page_access_token}
-
-    if post_type == 'text':
-        api_url += "feed"
-        params['message'] = message_content
-    elif post_type == 'image':
-        api_url += "photos"
-        params['url'] = media_url
-        if message_content: params['caption'] = message_content
-    elif post_type == 'video':
-        api_url += "videos"
-        params['file_url'] = media_url
-        if message_content: params['description'] = message_content
-    
     publish_result = {}
     try:
-        response = requests.post(api_url, data=params)
-        response.raise_for_status() # Lève une exception pour les codes d'erreur HTTP
-        response_data = response.json()
+        if post_type == 'video' and video_file and video_file.filename:
+            # Upload long et lu sur disque: exécuté dans un thread pour ne pas bloquer la boucle
+            upload = ResumableVideoUpload(page_id, page_access_token, video_file.file, video_file.size,
+                                          description=message_content, api_version=API_VERSION)
+            response_data = await run_in_threadpool(upload.run)
+            response_data.setdefault('id', response_data.get('video_id'))
+        else:
+            edge, params = build_publication(post_type, message_content, media_url)
+            response_data = await publish_to_graph(page_id, page_access_token, edge, params)
         
         publish_result = {
             'status': 'SUCCESS',
             'message': f'Publication réussie sur la page ! Post ID: {response_data.get("id")}',
             'details': json.dumps(response_data, indent=2)
         }
-    except requests.exceptions.RequestException as e:
-        error_details = e.response.json() if e.response else str(e)
+    except (GraphError, httpx.HTTPError, ValueError) as e:
+        error_details = getattr(e, 'payload', None) or str(e)
         publish_result = {
             'status': 'ERROR',
             'message': f"Échec de la publication : {e}",
@@ -190,6 +313,55 @@ def publish_to_page(
     return RedirectResponse(url="/", status_code=303)
 
 
+@app.post("/publish/bulk")
+async def publish_to_pages(
+    request: Request,
+    page_ids: List[str] = Form(...),
+    post_type: str = Form(...),
+    message_content: str = Form(None),
+    media_url: str = Form(None)
+):
+    """
+    Publie le même contenu sur plusieurs pages en parallèle (au plus
+    BULK_PUBLISH_CONCURRENCY à la fois). Le résultat de chaque page est renvoyé
+    en NDJSON dès qu'il est connu, succès comme échec.
+    """
+    page_tokens = get_page_tokens(request)
+    if not page_tokens:
+        raise HTTPException(status_code=401, detail="Aucune page en session. Veuillez vous connecter.")
+    try:
+        edge, params = build_publication(post_type, message_content, media_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    semaphore = asyncio.Semaphore(BULK_PUBLISH_CONCURRENCY)
+
+    async def publish_one(page_id: str) -> dict:
+        page_access_token = page_tokens.get(page_id)
+        if not page_access_token:
+            return {'page_id': page_id, 'status': 'ERROR', 'message': 'Page non valide ou permission manquante.'}
+        async with semaphore:
+            try:
+                response_data = await publish_to_graph(page_id, page_access_token, edge, params)
+            except (GraphError, httpx.HTTPError) as e:
+                return {'page_id': page_id, 'status': 'ERROR', 'message': str(e),
+                        'details': getattr(e, 'payload', None)}
+        return {'page_id': page_id, 'status': 'SUCCESS', 'post_id': response_data.get('id'), 'details': response_data}
+
+    async def stream_results():
+        # dict.fromkeys: supprime les doublons en gardant l'ordre
+        tasks = [asyncio.ensure_future(publish_one(page_id)) for page_id in dict.fromkeys(page_ids)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result) + "\n"
+        finally:
+            # Client déconnecté: on n'entame pas les publications restantes
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
 # Point d'entrée pour lancer le serveur
 if __name__ == '__main__':
     import uvicorn
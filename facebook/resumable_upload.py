@@ -0,0 +1,173 @@
+"""
+Upload reprenable d'une vidéo locale vers une page Facebook.
+
+Implémente le protocole Graph `upload_phase=start/transfer/finish`: la vidéo est
+lue sur disque morceau par morceau (Graph fixe la taille de chaque morceau via
+start_offset/end_offset), un seul morceau est en mémoire à la fois, et un
+transfert qui échoue reprend au dernier offset acquitté au lieu de repartir de zéro.
+
+Avec `state_path`, l'état de la session d'upload est enregistré après chaque
+morceau: un processus relancé reprend là où le précédent s'était arrêté.
+
+Utilisation en ligne de commande (depuis la racine du dépôt):
+    PAGE_ACCESS_TOKEN=... python -m facebook.resumable_upload PAGE_ID video.mp4
+"""
+import json
+import os
+import sys
+import time
+from typing import BinaryIO, Optional
+
+import httpx
+
+from common import http_client
+from common.graph import API_VERSION, GraphError
+
+GRAPH_VIDEO_URL = "https://graph-video.facebook.com"
+MAX_TRANSFER_RETRIES = 5
+RETRY_BACKOFF_SECONDS = 2.0
+
+
+class ResumableVideoUpload:
+    """Session d'upload d'une vidéo vers `/{page_id}/videos`."""
+
+    def __init__(self, page_id: str, access_token: str, fileobj: BinaryIO, file_size: Optional[int] = None,
+                 title: Optional[str] = None, description: Optional[str] = None,
+                 state_path: Optional[str] = None, api_version: str = API_VERSION,
+                 base_url: str = GRAPH_VIDEO_URL):
+        self.access_token = access_token
+        self.fileobj = fileobj
+        if file_size is None:
+            fileobj.seek(0, os.SEEK_END)
+            file_size = fileobj.tell()
+        self.file_size = file_size
+        self.title = title
+        self.description = description
+        self.state_path = state_path
+        self.url = f"{base_url}/{api_version}/{page_id}/videos"
+        self.state = None
+
+    # --- Appels Graph ---
+
+    def _post(self, data: dict, files: Optional[dict] = None) -> dict:
+        client = http_client.get_sync_client(self.url)
+        response = client.post(self.url, data={**data, 'access_token': self.access_token}, files=files,
+                               extensions={'graph_token': self.access_token})
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = response.text
+        if response.status_code != 200 or isinstance(payload, dict) and "error" in payload:
+            raise GraphError.from_payload(payload, status=response.status_code)
+        return payload
+
+    def start(self) -> dict:
+        """Phase start: Graph renvoie la session d'upload et le premier morceau attendu."""
+        response = self._post({'upload_phase': 'start', 'file_size': self.file_size})
+        self.state = {
+            'upload_session_id': response['upload_session_id'],
+            'video_id': response['video_id'],
+            'start_offset': int(response['start_offset']),
+            'end_offset': int(response['end_offset']),
+            'file_size': self.file_size,
+        }
+        self._save_state()
+        return self.state
+
+    def transfer_chunk(self) -> None:
+        """Envoie le morceau [start_offset, end_offset) et avance aux offsets acquittés par Graph."""
+        start_offset, end_offset = self.state['start_offset'], self.state['end_offset']
+        self.fileobj.seek(start_offset)
+        chunk = self.fileobj.read(end_offset - start_offset)
+        response = self._post(
+            {
+                'upload_phase': 'transfer',
+                'upload_session_id': self.state['upload_session_id'],
+                'start_offset': start_offset,
+            },
+            files={'video_file_chunk': ('chunk', chunk, 'application/octet-stream')},
+        )
+        self.state['start_offset'] = int(response['start_offset'])
+        self.state['end_offset'] = int(response['end_offset'])
+        self._save_state()
+
+    def finish(self) -> dict:
+        data = {'upload_phase': 'finish', 'upload_session_id': self.state['upload_session_id']}
+        if self.title:
+            data['title'] = self.title
+        if self.description:
+            data['description'] = self.description
+        response = self._post(data)
+        self._clear_state()
+        return {**response, 'video_id': self.state['video_id']}
+
+    # --- Reprise ---
+
+    def _resync_offsets(self, error: GraphError) -> bool:
+        """Graph indique parfois les offsets attendus dans `error_data` (ex: morceau déjà reçu)."""
+        payload = error.payload if isinstance(error.payload, dict) else {}
+        error_data = payload.get('error', {}).get('error_data')
+        if isinstance(error_data, dict) and 'start_offset' in error_data:
+            self.state['start_offset'] = int(error_data['start_offset'])
+            self.state['end_offset'] = int(error_data['end_offset'])
+            return True
+        return False
+
+    def transfer(self) -> None:
+        """Transfère les morceaux restants; chaque échec est retenté depuis le dernier offset acquitté."""
+        failures = 0
+        while self.state['start_offset'] < self.state['end_offset']:
+            try:
+                self.transfer_chunk()
+                failures = 0
+            except (httpx.TransportError, GraphError) as e:
+                retryable = isinstance(e, httpx.TransportError) or self._resync_offsets(e) or (e.status or 0) >= 500
+                failures += 1
+                if not retryable or failures > MAX_TRANSFER_RETRIES:
+                    raise
+                print(f"Échec du morceau à l'offset {self.state['start_offset']} ({e}), nouvelle tentative...")
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (failures - 1))
+
+    def run(self) -> dict:
+        """Upload complet: reprend une session enregistrée si elle existe, sinon en démarre une."""
+        self.state = self._load_state()
+        if self.state is None:
+            self.start()
+        self.transfer()
+        return self.finish()
+
+    # --- Persistance de l'état ---
+
+    def _load_state(self) -> Optional[dict]:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path) as f:
+            state = json.load(f)
+        # Un fichier différent (taille changée) ne peut pas reprendre l'ancienne session
+        return state if state.get('file_size') == self.file_size else None
+
+    def _save_state(self):
+        if self.state_path:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.state_path)
+
+    def _clear_state(self):
+        if self.state_path and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+
+def upload_video_file(page_id: str, access_token: str, path: str, **kwargs) -> dict:
+    """Uploade un fichier du disque; l'état est gardé dans `<fichier>.upload.json` pour la reprise."""
+    kwargs.setdefault('state_path', f"{path}.upload.json")
+    with open(path, 'rb') as f:
+        return ResumableVideoUpload(page_id, access_token, f, os.path.getsize(path), **kwargs).run()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or not os.getenv('PAGE_ACCESS_TOKEN'):
+        print("Usage: PAGE_ACCESS_TOKEN=... python -m facebook.resumable_upload PAGE_ID video.mp4")
+        sys.exit(1)
+    result = upload_video_file(sys.argv[1], os.environ['PAGE_ACCESS_TOKEN'], sys.argv[2])
+    print("Vidéo publiée :", json.dumps(result, indent=2))
@@ -0,0 +1,147 @@
+"""
+Passerelle: toutes les plateformes dans un seul processus.
+
+Chaque application est montée sous un préfixe (/tiktok, /facebook, /instagram,
+/zoom) et n'est importée qu'à sa première requête. Elles partagent les pools de
+connexions sortantes (`common.http_client`), le gestionnaire de jetons et une
+seule couche de session: un cookie, une session côté serveur, et un espace par
+application dans cette session.
+
+Les redirections internes des applications (`RedirectResponse("/...")`) sont
+réécrites sous leur préfixe. Les URI de redirection OAuth enregistrées chez les
+plateformes doivent inclure le préfixe (ex: /facebook/auth/facebook/callback),
+via FB_REDIRECT_URI, INSTAGRAM_REDIRECT_URI, TIKTOK_REDIRECT_URI et ZOOM_REDIRECT_URI.
+
+Lancement depuis la racine du dépôt:
+    uvicorn gateway.main:app --port 8000
+"""
+import asyncio
+import importlib
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+
+from common import http_client, metrics
+from common.lifespan import combine_lifespans
+from common.sessions import ServerSideSessionMiddleware
+from common.tokens import token_manager
+
+load_dotenv()
+
+# Préfixe -> application ASGI ("module:attribut")
+PLATFORMS = {
+    "tiktok": "tiktok.main:app",
+    "facebook": "facebook.main:app",
+    "instagram": "insta.main:app",
+    "zoom": "zoom.main:app",
+}
+# Sous-ensemble à monter, ex: GATEWAY_APPS=facebook,instagram
+ENABLED_PLATFORMS = [name.strip() for name in os.getenv("GATEWAY_APPS", ",".join(PLATFORMS)).split(",")
+                     if name.strip()]
+
+GATEWAY_SECRET_KEY = os.getenv("GATEWAY_SECRET_KEY")
+if not GATEWAY_SECRET_KEY:
+    raise ValueError("Veuillez définir GATEWAY_SECRET_KEY dans un fichier .env")
+
+# Lifespans des applications chargées, fermés à l'arrêt de la passerelle
+_mounted_lifespans: Optional[AsyncExitStack] = None
+
+
+class LazyApp:
+    """Application ASGI importée (et démarrée) à sa première requête."""
+
+    def __init__(self, import_path: str):
+        self.import_path = import_path
+        self.app = None
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        if self.app is None:
+            async with self._lock:
+                if self.app is None:
+                    module_name, attribute = self.import_path.split(":")
+                    # Import dans un thread: les autres plateformes continuent de répondre
+                    module = await run_in_threadpool(importlib.import_module, module_name)
+                    app = getattr(module, attribute)
+                    # Starlette ne transmet pas le lifespan aux applications montées
+                    if _mounted_lifespans is not None:
+                        await _mounted_lifespans.enter_async_context(app.router.lifespan_context(app))
+                    self.app = app
+        return self.app
+
+    async def __call__(self, scope, receive, send):
+        try:
+            app = await self.load()
+        except Exception as e:
+            # Plateforme mal configurée (variables d'environnement manquantes...):
+            # les autres restent disponibles, le chargement sera retenté
+            print(f"Impossible de charger {self.import_path} : {e}")
+            response = PlainTextResponse("Plateforme indisponible", status_code=503)
+            await response(scope, receive, send)
+            return
+        await app(scope, receive, send)
+
+
+class PrefixRedirects:
+    """Préfixe les redirections internes (`Location: /...`) par le chemin de montage."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        prefix = scope.get("root_path", "")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                location = headers.get("location")
+                if location and location.startswith("/") and not location.startswith("//"):
+                    headers["location"] = prefix + location
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+@asynccontextmanager
+async def mounted_lifespans(app):
+    global _mounted_lifespans
+    async with AsyncExitStack() as stack:
+        _mounted_lifespans = stack
+        try:
+            yield
+        finally:
+            _mounted_lifespans = None
+
+
+# Arrêt dans l'ordre inverse: applications montées, tâche des jetons, puis pools HTTP
+app = FastAPI(title="Passerelle NetworksApi",
+              lifespan=combine_lifespans(http_client.lifespan, token_manager.lifespan, mounted_lifespans))
+app.add_middleware(
+    ServerSideSessionMiddleware,
+    secret_key=GATEWAY_SECRET_KEY,
+    https_only=os.getenv("ENVIRONMENT", "development") == "production",
+)
+
+
+# Métriques de tout le processus (chaque application montée mesure ses propres routes)
+app.add_api_route("/metrics", metrics.metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+
+@app.get("/", response_class=HTMLResponse)
+async def index():
+    """Liste des plateformes montées."""
+    links = "".join(f'<li><a href="{name}/">{name}</a></li>' for name in ENABLED_PLATFORMS)
+    return f"<!DOCTYPE html><html lang=\"fr\"><body><h1>NetworksApi</h1><ul>{links}</ul></body></html>"
+
+
+for platform in ENABLED_PLATFORMS:
+    app.mount(f"/{platform}", PrefixRedirects(LazyApp(PLATFORMS[platform])), name=platform)
@@ -1,10 +1,23 @@
+import asyncio
 import os
-import requests
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from dotenv import load_dotenv
-from starlette.middleware.sessions import SessionMiddleware
+
+from common import http_client, metrics
+from common.lifespan import combine_lifespans
+from common.serialization import JSONResponse, from_dict, read_json
+from common.sessions import ServerSideSessionMiddleware
+from common.templating import LazyTemplates
+from common.tokens import TokenRecord, TokenRefreshError, token_manager
+from common.webhooks import WebhookEvent, WebhookProcessor, add_webhook_routes
+from insta.models import InstagramProfile, MediaPage
 
 # Charger les variables d'environnement depuis le fichier .env
 load_dotenv()
@@ -19,20 +32,47 @@ INSTAGRAM_REDIRECT_URI = os.getenv("INSTAGRAM_REDIRECT_URI")
 if not all([INSTAGRAM_APP_ID, INSTAGRAM_APP_SECRET, INSTAGRAM_REDIRECT_URI]):
     raise ValueError("Veuillez définir INSTAGRAM_APP_ID, INSTAGRAM_APP_SECRET, et INSTAGRAM_REDIRECT_URI dans un fichier .env")
 
+# Webhooks Instagram: jeton choisi lors de l'abonnement dans le tableau de bord Meta
+INSTAGRAM_WEBHOOK_VERIFY_TOKEN = os.getenv("INSTAGRAM_WEBHOOK_VERIFY_TOKEN")
+INSTAGRAM_SUBSCRIBED_FIELDS = os.getenv("INSTAGRAM_SUBSCRIBED_FIELDS", "comments,mentions,messages")
+# Durée (secondes) pendant laquelle le profil et la première page de médias sont
+# réaffichés sans appel Graph; un webhook du compte les invalide aussitôt.
+DASHBOARD_CACHE_TTL = int(os.getenv("INSTAGRAM_DASHBOARD_CACHE_TTL", 900))
+DASHBOARD_CACHE_SIZE = 1000
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# Lots de webhooks traités hors des requêtes
+webhooks = WebhookProcessor("instagram")
+
 # Instanciation de l'application FastAPI
-app = FastAPI()
-templates = Jinja2Templates(directory="templates")
+# Les pools de connexions sortantes et le rafraîchissement des jetons vivent aussi longtemps que l'application
+app = FastAPI(lifespan=combine_lifespans(http_client.lifespan, token_manager.lifespan, webhooks.lifespan))
+# Environnements Jinja construits au premier rendu (démarrage plus rapide);
+# `templates.async_env` sert aux pages rendues en streaming
+templates = LazyTemplates(directory=BASE_DIR / "templates")
 
-# Middleware pour gérer les sessions sécurisées via des cookies signés
-# C'est le changement le plus important pour la sécurité.
-app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
+# Sessions côté serveur: le cookie signé ne contient qu'un identifiant de session,
+# le jeton reste sur le serveur.
+app.add_middleware(ServerSideSessionMiddleware, secret_key=SECRET_KEY)
+# Endpoint /metrics et durée des requêtes par route (ajouté en dernier: mesure aussi les sessions)
+metrics.instrument(app, "instagram")
+# GET /webhooks (vérification) et POST /webhooks (signé avec INSTAGRAM_APP_SECRET)
+add_webhook_routes(app, webhooks, INSTAGRAM_APP_SECRET, INSTAGRAM_WEBHOOK_VERIFY_TOKEN)
 
 # URLs de l'API Instagram
 AUTH_URL = "https://api.instagram.com/oauth/authorize"
 TOKEN_URL = "https://api.instagram.com/oauth/access_token"
 LONG_LIVED_TOKEN_URL = "https://graph.instagram.com/access_token"
+REFRESH_TOKEN_URL = "https://graph.instagram.com/refresh_access_token"
 USER_MEDIA_URL = "https://graph.instagram.com/me/media"
 USER_PROFILE_URL = "https://graph.instagram.com/me"
+SUBSCRIBED_APPS_URL = "https://graph.instagram.com/v23.0/me/subscribed_apps"
+
+# Pagination des médias: seules les pages réellement affichées sont demandées
+MEDIA_FIELDS = 'id,caption,media_type,media_url,permalink,thumbnail_url'
+MEDIA_PAGE_SIZE = int(os.getenv("INSTAGRAM_MEDIA_PAGE_SIZE", 24))
+MAX_MEDIA_PAGE_SIZE = 100  # Limite de l'API Graph Instagram
 
 # --- Routes Publiques ---
 @app.get("/", response_class=HTMLResponse)
@@ -69,7 +109,7 @@ async def auth_callback(request: Request, code: str):
             'client_id': INSTAGRAM_APP_ID, 'client_secret': INSTAGRAM_APP_SECRET,
             'grant_type': 'authorization_code', 'redirect_uri': INSTAGRAM_REDIRECT_URI, 'code': code,
         }
-        res_short = requests.post(TOKEN_URL, data=token_payload)
+        res_short = await http_client.post(TOKEN_URL, data=token_payload)
         res_short.raise_for_status()
         short_lived_token = res_short.json().get('access_token')
         if not short_lived_token:
@@ -80,16 +120,18 @@ async def auth_callback(request: Request, code: str):
             'grant_type': 'ig_exchange_token', 'client_secret': INSTAGRAM_APP_SECRET,
             'access_token': short_lived_token,
         }
-        res_long = requests.get(LONG_LIVED_TOKEN_URL, params=long_lived_payload)
+        res_long = await http_client.get(LONG_LIVED_TOKEN_URL, params=long_lived_payload)
         res_long.raise_for_status()
-        long_lived_token = res_long.json().get('access_token')
-        if not long_lived_token:
+        long_lived = res_long.json()
+        if not long_lived.get('access_token'):
             raise ValueError("Token longue durée non reçu d'Instagram.")
 
-        # Stockage sécurisé du token dans la session
-        request.session['access_token'] = long_lived_token
+        # Le token (60 jours) reste côté serveur; la session ne garde que sa clé
+        request.session['token_key'] = await token_manager.save(
+            TokenRecord.from_response("instagram", long_lived)
+        )
 
-    except (requests.exceptions.RequestException, ValueError) as e:
+    except (httpx.HTTPError, ValueError) as e:
         # En cas d'erreur, on stocke un message dans la session et on redirige
         request.session['error_message'] = f"Erreur d'authentification: {e}"
         return RedirectResponse(url="/")
@@ -100,45 +142,249 @@ async def auth_callback(request: Request, code: str):
 @app.get("/logout")
 async def logout(request: Request):
     """Déconnecte l'utilisateur en vidant la session."""
+    _dashboard_cache.pop(request.session.get('token_key'), None)
+    await token_manager.forget(request.session.get('token_key'))
     request.session.clear()
     return RedirectResponse(url="/")
 
 
-# --- Route Protégée ---
+async def refresh_instagram_token(record: TokenRecord) -> TokenRecord:
+    """Prolonge un token longue durée de 60 jours (possible tant qu'il n'a pas expiré)."""
+    response = await http_client.get(REFRESH_TOKEN_URL, params={
+        'grant_type': 'ig_refresh_token', 'access_token': record.access_token,
+    })
+    response.raise_for_status()
+    return TokenRecord.from_response("instagram", response.json(), previous=record)
+
+token_manager.register_refresher("instagram", refresh_instagram_token, margin=7 * 24 * 3600)
+
+
+async def get_session_token(request: Request) -> Optional[str]:
+    """Token valide de la session, ou None si l'utilisateur doit se reconnecter."""
+    try:
+        return await token_manager.get_valid_token(request.session.get('token_key'))
+    except TokenRefreshError:
+        return None
+
+
+async def fetch_media_page(token: str, after: Optional[str] = None, limit: int = MEDIA_PAGE_SIZE) -> MediaPage:
+    """
+    Récupère une page de `/me/media` et le curseur de la suivante
+    (`next_cursor` vaut None quand il n'y a plus rien à charger).
+    """
+    media_params = {'fields': MEDIA_FIELDS, 'limit': limit, 'access_token': token}
+    if after:
+        media_params['after'] = after
+    media_response = await http_client.get(USER_MEDIA_URL, params=media_params)
+    media_response.raise_for_status()
+    return MediaPage.from_payload(read_json(media_response))
+
+
+async def fetch_profile(token: str) -> InstagramProfile:
+    """Récupère les informations du profil."""
+    # `user_id`: identifiant du compte professionnel, celui des webhooks (`entry.id`)
+    profile_params = {'fields': 'id,user_id,username', 'access_token': token}
+    profile_response = await http_client.get(USER_PROFILE_URL, params=profile_params)
+    profile_response.raise_for_status()
+    return from_dict(InstagramProfile, read_json(profile_response))
+
+
+# --- Cache du tableau de bord, invalidé par les webhooks ---
+# token_key -> (instant du chargement, profil, première page de médias)
+_dashboard_cache: "OrderedDict[str, tuple]" = OrderedDict()
+# Comptes déjà abonnés aux webhooks par ce processus
+_subscribed_accounts = set()
+
+
+def cached_dashboard(token_key: Optional[str]):
+    entry = _dashboard_cache.get(token_key)
+    if entry is None or time.monotonic() - entry[0] >= DASHBOARD_CACHE_TTL:
+        return None
+    return entry[1], entry[2]
+
+
+def cache_dashboard(token_key: Optional[str], profile: InstagramProfile, media_page: MediaPage):
+    if not token_key:
+        return
+    _dashboard_cache[token_key] = (time.monotonic(), profile, media_page)
+    _dashboard_cache.move_to_end(token_key)
+    while len(_dashboard_cache) > DASHBOARD_CACHE_SIZE:
+        _dashboard_cache.popitem(last=False)
+
+
+def token_rejected(error: httpx.HTTPError) -> bool:
+    """Le token ne sert plus: 401, ou erreur Graph 190 (token invalide ou expiré)."""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return False
+    if error.response.status_code == 401:
+        return True
+    details = http_client.error_details(error)
+    graph_error = details.get('error') if isinstance(details, dict) else None
+    return isinstance(graph_error, dict) and graph_error.get('code') == 190
+
+
+def account_ids(profile: InstagramProfile) -> list:
+    return [str(account_id) for account_id in (profile.user_id, profile.id) if account_id]
+
+
+@webhooks.subscribe
+def invalidate_dashboard(event: WebhookEvent):
+    """Nouveau commentaire, mention ou message: le prochain affichage relit Graph."""
+    for token_key, (_, profile, _) in list(_dashboard_cache.items()):
+        if event.account_id in account_ids(profile):
+            _dashboard_cache.pop(token_key, None)
+
+
+async def subscribe_account(profile: InstagramProfile, token: str):
+    """Abonne l'application aux webhooks du compte (une fois par processus)."""
+    key = profile.user_id or profile.id
+    try:
+        response = await http_client.post(SUBSCRIBED_APPS_URL, params={
+            'subscribed_fields': INSTAGRAM_SUBSCRIBED_FIELDS, 'access_token': token,
+        })
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        # Nouvel essai au prochain affichage du tableau de bord
+        _subscribed_accounts.discard(key)
+        print(f"Abonnement aux webhooks du compte {key} impossible :", http_client.error_details(e))
+
+
+async def stream_template(name: str, context: dict):
+    """
+    Rend un template par morceaux. Le rendu tourne dans une tâche séparée: tout ce
+    qui est prêt est envoyé d'un coup, et le navigateur reçoit le début de la page
+    dès que le template attend une donnée encore en cours de chargement.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def produce():
+        try:
+            async for chunk in templates.async_env.get_template(name).generate_async(context):
+                queue.put_nowait(chunk)
+        finally:
+            queue.put_nowait(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            chunks = [await queue.get()]
+            while not queue.empty():
+                chunks.append(queue.get_nowait())
+            finished = chunks[-1] is done
+            if finished:
+                chunks.pop()
+            if chunks:
+                yield "".join(chunks)
+            if finished:
+                break
+        await producer  # Propage une éventuelle erreur de rendu
+    finally:
+        producer.cancel()
+
+
+# --- Routes Protégées ---
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request):
+async def dashboard(request: Request, refresh: bool = False):
     """
     Affiche un tableau de bord. C'est une route protégée.
     Elle n'est accessible que si un token est présent dans la session.
+
+    Le profil et les médias sont demandés en parallèle; l'en-tête de la page part
+    vers le navigateur dès que le profil est connu, la grille suit avec les médias.
+    Ils sont ensuite réaffichés depuis le cache (DASHBOARD_CACHE_TTL) jusqu'au
+    prochain webhook du compte ou `?refresh=1`.
     """
-    token = request.session.get('access_token')
+    token = await get_session_token(request)
     if not token:
         # Si pas de token en session, l'utilisateur n'est pas connecté.
         request.session['error_message'] = "Veuillez vous connecter pour accéder à cette page."
         return RedirectResponse(url="/", status_code=303)
 
-    try:
-        # Récupérer les informations du profil
-        profile_params = {'fields': 'id,username', 'access_token': token}
-        profile_response = requests.get(USER_PROFILE_URL, params=profile_params)
-        profile_response.raise_for_status()
-        user_profile = profile_response.json()
-
-        # Récupérer les médias récents
-        media_params = {'fields': 'id,caption,media_type,media_url,permalink,thumbnail_url', 'access_token': token}
-        media_response = requests.get(USER_MEDIA_URL, params=media_params)
-        media_response.raise_for_status()
-        user_media = media_response.json().get('data', [])
-
-    except requests.exceptions.RequestException:
-        # Si le token est invalide/expiré, on déconnecte l'utilisateur
-        request.session.clear()
-        request.session['error_message'] = "Votre session a expiré. Veuillez vous reconnecter."
-        return RedirectResponse(url="/")
+    token_key = request.session.get('token_key')
+    cached = None if refresh else cached_dashboard(token_key)
+    if cached:
+        user_profile, media_page = cached
 
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request, "user_profile": user_profile, "user_media": user_media
-    })
+        async def load_media_page():
+            return media_page
+    else:
+        # Les deux appels partent en même temps; les médias ne sont attendus que par la grille
+        profile_task = asyncio.create_task(fetch_profile(token))
+        media_task = asyncio.create_task(fetch_media_page(token))
+
+        try:
+            user_profile = await profile_task
+        except (httpx.HTTPError, ValueError) as e:
+            media_task.cancel()
+            if isinstance(e, httpx.HTTPError) and token_rejected(e):
+                # Si le token est invalide/expiré, on déconnecte l'utilisateur
+                _dashboard_cache.pop(token_key, None)
+                await token_manager.forget(token_key)
+                request.session.clear()
+                request.session['error_message'] = "Votre session a expiré. Veuillez vous reconnecter."
+                return RedirectResponse(url="/")
+
+            # Panne passagère (délai, 5xx, quota...): le token et la session sont gardés
+            async def no_media_page():
+                return {'data': [], 'next_cursor': None}
+
+            context = {"request": request, "user_profile": None, "load_media_page": no_media_page,
+                       "events": [], "error": "Instagram est indisponible pour le moment. Réessayez plus tard."}
+            return StreamingResponse(stream_template("dashboard.html", context), status_code=502,
+                                     media_type="text/html")
+
+        key = user_profile.user_id or user_profile.id
+        if key and key not in _subscribed_accounts:
+            _subscribed_accounts.add(key)
+            webhooks.spawn(subscribe_account(user_profile, token))
+
+        async def load_media_page():
+            # Appelé par le template au moment d'afficher la grille
+            try:
+                page = await media_task
+            except httpx.HTTPError:
+                return {'data': [], 'next_cursor': None,
+                        'error': "Impossible de charger vos publications pour le moment."}
+            cache_dashboard(token_key, user_profile, page)
+            return page
+
+    context = {"request": request, "user_profile": user_profile, "load_media_page": load_media_page,
+               "events": webhooks.recent_events(account_ids(user_profile))}
+    if cached:
+        return StreamingResponse(stream_template("dashboard.html", context), media_type="text/html")
+
+    # Si le client part avant la grille, la page n'attend jamais les médias: l'exception
+    # éventuelle est lue ici (pas de "Task exception was never retrieved")
+    media_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def render():
+        try:
+            async for chunk in stream_template("dashboard.html", context):
+                yield chunk
+        finally:
+            # Rendu terminé ou interrompu (client déconnecté): l'appel aux médias n'est plus utile
+            media_task.cancel()
+
+    return StreamingResponse(render(), media_type="text/html")
+
+@app.get("/api/media")
+async def list_media(request: Request, after: Optional[str] = None,
+                     limit: int = Query(MEDIA_PAGE_SIZE, ge=1, le=MAX_MEDIA_PAGE_SIZE)):
+    """
+    Renvoie une page de médias en JSON et le curseur de la suivante.
+    Utilisé par le tableau de bord pour charger les publications plus anciennes.
+    """
+    token = await get_session_token(request)
+    if not token:
+        return JSONResponse(status_code=401, content={"error": "Non authentifié"})
+
+    try:
+        return JSONResponse(content=await fetch_media_page(token, after=after, limit=limit))
+    except httpx.HTTPError as e:
+        return JSONResponse(status_code=502, content={
+            "error": "Erreur lors de la récupération des médias", "details": http_client.error_details(e)
+        })
 
 @app.get("/terms", response_class=HTMLResponse)
 def show_terms(request: Request):
@@ -0,0 +1,43 @@
+"""
+Réponses de l'API Graph Instagram réduites aux champs utilisés, décodées par `common.serialization`.
+
+Les modèles sont aussi passés tels quels au template du tableau de bord
+(`media.media_url`, `media_page.next_cursor`...) et à `/api/media`.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from common.serialization import from_dict
+
+
+@dataclass(slots=True)
+class InstagramProfile:
+    id: Optional[str] = None
+    username: Optional[str] = None
+    # Identifiant du compte professionnel (`entry.id` des webhooks)
+    user_id: Optional[str] = None
+
+
+@dataclass(slots=True)
+class InstagramMedia:
+    # Champs de MEDIA_FIELDS (insta/main.py)
+    id: Optional[str] = None
+    caption: Optional[str] = None
+    media_type: Optional[str] = None
+    media_url: Optional[str] = None
+    permalink: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+
+
+@dataclass(slots=True)
+class MediaPage:
+    """Une page de `/me/media` et le curseur de la suivante (None s'il n'y en a plus)."""
+    data: List[InstagramMedia] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> "MediaPage":
+        paging = payload.get("paging") or {}
+        # Graph renvoie toujours des curseurs; seul `next` indique qu'une page suit
+        next_cursor = (paging.get("cursors") or {}).get("after") if paging.get("next") else None
+        return cls([from_dict(InstagramMedia, media) for media in payload.get("data") or []], next_cursor)
@@ -1,67 +1,329 @@
 from __future__ import print_function
 
+import argparse
+import csv
 import datetime
-import os.path
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+# Les bibliothèques Google (googleapiclient, google-auth, oauthlib) sont importées
+# à la première utilisation: lire un fichier ou afficher l'aide reste instantané.
 
 # 👉 Autorisations : lecture/écriture sur le calendrier + créer Meet
 SCOPES = ['https://www.googleapis.com/auth/calendar']
+TOKEN_PATH = 'token.json'
+CLIENT_SECRETS_PATH = 'credentials.json'
+# Document de découverte local (optionnel); à défaut, celui fourni avec googleapiclient
+DISCOVERY_PATH = os.getenv('CALENDAR_DISCOVERY_PATH')
 
-def main():
-    creds = None
-    # Si le token existe déjà :
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    # Si pas encore connecté :
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+# Limite de l'API Calendar: 50 requêtes par appel batch
+MAX_BATCH_SIZE = 50
+MAX_BATCH_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 2.0
+# Erreurs temporaires (quota, surcharge) qui justifient un nouvel essai
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Un 403 n'est temporaire que pour un dépassement de quota (sinon: droits, calendrier...)
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+RESULT_FIELDS = ['row', 'summary', 'status', 'event_id', 'meet_link', 'html_link', 'error']
+
+# Caches du processus: identifiants, document de découverte et services déjà construits
+_credentials = None
+_discovery_document = None
+_credentials_lock = threading.Lock()
+# httplib2 n'est pas thread-safe: un service Calendar par thread
+_services = threading.local()
+
+
+def get_credentials():
+    """
+    Identifiants OAuth de l'utilisateur. `token.json` n'est lu qu'une fois par
+    processus et n'est réécrit que lorsque le jeton a changé (rafraîchi ou nouveau).
+    """
+    global _credentials
+    with _credentials_lock:
+        creds = _credentials
+        if creds and creds.valid:
+            return creds
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+
+        # Si le token existe déjà :
+        if creds is None and os.path.exists(TOKEN_PATH):
+            creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
+        # Si pas encore connecté :
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                from google_auth_oauthlib.flow import InstalledAppFlow
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    CLIENT_SECRETS_PATH, SCOPES)
+                creds = flow.run_local_server(port=8080)
+            # Sauvegarde le token pour la prochaine fois
+            with open(TOKEN_PATH, 'w') as token:
+                token.write(creds.to_json())
+        _credentials = creds
+        return creds
+
+
+def load_discovery_document():
+    """
+    Document de découverte Calendar v3, sans appel réseau: fichier local si
+    CALENDAR_DISCOVERY_PATH est défini, sinon la copie fournie avec googleapiclient.
+    """
+    global _discovery_document
+    if _discovery_document is None:
+        if DISCOVERY_PATH:
+            with open(DISCOVERY_PATH, encoding='utf-8') as f:
+                _discovery_document = f.read()
         else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', SCOPES)
-            creds = flow.run_local_server(port=8080)
-        # Sauvegarde le token pour la prochaine fois
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
+            from googleapiclient.discovery_cache import get_static_doc
+            _discovery_document = get_static_doc('calendar', 'v3')
+        if not _discovery_document:
+            raise RuntimeError("Document de découverte Calendar v3 introuvable.")
+    return _discovery_document
 
-    # Création du service Calendar
-    service = build('calendar', 'v3', credentials=creds)
 
-    # Détails de l'événement
+def get_calendar_service():
+    """Service Calendar construit une fois par thread, réutilisé par les appels suivants."""
+    service = getattr(_services, 'calendar', None)
+    if service is None:
+        from googleapiclient.discovery import build_from_document
+        # Les identifiants sont rafraîchis par le transport autorisé à l'expiration
+        service = build_from_document(load_discovery_document(), credentials=get_credentials())
+        _services.calendar = service
+    return service
+
+
+# --- Construction des événements ---
+
+def make_request_id(row):
+    """
+    Identifiant déterministe d'une ligne: la même ligne donne toujours le même id.
+
+    Il sert d'id d'événement (base32hex: les chiffres hexadécimaux sont acceptés)
+    et de `requestId` Meet, si bien qu'un nouvel essai ne crée jamais de doublon:
+    Calendar répond 409 pour un id déjà utilisé.
+    """
+    key = {k: row.get(k) for k in ('calendar_id', 'summary', 'start', 'end', 'timezone', 'attendees')}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+
+def parse_attendees(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.replace(',', ';').split(';')
+    return [email.strip() for email in value if email.strip()]
+
+
+def build_event(row):
+    """Construit le corps `events.insert` d'une ligne (summary, start, end, timezone...)."""
+    for column in ('summary', 'start', 'end'):
+        if not row.get(column):
+            raise ValueError("Colonne '%s' manquante" % column)
+    timezone = row.get('timezone') or 'UTC'
+    request_id = make_request_id(row)
     event = {
-        'summary': 'Réunion Test Google Meet',
-        'description': 'Réunion créée par API avec Google Meet',
-        'start': {
-            'dateTime': '2025-06-25T10:00:00-13:00',
-            'timeZone': 'America/Los_Angeles',
-        },
-        'end': {
-            'dateTime': '2025-06-25T11:00:00-14:00',
-            'timeZone': 'America/Los_Angeles',
-        },
+        'id': request_id,
+        'summary': row['summary'],
+        'description': row.get('description') or '',
+        'start': {'dateTime': row['start'], 'timeZone': timezone},
+        'end': {'dateTime': row['end'], 'timeZone': timezone},
         'conferenceData': {
             'createRequest': {
-                'requestId': 'some-random-string',
-                'conferenceSolutionKey': {
-                    'type': 'hangoutsMeet'
-                },
+                'requestId': request_id,
+                'conferenceSolutionKey': {'type': 'hangoutsMeet'},
             },
         },
     }
+    attendees = parse_attendees(row.get('attendees'))
+    if attendees:
+        event['attendees'] = [{'email': email} for email in attendees]
+    return event
+
+
+def get_meet_link(event):
+    for entry_point in event.get('conferenceData', {}).get('entryPoints', []):
+        if entry_point.get('entryPointType') == 'video':
+            return entry_point.get('uri')
+    return event.get('hangoutLink')
+
+
+# --- Lecture / écriture des fichiers ---
+
+def read_rows(path):
+    """Lit les lignes d'un fichier CSV (avec en-tête) ou JSONL (un objet par ligne)."""
+    if path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.DictReader(f))
+
+
+def write_results(path, results):
+    """Écrit un résultat par ligne d'entrée, au format CSV ou JSONL selon l'extension."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+        else:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
 
-    # Insérer l'événement avec un lien Meet
+# --- Création en masse ---
+
+def error_status(exception):
+    from googleapiclient.errors import HttpError
+    return exception.resp.status if isinstance(exception, HttpError) else None
+
+
+def error_reasons(exception):
+    """Raisons (`error.errors[].reason`) du corps d'une HttpError."""
+    try:
+        errors = json.loads(exception.content)['error']['errors']
+        return {error.get('reason') for error in errors if isinstance(error, dict)}
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return set()
+
+
+def is_retryable(exception):
+    status = error_status(exception)
+    if status == 403:
+        return bool(error_reasons(exception) & RATE_LIMIT_REASONS)
+    return status in RETRYABLE_STATUSES
+
+
+def run_batches(service, requests_by_index, callback):
+    """Envoie les requêtes par lots de 50 (un appel HTTP par lot)."""
+    indexes = list(requests_by_index)
+    for start in range(0, len(indexes), MAX_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        for index in indexes[start:start + MAX_BATCH_SIZE]:
+            batch.add(requests_by_index[index], request_id=str(index))
+        batch.execute()
+
+
+def create_events(service, rows, calendar_id='primary'):
+    """
+    Crée un événement Meet par ligne via des requêtes batch.
+
+    Les lignes en erreur temporaire sont renvoyées (avec le même id, donc sans
+    doublon possible); celles dont l'id existe déjà (409, essai précédent réussi)
+    sont relues pour récupérer leur lien Meet. Un événement relu mais supprimé
+    depuis (`status: cancelled`) est une erreur: son id ne peut pas être réutilisé.
+    """
+    results = []
+    events = {}
+    for index, row in enumerate(rows):
+        results.append({'row': index + 1, 'summary': row.get('summary'), 'status': 'error',
+                        'event_id': None, 'meet_link': None, 'html_link': None, 'error': None})
+        try:
+            events[index] = (row.get('calendar_id') or calendar_id, build_event(row))
+        except ValueError as e:
+            results[index]['error'] = str(e)
+
+    def record_event(index, event, status):
+        results[index].update(status=status, event_id=event.get('id'), meet_link=get_meet_link(event),
+                              html_link=event.get('htmlLink'), error=None)
+
+    pending = dict(events)
+    existing = {}
+    for attempt in range(MAX_BATCH_RETRIES + 1):
+        retry = {}
+
+        def on_insert(request_id, response, exception):
+            index = int(request_id)
+            if exception is None:
+                record_event(index, response, 'created')
+            elif error_status(exception) == 409:
+                existing[index] = pending[index]
+            else:
+                results[index]['error'] = str(exception)
+                if is_retryable(exception):
+                    retry[index] = pending[index]
+
+        run_batches(service, {
+            index: service.events().insert(calendarId=cal_id, body=event, conferenceDataVersion=1)
+            for index, (cal_id, event) in pending.items()
+        }, on_insert)
+        if not retry or attempt == MAX_BATCH_RETRIES:
+            break
+        print("%d événement(s) à renvoyer après une erreur temporaire..." % len(retry))
+        time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+        pending = retry
+
+    def on_get(request_id, response, exception):
+        index = int(request_id)
+        if exception is not None:
+            results[index]['error'] = str(exception)
+        elif response.get('status') == 'cancelled':
+            results[index].update(event_id=response.get('id'),
+                                  error="Événement déjà créé puis supprimé : modifiez la ligne pour le recréer")
+        else:
+            record_event(index, response, 'exists')
+
+    if existing:
+        run_batches(service, {
+            index: service.events().get(calendarId=cal_id, eventId=event['id'])
+            for index, (cal_id, event) in existing.items()
+        }, on_get)
+    return results
+
+
+def bulk_main(input_path, output_path, calendar_id='primary'):
+    rows = read_rows(input_path)
+    service = get_calendar_service()
+    results = create_events(service, rows, calendar_id)
+    write_results(output_path, results)
+    created = sum(result['status'] != 'error' for result in results)
+    print('%d/%d événement(s) créé(s), résultats dans %s' % (created, len(results), output_path))
+
+
+def main():
+    # Service Calendar (construit une seule fois par processus)
+    service = get_calendar_service()
+
+    # Détails de l'événement
+    row = {
+        'summary': 'Réunion Test Google Meet',
+        'description': 'Réunion créée par API avec Google Meet',
+        'start': '2025-06-25T10:00:00-13:00',
+        'end': '2025-06-25T11:00:00-14:00',
+        'timezone': 'America/Los_Angeles',
+    }
+
+    # Insérer l'événement avec un lien Meet. Sans id imposé et avec un requestId
+    # aléatoire, chaque lancement crée un nouvel événement et une nouvelle conférence
+    # (l'id déterministe ne sert qu'aux reprises en masse)
+    body = build_event(row)
+    del body['id']
+    body['conferenceData']['createRequest']['requestId'] = uuid.uuid4().hex
     event = service.events().insert(
         calendarId='primary',
-        body=event,
+        body=body,
         conferenceDataVersion=1
     ).execute()
 
     print('Événement créé : %s' % (event.get('htmlLink')))
-    print('Lien Google Meet : %s' % (event['conferenceData']['entryPoints'][0]['uri']))
+    print('Lien Google Meet : %s' % get_meet_link(event))
+
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Création d'événements Google Meet")
+    parser.add_argument('--bulk', metavar='FICHIER',
+                        help="fichier CSV ou JSONL (summary, start, end, timezone, description, attendees)")
+    parser.add_argument('--output', metavar='FICHIER', help="fichier de résultats (défaut: <entrée>.results.csv)")
+    parser.add_argument('--calendar', default='primary', help="calendrier cible (défaut: primary)")
+    args = parser.parse_args()
+    if args.bulk:
+        bulk_main(args.bulk, args.output or '%s.results.csv' % os.path.splitext(args.bulk)[0], args.calendar)
+    else:
+        main()
@@ -1,15 +1,28 @@
 import os
-import requests
+import asyncio
 import hashlib
 import base64
 import secrets
-from typing import Optional
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional
 
+import httpx
 from fastapi import FastAPI, Request, HTTPException, UploadFile, File
-from fastapi.responses import RedirectResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from starlette.middleware.sessions import SessionMiddleware
+from fastapi.responses import RedirectResponse, StreamingResponse
 from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+from common import http_client, metrics
+from common.lifespan import combine_lifespans
+from common.serialization import JSONResponse, dumps, from_dict
+from common.sessions import ServerSideSessionMiddleware
+from common.static_assets import PrecompressedStaticFiles
+from common.tokens import TokenRecord, TokenRefreshError, token_manager
+from tiktok.models import PublishInit, PublishStatus, TikTokAPIError, TikTokUser, VideoPage, unwrap
+from tiktok.publish_jobs import PROCESSING, PUBLISHED, UPLOADING, PublishJob, PublishWorkers, QueueFull
 
 # --- Configuration Initiale ---
 load_dotenv()
@@ -32,23 +45,62 @@ else:
     HTTPS_ONLY_COOKIE = False
     print("--- ATTENTION: L'application tourne en MODE DÉVELOPPEMENT ---")
 
-REDIRECT_URI = f"{YOUR_DOMAIN}/tiktok/callback"
+REDIRECT_URI = os.getenv("TIKTOK_REDIRECT_URI", f"{YOUR_DOMAIN}/tiktok/callback")
+BASE_DIR = Path(__file__).resolve().parent
 # AJOUT DES SCOPES POUR LA PUBLICATION
 SCOPES = "user.info.basic,user.info.profile,video.list"
+TOKEN_URL = "https://open.tiktokapis.com/v2/oauth/token/"
+
+# --- Liste des vidéos ---
+VIDEO_LIST_URL = "https://open.tiktokapis.com/v2/video/list/"
+VIDEO_FIELDS = "id,title,cover_image_url,share_url"
+VIDEO_PAGE_SIZE = 10
+VIDEO_LIST_MAX_COUNT = 20  # Maximum accepté par /v2/video/list/
+
+# --- Upload par morceaux ---
+# TikTok impose des morceaux de 5 Mo à 64 Mo (le dernier peut aller jusqu'à 128 Mo).
+# Une vidéo plus petite qu'un morceau est envoyée en un seul PUT.
+MIN_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+MAX_UPLOAD_CHUNK_SIZE = 64 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = int(os.getenv("TIKTOK_UPLOAD_CHUNK_SIZE", 10 * 1024 * 1024))
+# Taille des blocs lus sur disque pendant l'envoi d'un morceau
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+# --- Publication en arrière-plan ---
+PUBLISH_INIT_URL = "https://open.tiktokapis.com/v2/post/publish/video/init/"
+PUBLISH_STATUS_URL = "https://open.tiktokapis.com/v2/post/publish/status/fetch/"
+# Suivi du traitement côté TikTok: délai croissant entre deux interrogations, durée maximale
+PUBLISH_POLL_INITIAL_DELAY = 2.0
+PUBLISH_POLL_MAX_DELAY = 30.0
+PUBLISH_POLL_TIMEOUT = float(os.getenv("TIKTOK_PUBLISH_POLL_TIMEOUT", 30 * 60))
+# Statuts finaux de /v2/post/publish/status/fetch/
+PUBLISH_DONE_STATUSES = {"PUBLISH_COMPLETE", "SEND_TO_USER_INBOX"}
+# Répertoire des vidéos en attente d'upload (défaut: répertoire temporaire du système)
+PUBLISH_SPOOL_DIR = os.getenv("TIKTOK_PUBLISH_SPOOL_DIR")
+
+# Pool des publications; `run_publish_job` est défini plus bas (section Publication)
+publish_workers = PublishWorkers(lambda job: run_publish_job(job))
+# Pages statiques lues et compressées (gzip/brotli) au démarrage, servies avec ETag
+static_files = PrecompressedStaticFiles(BASE_DIR / "static", html=True)
 
 # --- Initialisation de l'application FastAPI ---
+# Arrêt dans l'ordre inverse: workers de publication, tâche des jetons, puis pools HTTP
 app = FastAPI(
     title="API d'authentification et de publication TikTok",
-    description="Une API pour s'authentifier avec TikTok, voir son profil, lister ses vidéos et en publier de nouvelles."
+    description="Une API pour s'authentifier avec TikTok, voir son profil, lister ses vidéos et en publier de nouvelles.",
+    lifespan=combine_lifespans(http_client.lifespan, token_manager.lifespan, publish_workers.lifespan,
+                               static_files.lifespan),
 )
 
-# --- Middleware pour les Sessions ---
+# --- Middleware pour les Sessions (stockées côté serveur) ---
 app.add_middleware(
-    SessionMiddleware,
+    ServerSideSessionMiddleware,
     secret_key=APP_SECRET_KEY,
     https_only=HTTPS_ONLY_COOKIE,
     same_site="lax",
 )
+# Endpoint /metrics et durée des requêtes par route (ajouté en dernier: mesure aussi les sessions)
+metrics.instrument(app, "tiktok")
 
 # --- Section d'Authentification ---
 @app.get("/login", tags=["Authentication"])
@@ -91,7 +143,6 @@ async def tiktok_callback(request: Request, code: str = None, state: str = None)
     if not code_verifier:
         raise HTTPException(status_code=400, detail="code_verifier non trouvé.")
 
-    token_url = "https://open.tiktokapis.com/v2/oauth/token/"
     token_payload = {
         "client_key": TIKTOK_CLIENT_KEY,
         "client_secret": TIKTOK_CLIENT_SECRET,
@@ -102,7 +153,7 @@ async def tiktok_callback(request: Request, code: str = None, state: str = None)
     }
 
     try:
-        response = requests.post(token_url, data=token_payload)
+        response = await http_client.post(TOKEN_URL, data=token_payload)
         response.raise_for_status()
         token_data = response.json()
 
@@ -110,20 +161,21 @@ async def tiktok_callback(request: Request, code: str = None, state: str = None)
         if not access_token:
             raise HTTPException(status_code=500, detail="N'a pas pu récupérer l'access_token.")
 
-        request.session['access_token'] = access_token
+        # Les jetons restent côté serveur, avec leurs dates d'expiration
+        record = TokenRecord.from_response("tiktok", token_data, open_id=token_data.get("open_id"))
+        request.session['token_key'] = await token_manager.save(record)
         request.session['open_id'] = token_data.get("open_id")
-        request.session['refresh_token'] = token_data.get("refresh_token")
         request.session['scopes'] = token_data.get("scope")
 
         return RedirectResponse(url="/profile.html")
 
-    except requests.exceptions.RequestException as e:
-        error_details = e.response.json() if e.response else str(e)
-        raise HTTPException(status_code=502, detail={"error": "Erreur lors de l'échange du token", "details": error_details})
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail={"error": "Erreur lors de l'échange du token", "details": http_client.error_details(e)})
 
 @app.get("/logout", tags=["Authentication"])
 async def logout(request: Request):
     """Efface la session de l'utilisateur et les cookies associés."""
+    await token_manager.forget(request.session.get('token_key'))
     request.session.clear()
     response = RedirectResponse(url="/", status_code=302)
     # Note: Le cookie de session est géré par le middleware, .clear() suffit.
@@ -133,10 +185,24 @@ async def logout(request: Request):
 
 # --- Section API pour le Frontend ---
 
-def get_auth_headers(request: Request):
-    """Fonction utilitaire pour récupérer le token et créer les headers."""
-    access_token = request.session.get('access_token')
-    if not access_token:
+async def refresh_tiktok_token(record: TokenRecord) -> TokenRecord:
+    """Rafraîchit l'access_token (24 h) avec le refresh_token (365 jours)."""
+    response = await http_client.post(TOKEN_URL, data={
+        "client_key": TIKTOK_CLIENT_KEY,
+        "client_secret": TIKTOK_CLIENT_SECRET,
+        "grant_type": "refresh_token",
+        "refresh_token": record.refresh_token,
+    })
+    response.raise_for_status()
+    return TokenRecord.from_response("tiktok", response.json(), previous=record)
+
+token_manager.register_refresher("tiktok", refresh_tiktok_token, margin=30 * 60)
+
+async def get_auth_headers(request: Request):
+    """Fonction utilitaire pour récupérer un token valide (rafraîchi si besoin) et créer les headers."""
+    try:
+        access_token = await token_manager.get_valid_token(request.session.get('token_key'))
+    except TokenRefreshError:
         raise HTTPException(status_code=401, detail="Non authentifié")
     return {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
 
@@ -144,119 +210,311 @@ def get_auth_headers(request: Request):
 async def get_user_info(request: Request):
     """Récupère les informations de l'utilisateur connecté."""
     try:
-        headers = get_auth_headers(request)
+        headers = await get_auth_headers(request)
         user_info_url = "https://open.tiktokapis.com/v2/user/info/?fields=open_id,avatar_url,display_name,username"
-        user_response = requests.get(user_info_url, headers=headers)
+        user_response = await http_client.get(user_info_url, headers=headers)
         user_response.raise_for_status()
-        user_data = user_response.json()
-
-        if user_data.get("error", {}).get("code") != "ok":
-            return JSONResponse(status_code=502, content={"error": "Erreur API TikTok", "details": user_data})
-        
-        return JSONResponse(content={"user": user_data.get("data", {}).get("user")})
+        user = from_dict(TikTokUser, unwrap(user_response).get("user"))
+        return JSONResponse(content={"user": user})
 
     except HTTPException as e:
         raise e  # Fait remonter les erreurs d'authentification
-    except requests.exceptions.RequestException as e:
-        return JSONResponse(status_code=502, content={"error": "Erreur lors de la récupération des infos utilisateur", "details": str(e)})
+    except TikTokAPIError as e:
+        return JSONResponse(status_code=502, content={"error": "Erreur API TikTok", "details": e.payload})
+    except httpx.HTTPError as e:
+        return JSONResponse(status_code=502, content={"error": "Erreur lors de la récupération des infos utilisateur", "details": http_client.error_details(e)})
+    except ValueError as e:
+        # Réponse 200 dont le corps n'est pas du JSON
+        return JSONResponse(status_code=502, content={"error": "Réponse TikTok illisible", "details": str(e)})
+
+async def fetch_video_page(headers: dict, cursor: Optional[int] = None, max_count: int = VIDEO_PAGE_SIZE) -> VideoPage:
+    """Une page de `/v2/video/list/`: `videos`, `cursor` et `has_more`."""
+    # L'API vidéo attend les champs dans l'URL et la pagination dans le corps d'une requête POST
+    payload = {"max_count": max_count}
+    if cursor:
+        payload['cursor'] = cursor
+    # Simple lecture malgré le POST: peut être retentée (voir common.resilience)
+    video_response = await http_client.post(VIDEO_LIST_URL, params={"fields": VIDEO_FIELDS},
+                                            headers=headers, json=payload, extensions={"idempotent": True})
+    video_response.raise_for_status()
+    return VideoPage.from_data(unwrap(video_response))
 
 @app.get("/api/videos", tags=["API"])
 async def get_user_videos(request: Request, cursor: Optional[int] = 0):
     """NOUVEAU: Récupère la liste des vidéos de l'utilisateur (paginée)."""
     try:
-        headers = get_auth_headers(request)
-        # L'API vidéo attend les champs dans le corps d'une requête POST
-        video_list_url = "https://open.tiktokapis.com/v2/video/list/"
-        
-        payload = {"fields": "id,title,cover_image_url,share_url", "max_count": 10}
-        if cursor:
-            payload['cursor'] = cursor
-
-        video_response = requests.post(video_list_url, headers=headers, json=payload)
-        video_response.raise_for_status()
-        video_data = video_response.json()
-
-        if video_data.get("error", {}).get("code") != "ok":
-            return JSONResponse(status_code=502, content={"error": "Erreur API TikTok", "details": video_data})
-
-        return JSONResponse(content=video_data.get("data", {}))
+        headers = await get_auth_headers(request)
+        return JSONResponse(content=await fetch_video_page(headers, cursor))
 
     except HTTPException as e:
         raise e
-    except requests.exceptions.RequestException as e:
-        return JSONResponse(status_code=502, content={"error": "Erreur lors de la récupération des vidéos", "details": str(e)})
+    except TikTokAPIError as e:
+        return JSONResponse(status_code=502, content={"error": "Erreur API TikTok", "details": e.payload})
+    except httpx.HTTPError as e:
+        return JSONResponse(status_code=502, content={"error": "Erreur lors de la récupération des vidéos", "details": http_client.error_details(e)})
+    except ValueError as e:
+        return JSONResponse(status_code=502, content={"error": "Réponse TikTok illisible", "details": str(e)})
+
+@app.get("/api/videos/export", tags=["API"])
+async def export_user_videos(request: Request):
+    """
+    Exporte toutes les vidéos de l'utilisateur en NDJSON (une vidéo par ligne).
 
-@app.post("/api/publish", tags=["API"])
-async def publish_video(request: Request, video: UploadFile = File(...)):
+    Les pages de 20 vidéos sont parcourues côté serveur via `cursor`/`has_more`;
+    la page suivante est demandée pendant l'envoi de la courante, et au plus deux
+    pages sont en mémoire. Une erreur en cours d'export est signalée par une
+    dernière ligne `{"error": ...}` (le statut HTTP est déjà parti).
     """
-    NOUVEAU: Gère la publication d'une vidéo.
-    NOTE: La publication sur TikTok est un processus en 2 étapes. Ce code ne montre
-    que la première étape (initialisation). Vous devrez implémenter la seconde (upload du fichier).
+    headers = await get_auth_headers(request)
+
+    async def stream_videos():
+        next_page = asyncio.ensure_future(fetch_video_page(headers, max_count=VIDEO_LIST_MAX_COUNT))
+        try:
+            while next_page is not None:
+                try:
+                    page = await next_page
+                except TikTokAPIError as e:
+                    yield dumps({"error": "Erreur API TikTok", "details": e.payload}) + b"\n"
+                    return
+                except httpx.HTTPError as e:
+                    yield dumps({"error": "Erreur lors de la récupération des vidéos",
+                                 "details": http_client.error_details(e)}) + b"\n"
+                    return
+                except ValueError as e:
+                    yield dumps({"error": "Réponse TikTok illisible", "details": str(e)}) + b"\n"
+                    return
+
+                next_page = None
+                if page.has_more and page.cursor:
+                    next_page = asyncio.ensure_future(
+                        fetch_video_page(headers, page.cursor, max_count=VIDEO_LIST_MAX_COUNT)
+                    )
+                for video in page.videos:
+                    yield dumps(video) + b"\n"
+        finally:
+            # Client déconnecté: la page en cours de chargement est abandonnée
+            if next_page is not None:
+                next_page.cancel()
+
+    return StreamingResponse(stream_videos(), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": 'attachment; filename="videos.ndjson"'})
+
+def compute_upload_chunks(video_size: int, chunk_size: int = UPLOAD_CHUNK_SIZE):
     """
-    try:
-        headers = get_auth_headers(request)
-        open_id = request.session.get('open_id')
-        if not open_id:
-             raise HTTPException(status_code=401, detail="ID utilisateur non trouvé dans la session.")
-
-        # Étape 1: Initialiser la publication pour obtenir une URL d'upload
-        init_url = "https://open.tiktokapis.com/v2/post/publish/video/init/"
-        
-        # Lire le contenu du fichier pour en obtenir la taille
-        video_content = await video.read()
-        video_size = len(video_content)
-        
-        payload = {
-            "post_info": {
-                "title": f"Vidéo publiée via mon App: {video.filename}",
-                "privacy_level": "PUBLIC_TO_SELF",  # Pour les tests. Autres options: "PUBLICLY_AVAILABLE", "MUTUAL_FOLLOW_FRIENDS"
-                "disable_comment": False,
-                "disable_duet": False,
-                "disable_stitch": False,
-            },
-            "source_info": {
-                "source": "FILE_UPLOAD",
-                "video_size": video_size,
-            }
+    Calcule les champs `chunk_size` et `total_chunk_count` attendus par TikTok.
+    Le reste de la division est absorbé par le dernier morceau.
+    """
+    chunk_size = max(MIN_UPLOAD_CHUNK_SIZE, min(chunk_size, MAX_UPLOAD_CHUNK_SIZE))
+    if video_size <= chunk_size:
+        return video_size, 1
+    return chunk_size, video_size // chunk_size
+
+def get_upload_size(video: UploadFile) -> int:
+    """Taille du fichier reçu, sans le charger en mémoire."""
+    if video.size is not None:
+        return video.size
+    position = video.file.tell()
+    video.file.seek(0, os.SEEK_END)
+    size = video.file.tell()
+    video.file.seek(position)
+    return size
+
+async def iter_upload_range(video: UploadFile, length: int, block_size: int = UPLOAD_BLOCK_SIZE):
+    """Lit `length` octets du fichier reçu par blocs, sans jamais les réunir en mémoire."""
+    remaining = length
+    while remaining:
+        block = await video.read(min(block_size, remaining))
+        if not block:
+            raise ValueError("Fichier vidéo tronqué pendant l'upload.")
+        remaining -= len(block)
+        yield block
+
+async def upload_video_chunks(upload_url: str, video: UploadFile, video_size: int,
+                              chunk_size: int, total_chunk_count: int,
+                              on_progress: Optional[Callable[[int], None]] = None):
+    """
+    Envoie la vidéo morceau par morceau avec des PUT `Content-Range`.
+    Chaque morceau est lu depuis le fichier temporaire au fil de l'envoi: la mémoire
+    utilisée reste bornée quelle que soit la taille du fichier.
+    `on_progress` reçoit le nombre d'octets envoyés après chaque morceau.
+    """
+    content_type = video.content_type or "video/mp4"
+    offset = 0
+    for index in range(total_chunk_count):
+        # Le dernier morceau contient tout ce qui reste
+        length = chunk_size if index < total_chunk_count - 1 else video_size - offset
+        await video.seek(offset)
+
+        upload_headers = {
+            'Content-Type': content_type,
+            'Content-Length': str(length),
+            'Content-Range': f"bytes {offset}-{offset + length - 1}/{video_size}",
         }
-
-        init_response = requests.post(init_url, headers=headers, json=payload)
-        init_response.raise_for_status()
-        init_data = init_response.json()
-
-        if init_data.get("error", {}).get("code") != "ok":
-            print("Erreur d'initialisation:", init_data)
-            return JSONResponse(status_code=502, content={"error": "Erreur API TikTok (init)", "details": init_data})
-
-        # Étape 2: Uploader le fichier vidéo vers l'URL fournie
-        upload_url = init_data["data"]["upload_url"]
-        
-        # L'upload se fait avec un PUT et des headers spécifiques
-        upload_headers = {'Content-Type': 'video/mp4', 'Content-Length': str(video_size)}
-        upload_response = requests.put(upload_url, data=video_content, headers=upload_headers)
+        upload_response = await http_client.put(
+            upload_url, content=iter_upload_range(video, length), headers=upload_headers
+        )
         upload_response.raise_for_status()
+        offset += length
+        if on_progress:
+            on_progress(offset)
+
+def build_publish_payload(filename: str, video_size: int) -> dict:
+    chunk_size, total_chunk_count = compute_upload_chunks(video_size)
+    return {
+        "post_info": {
+            "title": f"Vidéo publiée via mon App: {filename}",
+            "privacy_level": "PUBLIC_TO_SELF",  # Pour les tests. Autres options: "PUBLICLY_AVAILABLE", "MUTUAL_FOLLOW_FRIENDS"
+            "disable_comment": False,
+            "disable_duet": False,
+            "disable_stitch": False,
+        },
+        "source_info": {
+            "source": "FILE_UPLOAD",
+            "video_size": video_size,
+            "chunk_size": chunk_size,
+            "total_chunk_count": total_chunk_count,
+        }
+    }
 
-        # Si l'upload réussit, le statut est 200 OK.
-        # Vous pouvez ensuite rediriger, ou renvoyer un statut de succès.
-        # Pour une app réelle, il faudrait vérifier le statut de la publication.
-        
-        return JSONResponse(content={"message": "Vidéo publiée avec succès ! Elle sera bientôt visible sur votre profil.", "details": init_data})
+async def get_job_headers(job: PublishJob) -> dict:
+    """En-têtes d'une tâche: le jeton est relu (et rafraîchi si besoin) à chaque étape."""
+    access_token = await token_manager.get_valid_token(job.token_key)
+    return {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
 
-    except HTTPException as e:
-        raise e
-    except requests.exceptions.RequestException as e:
-        error_details = e.response.json() if e.response else str(e)
-        return JSONResponse(status_code=502, content={"error": "Erreur lors de la publication", "details": error_details})
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"error": "Erreur interne du serveur", "details": str(e)})
+async def run_publish_job(job: PublishJob):
+    """
+    Exécutée par un worker du pool: initialisation puis upload par morceaux depuis
+    le fichier temporaire de la tâche. Le suivi du traitement est lancé à part.
+    """
+    job.update(status=UPLOADING)
+    try:
+        headers = await get_job_headers(job)
+        payload = build_publish_payload(job.filename, job.size)
+        init_response = await http_client.post(PUBLISH_INIT_URL, headers=headers, json=payload)
+        init_response.raise_for_status()
+        try:
+            init = from_dict(PublishInit, unwrap(init_response))
+        except TikTokAPIError as e:
+            print("Erreur d'initialisation:", e.payload)
+            job.fail({"error": "Erreur API TikTok (init)", "details": e.payload})
+            return
+        job.update(publish_id=init.publish_id)
+
+        with open(job.path, "rb") as f:
+            video = UploadFile(f, size=job.size, filename=job.filename,
+                               headers=Headers({"content-type": job.content_type}))
+            chunk_size, total_chunk_count = compute_upload_chunks(job.size)
+            await upload_video_chunks(init.upload_url, video, job.size, chunk_size,
+                                      total_chunk_count, on_progress=lambda sent: job.update(uploaded=sent))
+    except TokenRefreshError:
+        job.fail({"error": "Session TikTok expirée, reconnectez-vous."})
+        return
+    except httpx.HTTPError as e:
+        job.fail({"error": "Erreur lors de la publication", "details": http_client.error_details(e)})
+        return
+    job.update(status=PROCESSING)
+    publish_workers.spawn(poll_publish_status(job))
+
+async def poll_publish_status(job: PublishJob):
+    """Interroge /v2/post/publish/status/fetch/ avec un délai croissant jusqu'à un statut final."""
+    delay = PUBLISH_POLL_INITIAL_DELAY
+    deadline = asyncio.get_running_loop().time() + PUBLISH_POLL_TIMEOUT
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            response = await http_client.post(PUBLISH_STATUS_URL, headers=await get_job_headers(job),
+                                              json={"publish_id": job.publish_id},
+                                              extensions={"idempotent": True})
+            response.raise_for_status()
+            result = from_dict(PublishStatus, unwrap(response))
+        except TokenRefreshError:
+            job.fail({"error": "Session TikTok expirée, reconnectez-vous."})
+            return
+        except (httpx.HTTPError, ValueError) as e:
+            # Erreur passagère: la prochaine interrogation décidera
+            print(f"Statut de la publication {job.publish_id} indisponible : {e}")
+        except TikTokAPIError as e:
+            job.fail({"error": "Erreur API TikTok (statut)", "details": e.payload})
+            return
+        else:
+            job.update(tiktok_status=result.status)
+            if result.status in PUBLISH_DONE_STATUSES:
+                job.update(status=PUBLISHED)
+                return
+            if result.status == "FAILED":
+                job.fail({"error": "Publication refusée par TikTok", "details": result.fail_reason})
+                return
+        if asyncio.get_running_loop().time() + delay > deadline:
+            job.fail({"error": "Traitement TikTok toujours en cours après le délai de suivi."})
+            return
+        delay = min(delay * 2, PUBLISH_POLL_MAX_DELAY)
+
+def spool_upload(video: UploadFile) -> str:
+    """Copie la vidéo reçue dans un fichier qui survit à la requête (exécuté dans un thread)."""
+    fd, path = tempfile.mkstemp(prefix="tiktok-publish-", suffix=Path(video.filename or "").suffix,
+                                dir=PUBLISH_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            video.file.seek(0)
+            shutil.copyfileobj(video.file, f, UPLOAD_BLOCK_SIZE)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+@app.post("/api/publish", tags=["API"], status_code=202)
+async def publish_video(request: Request, video: UploadFile = File(...)):
+    """
+    Met la publication en file et répond tout de suite avec l'identifiant de la tâche.
+    L'initialisation, l'upload par morceaux et le suivi du traitement TikTok se font
+    en arrière-plan; l'état est consultable sur `status_url`.
+    """
+    await get_auth_headers(request)  # 401 si la session n'a pas de jeton valide
+    open_id = request.session.get('open_id')
+    if not open_id:
+        raise HTTPException(status_code=401, detail="ID utilisateur non trouvé dans la session.")
+
+    # La taille est lue sans charger le fichier en mémoire
+    video_size = get_upload_size(video)
+    if not video_size:
+        raise HTTPException(status_code=400, detail="Le fichier vidéo est vide.")
+    if publish_workers.full():
+        return JSONResponse(status_code=503, content={"error": "Trop de publications en attente, réessayez plus tard."})
+
+    path = await run_in_threadpool(spool_upload, video)
+    job = PublishJob(owner=open_id, token_key=request.session['token_key'], path=path,
+                     filename=video.filename or "video.mp4", content_type=video.content_type or "video/mp4",
+                     size=video_size)
+    try:
+        publish_workers.submit(job)
+    except QueueFull as e:
+        os.remove(path)
+        return JSONResponse(status_code=503, content={"error": str(e)})
+
+    return JSONResponse(status_code=202, content={
+        "message": "Publication en cours: la vidéo sera envoyée à TikTok en arrière-plan.",
+        "job_id": job.id,
+        # Chemin absolu, préfixe de montage compris (passerelle)
+        "status_url": f"{request.scope.get('root_path', '')}/api/publish/{job.id}",
+    })
+
+@app.get("/api/publish/{job_id}", tags=["API"])
+async def publish_status(request: Request, job_id: str):
+    """État d'une publication: file, upload (progression), traitement TikTok, publiée ou en échec."""
+    job = publish_workers.get(job_id)
+    # Une tâche n'est visible que par l'utilisateur qui l'a créée
+    if job is None or job.owner != request.session.get('open_id'):
+        raise HTTPException(status_code=404, detail="Publication introuvable.")
+    return JSONResponse(content=job.to_dict())
 
 # --- Pages statiques & Montage ---
+# Servies directement (pas de redirection vers le fichier .html: un aller-retour de moins)
 @app.get("/terms")
 def show_terms(request: Request):
-    return RedirectResponse(url="/terms.html")
+    return static_files.response(request.headers, "terms.html", request.method)
 
 @app.get("/policy")
 def show_policy(request: Request):
-    return RedirectResponse(url="/policy.html")
+    return static_files.response(request.headers, "policy.html", request.method)
 
-app.mount("/", StaticFiles(directory="static", html=True), name="static")
\ No newline at end of file
+app.mount("/", static_files, name="static")
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""
+Réponses de l'API TikTok réduites aux champs utilisés, décodées par `common.serialization`.
+
+Les réponses TikTok ont toutes la même enveloppe: `data` et `error`
+(`error.code` vaut "ok" en cas de succès). `unwrap` décode l'enveloppe et lève
+TikTokAPIError sinon.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import httpx
+
+from common.serialization import from_dict, read_json
+
+
+class TikTokAPIError(Exception):
+    """Réponse HTTP valide mais `error.code` différent de "ok"."""
+
+    def __init__(self, payload: dict):
+        super().__init__((payload.get("error") or {}).get("message") or "Erreur API TikTok")
+        self.payload = payload
+
+
+def unwrap(response: httpx.Response) -> dict:
+    """`data` d'une réponse TikTok (après `raise_for_status`); lève TikTokAPIError si `error.code` != "ok"."""
+    payload = read_json(response)
+    if not isinstance(payload, dict) or (payload.get("error") or {}).get("code") != "ok":
+        raise TikTokAPIError(payload if isinstance(payload, dict) else {"error": {"message": str(payload)}})
+    return payload.get("data") or {}
+
+
+@dataclass(slots=True)
+class TikTokUser:
+    open_id: Optional[str] = None
+    avatar_url: Optional[str] = None
+    display_name: Optional[str] = None
+    username: Optional[str] = None
+
+
+@dataclass(slots=True)
+class TikTokVideo:
+    # Champs de VIDEO_FIELDS (tiktok/main.py)
+    id: Optional[str] = None
+    title: Optional[str] = None
+    cover_image_url: Optional[str] = None
+    share_url: Optional[str] = None
+
+
+@dataclass(slots=True)
+class VideoPage:
+    """Une page de `/v2/video/list/`."""
+    videos: List[TikTokVideo] = field(default_factory=list)
+    cursor: Optional[int] = None
+    has_more: bool = False
+
+    @classmethod
+    def from_data(cls, data: dict) -> "VideoPage":
+        return cls([from_dict(TikTokVideo, video) for video in data.get("videos") or []],
+                   data.get("cursor"), bool(data.get("has_more")))
+
+
+@dataclass(slots=True)
+class PublishInit:
+    """Réponse de `/v2/post/publish/video/init/`."""
+    publish_id: Optional[str] = None
+    upload_url: Optional[str] = None
+
+
+@dataclass(slots=True)
+class PublishStatus:
+    """Réponse de `/v2/post/publish/status/fetch/`."""
+    status: Optional[str] = None
+    fail_reason: Optional[str] = None
@@ -0,0 +1,167 @@
+"""
+Tâches de publication TikTok exécutées en arrière-plan.
+
+`POST /api/publish` copie la vidéo reçue dans un fichier temporaire, crée une
+tâche et répond aussitôt (202) avec son identifiant. Un pool de workers
+(TIKTOK_PUBLISH_WORKERS) exécute les tâches une par une: le nombre d'uploads
+simultanés vers TikTok est borné, et une file pleine (TIKTOK_PUBLISH_QUEUE_SIZE)
+refuse les nouvelles publications au lieu de les laisser s'accumuler.
+
+Le suivi du traitement côté TikTok (après l'upload) tourne dans des tâches
+séparées, qui n'occupent pas de place dans le pool.
+
+Les tâches sont gardées en mémoire par le processus qui les a reçues: avec
+plusieurs workers uvicorn, le suivi d'une publication demande une affinité de
+session.
+"""
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+PUBLISH_WORKERS = int(os.getenv("TIKTOK_PUBLISH_WORKERS", 2))
+PUBLISH_QUEUE_SIZE = int(os.getenv("TIKTOK_PUBLISH_QUEUE_SIZE", 50))
+# Durée de conservation des tâches terminées (secondes)
+FINISHED_JOB_TTL = 3600
+
+# --- États d'une tâche ---
+QUEUED = "queued"
+UPLOADING = "uploading"
+PROCESSING = "processing"  # upload terminé, TikTok traite la vidéo
+PUBLISHED = "published"
+FAILED = "failed"
+FINISHED_STATES = {PUBLISHED, FAILED}
+
+
+class QueueFull(Exception):
+    """File des publications pleine: la publication n'est pas acceptée."""
+
+
+@dataclass
+class PublishJob:
+    owner: str  # open_id de l'utilisateur
+    token_key: str
+    path: str  # fichier temporaire de la vidéo, supprimé après l'upload
+    filename: str
+    content_type: str
+    size: int
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    uploaded: int = 0
+    publish_id: Optional[str] = None
+    tiktok_status: Optional[str] = None
+    error: Any = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def update(self, **changes):
+        for name, value in changes.items():
+            setattr(self, name, value)
+        self.updated_at = time.time()
+
+    def fail(self, error: Any):
+        self.update(status=FAILED, error=error)
+
+    def to_dict(self) -> dict:
+        """État exposé par `GET /api/publish/{job_id}`."""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": round(self.uploaded / self.size, 3) if self.size else 0,
+            "uploaded_bytes": self.uploaded,
+            "size": self.size,
+            "publish_id": self.publish_id,
+            "tiktok_status": self.tiktok_status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class PublishWorkers:
+    """File et pool de workers des publications, démarrés par le lifespan de l'application."""
+
+    def __init__(self, run: Callable[[PublishJob], Awaitable[None]], workers: int = PUBLISH_WORKERS,
+                 queue_size: int = PUBLISH_QUEUE_SIZE):
+        self.run = run
+        self.workers = workers
+        self.queue_size = queue_size
+        self.jobs: Dict[str, PublishJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def full(self) -> bool:
+        return self._queue is None or self._queue.full()
+
+    def get(self, job_id: str) -> Optional[PublishJob]:
+        return self.jobs.get(job_id)
+
+    def submit(self, job: PublishJob):
+        """Met la tâche en file; lève QueueFull si la file est pleine (ou le pool arrêté)."""
+        if self._queue is None:
+            raise QueueFull("Le pool de publication n'est pas démarré.")
+        self._prune()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull("Trop de publications en attente, réessayez plus tard.") from None
+        self.jobs[job.id] = job
+
+    def spawn(self, coroutine: Awaitable[None]):
+        """Lance une tâche de fond (suivi de statut) annulée à l'arrêt de l'application."""
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _prune(self):
+        limit = time.time() - FINISHED_JOB_TTL
+        for job_id, job in list(self.jobs.items()):
+            if job.finished and job.updated_at < limit:
+                del self.jobs[job_id]
+
+    async def _worker(self):
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            try:
+                await self.run(job)
+            except asyncio.CancelledError:
+                job.fail("Application arrêtée pendant la publication.")
+                raise
+            except Exception as e:
+                print(f"Publication {job.id} en échec : {e}")
+                job.fail(str(e))
+            finally:
+                try:
+                    os.remove(job.path)
+                except OSError:
+                    pass
+                queue.task_done()
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        for _ in range(self.workers):
+            self.spawn(self._worker())
+        try:
+            yield
+        finally:
+            queue, self._queue = self._queue, None
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            # Tâches jamais commencées: leurs fichiers temporaires sont supprimés
+            while not queue.empty():
+                job = queue.get_nowait()
+                job.fail("Application arrêtée avant la publication.")
+                try:
+                    os.remove(job.path)
+                except OSError:
+                    pass
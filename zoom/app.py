@@ -1,97 +1,172 @@
-import requests
+"""
+Accès à l'API Zoom avec une application Server-to-Server OAuth.
+
+Le jeton `account_credentials` est mis en cache dans le processus et réutilisé
+jusqu'à peu avant son expiration (`expires_in`, 1 h chez Zoom). Le
+renouvellement est unique: 100 appelants simultanés, threads ou coroutines,
+ne déclenchent qu'une seule demande de jeton.
+
+Utilisation en ligne de commande (depuis la racine du dépôt):
+    python -m zoom.app
+
+Depuis un service: `account_token.get()` (synchrone) ou
+`await account_token.aget()` (asynchrone) renvoient un jeton valide.
+"""
+import asyncio
 import base64
 import json
 import os
+import threading
+import time
+from typing import Optional
 
+import httpx
 
+from common import http_client
 
 ACCOUNT_ID = os.getenv("ZOOM_ACCOUNT_ID")
 CLIENT_ID = os.getenv("ZOOM_CLIENT_ID")
 CLIENT_SECRET = os.getenv("ZOOM_CLIENT_SECRET")
 
+TOKEN_URL = "https://zoom.us/oauth/token"
+API_URL = "https://api.zoom.us/v2"
+# Le jeton est renouvelé un peu avant son expiration réelle
+TOKEN_REFRESH_MARGIN = 5 * 60
 
-def get_access_token():
-    """
-    Obtient un jeton d'accès (access token) de l'API Zoom.
-    """
-    print("Demande du jeton d'accès...")
-    
-    token_url = "https://zoom.us/oauth/token"
-    
-    auth_string = f"{CLIENT_ID}:{CLIENT_SECRET}"
-    auth_bytes = auth_string.encode('utf-8')
-    encoded_auth = base64.b64encode(auth_bytes).decode('utf-8')
-    
-    headers = {
-        'Authorization': f'Basic {encoded_auth}',
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    
-    # Le dictionnaire de données reste le même
-    payload = {
-        'grant_type': 'account_credentials',
-        'account_id': ACCOUNT_ID
-    }
-    
-    try:
-        # --- LA CORRECTION EST ICI ---
-        # On utilise 'data=payload' au lieu de 'params=payload'
-        # pour que les données soient dans le corps de la requête POST.
-        response = requests.post(token_url, headers=headers, data=payload)
-        
+
+class AccountToken:
+    """Jeton Server-to-Server d'un compte Zoom, partagé par tout le processus."""
+
+    def __init__(self, account_id: Optional[str], client_id: Optional[str], client_secret: Optional[str],
+                 token_url: str = TOKEN_URL, margin: float = TOKEN_REFRESH_MARGIN):
+        self.account_id = account_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.margin = margin
+        self._access_token: Optional[str] = None
+        self._expires_at = 0.0
+        # Verrou des appelants synchrones; les coroutines ont le leur (un par boucle d'événements)
+        self._lock = threading.Lock()
+        self._async_lock: Optional[asyncio.Lock] = None
+        self._async_lock_loop = None
+
+    # --- Cache ---
+
+    def _cached(self, rejected: Optional[str] = None) -> Optional[str]:
+        access_token = self._access_token
+        if access_token and access_token != rejected and time.time() < self._expires_at - self.margin:
+            return access_token
+        return None
+
+    def _store(self, response: httpx.Response) -> str:
         response.raise_for_status()
-        
         response_data = response.json()
         access_token = response_data.get('access_token')
-        
         if not access_token:
-            print("Erreur : Impossible de récupérer le jeton d'accès.")
-            print("Réponse de l'API :", response_data)
-            return None
-            
-        print("Jeton d'accès obtenu avec succès !")
+            raise ValueError(f"Jeton d'accès absent de la réponse de Zoom : {response_data}")
+        self._expires_at = time.time() + float(response_data.get('expires_in', 3600))
+        self._access_token = access_token
         return access_token
-        
-    except requests.exceptions.RequestException as e:
+
+    # --- Demande du jeton ---
+
+    def _request_kwargs(self) -> dict:
+        encoded_auth = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode('utf-8')).decode('utf-8')
+        return {
+            'headers': {'Authorization': f'Basic {encoded_auth}'},
+            # Les paramètres vont dans le corps de la requête POST
+            'data': {'grant_type': 'account_credentials', 'account_id': self.account_id},
+        }
+
+    def get(self, rejected: Optional[str] = None) -> str:
+        """
+        Renvoie un jeton valide; seul le premier thread qui le trouve expiré en redemande un.
+        `rejected`: jeton refusé par l'API (401), renouvelé même s'il n'a pas encore expiré.
+        """
+        access_token = self._cached(rejected)
+        if access_token:
+            return access_token
+        with self._lock:
+            # Un autre thread a pu renouveler le jeton pendant l'attente du verrou
+            access_token = self._cached(rejected)
+            if access_token:
+                return access_token
+            print("Demande du jeton d'accès...")
+            client = http_client.get_sync_client(self.token_url)
+            return self._store(client.post(self.token_url, **self._request_kwargs()))
+
+    def _get_async_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._async_lock is None or self._async_lock_loop is not loop:
+            self._async_lock = asyncio.Lock()
+            self._async_lock_loop = loop
+        return self._async_lock
+
+    async def aget(self, rejected: Optional[str] = None) -> str:
+        """Équivalent asynchrone de `get`, pour les services FastAPI."""
+        access_token = self._cached(rejected)
+        if access_token:
+            return access_token
+        async with self._get_async_lock():
+            access_token = self._cached(rejected)
+            if access_token:
+                return access_token
+            print("Demande du jeton d'accès...")
+            return self._store(await http_client.post(self.token_url, **self._request_kwargs()))
+
+
+# Instance partagée par tout le processus
+account_token = AccountToken(ACCOUNT_ID, CLIENT_ID, CLIENT_SECRET)
+
+
+def get_access_token():
+    """
+    Obtient un jeton d'accès (access token) de l'API Zoom, depuis le cache si possible.
+    """
+    try:
+        return account_token.get()
+    except (httpx.HTTPError, ValueError) as e:
         print(f"Erreur lors de la requête pour le jeton d'accès : {e}")
-        if e.response:
+        if isinstance(e, httpx.HTTPStatusError):
             print("Détails de l'erreur :", e.response.text)
         return None
-    
+
 
 def get_my_user_info(token):
     """
     Utilise le jeton d'accès pour récupérer les informations de l'utilisateur "me".
     """
     print("\nRécupération des informations de l'utilisateur...")
-    
-    api_url = "https://api.zoom.us/v2/users/me"
-    
-    headers = {
-        'Authorization': f'Bearer {token}'
-    }
-    
+
+    api_url = f"{API_URL}/users/me"
+    client = http_client.get_sync_client(api_url)
+
     try:
-        response = requests.get(api_url, headers=headers)
+        response = client.get(api_url, headers={'Authorization': f'Bearer {token}'})
+        if response.status_code == 401:
+            # Jeton révoqué avant son expiration: on en redemande un une seule fois
+            token = account_token.get(rejected=token)
+            response = client.get(api_url, headers={'Authorization': f'Bearer {token}'})
         response.raise_for_status()
-        
+
         user_info = response.json()
         print("--- Authentification réussie ! ---")
         print("Voici les informations de votre profil utilisateur récupérées via l'API :\n")
         # Affiche le JSON de manière lisible
         print(json.dumps(user_info, indent=2))
-        
-    except requests.exceptions.RequestException as e:
+
+    except (httpx.HTTPError, ValueError) as e:
         print(f"Erreur lors de l'appel à l'API : {e}")
-        if e.response:
+        if isinstance(e, httpx.HTTPStatusError):
             print("Détails de l'erreur :", e.response.text)
 
 
 # --- Exécution du script ---
 if __name__ == "__main__":
-    if "VOTRE" in ACCOUNT_ID or "VOTRE" in CLIENT_ID or "VOTRE" in CLIENT_SECRET:
-        print("ERREUR : Veuillez remplacer les valeurs 'VOTRE_...' par vos propres identifiants dans le script.")
+    if not all([ACCOUNT_ID, CLIENT_ID, CLIENT_SECRET]) or "VOTRE" in ACCOUNT_ID + CLIENT_ID + CLIENT_SECRET:
+        print("ERREUR : Veuillez définir ZOOM_ACCOUNT_ID, ZOOM_CLIENT_ID et ZOOM_CLIENT_SECRET avec vos propres identifiants.")
     else:
         access_token = get_access_token()
         if access_token:
-            get_my_user_info(access_token)
\ No newline at end of file
+            get_my_user_info(access_token)